@@ -4,13 +4,15 @@ import os
 import textwrap
 
 from newsrag_core import summarize as summarize_phase1
+from newsrag_retrieval import storage
 from newsrag_retrieval.ingest import ingest_urls
 from newsrag_retrieval.vector_faiss import FaissStore
-from newsrag_retrieval.embeddings import embedding_dim
+from newsrag_retrieval.embeddings import EMBED_DIMENSIONS, EMBED_MODEL, embedding_dim
+from newsrag_retrieval.quantize import VECTOR_DTYPE
 from newsrag_retrieval.retrieve import retrieve as retrieve_vector
 from newsrag_retrieval.hybrid import hybrid_retrieve as retrieve_hybrid  # comment this line if you didn't add hybrid.py
 from newsrag_retrieval.verify import verify_claims
-from newsrag_retrieval.synthesizeesize import synthesize as grounded_summarize
+from newsrag_retrieval.synthesize import synthesize as grounded_summarize
 
 
 def format_context(hits):
@@ -52,14 +54,16 @@ def main():
     if not args.reuse and not args.seed_url:
         p.error("Provide at least one --seed-url, or use --reuse with an existing --db-dir")
 
-    dim = embedding_dim()
+    # --db-dir is one corpus in the storage layout: <root>/<corpus>/manifest.json + segments
+    storage.RAGDB_ROOT, corpus_id = os.path.split(os.path.abspath(args.db_dir))
 
     # Load or (re)build store
     store = None
     if args.reuse and os.path.exists(args.db_dir):
         print("[+] Loading vector store from disk…")
         try:
-            store = FaissStore.load(args.db_dir, dim)
+            vecs, metas, manifest = storage.load_fs(corpus_id)
+            store = FaissStore.from_numpy(vecs, metas, int(manifest["dim"]))
         except FileNotFoundError:
             print("[warn] No saved index at", args.db_dir)
 
@@ -68,14 +72,17 @@ def main():
             raise SystemExit("No seed URLs provided and no saved index to reuse.")
         print("[+] Ingesting URLs…")
         vecs, metas, _ = ingest_urls(args.seed_url)
-        if not vecs:
+        if not metas:
             raise SystemExit("No docs ingested. Check your URLs or fetcher.")
         print("[+] Building vector store…")
+        dim = embedding_dim()  # model registry: no API call
         store = FaissStore(dim)
         store.add(vecs, metas)
         if args.persist:
             print(f"[+] Saving vector store to {args.db_dir}…")
-            store.save(args.db_dir)
+            storage.save_fs(corpus_id, *store.to_numpy(),
+                            {"embed_model": EMBED_MODEL, "dim": dim, "embed_dimensions": EMBED_DIMENSIONS,
+                             "vector_dtype": VECTOR_DTYPE})
 
     # Retrieval
     print(f"[+] Retrieving with: {args.retriever}")
@@ -0,0 +1,74 @@
+# benchmarks/bench_ann_recall.py
+"""
+Recall@k and query latency of the ANN index types against the exact (flat) baseline.
+
+    # synthetic unit vectors
+    python benchmarks/bench_ann_recall.py --rows 200000 --dim 384
+    # an existing corpus (uses STORAGE_BACKEND / RAGDB_ROOT like the workers)
+    python benchmarks/bench_ann_recall.py --corpus news-live
+
+Queries are corpus rows plus a little noise, so the exact top-1 is usually the row itself.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from newsrag_retrieval import storage
+from newsrag_retrieval.ann import recall_at_k
+from newsrag_retrieval.vector_faiss import FaissStore
+
+SWEEPS = [
+    ({"type": "ivf_flat", "min_rows": 0}, "nprobe", [1, 4, 16, 64]),
+    ({"type": "ivf_pq", "min_rows": 0}, "nprobe", [4, 16, 64]),
+    ({"type": "hnsw"}, "ef_search", [16, 64, 256]),
+]
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)).astype("float32")
+
+
+def main():
+    p = argparse.ArgumentParser(description="ANN recall@k vs flat baseline")
+    p.add_argument("--corpus", help="Corpus id to benchmark (default: synthetic data)")
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--dim", type=int, default=256)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=10)
+    args = p.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.corpus:
+        vecs, _, _ = storage.load(args.corpus)
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+    else:
+        vecs = _unit(rng.standard_normal((args.rows, args.dim)).astype("float32"))
+    n, dim = vecs.shape
+    queries = _unit(vecs[rng.integers(0, n, args.queries)] + 0.05 * rng.standard_normal((args.queries, dim)))
+    metas = [{}] * n
+
+    flat = FaissStore.from_numpy(vecs, metas, dim)
+    t0 = time.perf_counter()
+    _, exact = flat.search(queries, args.k)
+    flat_ms = (time.perf_counter() - t0) * 1000 / args.queries
+    print(f"[+] {n:,} vectors x {dim}, {args.queries} queries, k={args.k}")
+    print(f"{'index':<10} {'param':<14} {'build s':>8} {'recall@k':>9} {'ms/query':>9}")
+    print(f"{'flat':<10} {'-':<14} {0.0:>8.2f} {1.0:>9.3f} {flat_ms:>9.3f}")
+
+    for spec, knob, values in SWEEPS:
+        t0 = time.perf_counter()
+        store = FaissStore.from_numpy(vecs, metas, dim, index_spec=spec)
+        build_s = time.perf_counter() - t0
+        if store.index is None:
+            print(f"{spec['type']:<10} skipped (too few rows to train)")
+            continue
+        for v in values:
+            t0 = time.perf_counter()
+            _, approx = store.search(queries, args.k, **{knob: v})
+            ms = (time.perf_counter() - t0) * 1000 / args.queries
+            print(f"{spec['type']:<10} {f'{knob}={v}':<14} {build_s:>8.2f} {recall_at_k(approx, exact):>9.3f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
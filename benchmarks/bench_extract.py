@@ -0,0 +1,79 @@
+# benchmarks/bench_extract.py
+"""
+Throughput and extraction quality of the HTML extractors over saved pages.
+
+    python benchmarks/bench_extract.py
+    python benchmarks/bench_extract.py --dir /path/to/saved/pages --repeat 20
+
+Every *.html file in --dir is a fixture; a sibling *.txt holds the hand-checked article
+text. Quality is bag-of-words precision / recall / F1 against that text (precision drops
+when nav, footers and related links leak in), or against the bs4 output when there is no
+.txt. --inflate N repeats each page's body N times to approximate large, heavy pages
+(throughput only: the gold texts are not inflated, so quality numbers are off).
+"""
+import argparse
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+from newsrag_core.extract import EXTRACTORS, extract_text
+
+FIXTURES = Path(__file__).parent / "fixtures" / "html"
+
+
+def _words(text: str) -> Counter:
+    return Counter(re.findall(r"\w+", text.lower()))
+
+
+def prf(got: str, gold: str):
+    g, t = _words(got), _words(gold)
+    overlap = sum((g & t).values())
+    p = overlap / max(sum(g.values()), 1)
+    r = overlap / max(sum(t.values()), 1)
+    return p, r, (2 * p * r / (p + r)) if p + r else 0.0
+
+
+def _inflate(html: str, n: int) -> str:
+    if n <= 1:
+        return html
+    m = re.search(r"<body[^>]*>(.*)</body>", html, re.S | re.I)
+    return html if m is None else html.replace(m.group(1), m.group(1) * n, 1)
+
+
+def main():
+    p = argparse.ArgumentParser(description="HTML extractor throughput and quality")
+    p.add_argument("--dir", type=Path, default=FIXTURES)
+    p.add_argument("--engines", nargs="+", default=["bs4", "lxml", "readability"], choices=sorted(EXTRACTORS))
+    p.add_argument("--repeat", type=int, default=50)
+    p.add_argument("--inflate", type=int, default=1)
+    args = p.parse_args()
+
+    pages = []
+    for path in sorted(args.dir.glob("*.html")):
+        gold = path.with_suffix(".txt")
+        html = _inflate(path.read_text(encoding="utf-8", errors="replace"), args.inflate)
+        pages.append((path.stem, html, gold.read_text(encoding="utf-8") if gold.exists() else None))
+    if not pages:
+        raise SystemExit(f"no *.html fixtures in {args.dir}")
+    mb = sum(len(h) for _, h, _ in pages) / 1e6
+    print(f"[+] {len(pages)} pages, {mb:.2f} MB, x{args.repeat}")
+    print(f"{'engine':<12} {'pages/s':>9} {'MB/s':>7} {'speedup':>8} {'prec':>6} {'recall':>7} {'f1':>6}")
+
+    base_rate = None
+    for engine in args.engines:
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            outs = [extract_text(h, engine=engine, max_chars=0) for _, h, _ in pages]
+        dt = time.perf_counter() - t0
+        rate = len(pages) * args.repeat / dt
+        base_rate = base_rate or rate
+        scores = [prf(out, gold if gold is not None else extract_text(h, engine="bs4", max_chars=0))
+                  for out, (_, h, gold) in zip(outs, pages)]
+        pr, rc, f1 = (sum(s[i] for s in scores) / len(scores) for i in range(3))
+        print(f"{engine:<12} {rate:>9.1f} {mb * args.repeat / dt:>7.2f} {rate / base_rate:>7.1f}x "
+              f"{pr:>6.3f} {rc:>7.3f} {f1:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_quantize.py
+"""
+Vector memory saved vs recall lost for truncated dimensions and float16 / int8 storage.
+
+    # synthetic embedding-like vectors (variance decaying along the dimensions, like
+    # Matryoshka-trained text-embedding-3 output)
+    python benchmarks/bench_quantize.py --rows 100000 --dim 1536
+    # an existing full-width corpus (uses STORAGE_BACKEND / RAGDB_ROOT like the workers)
+    python benchmarks/bench_quantize.py --corpus news-live
+
+Truncation keeps the leading dimensions and re-normalizes, as the API's `dimensions` does.
+Recall@k is measured against exact float32 search at full width; queries are corpus rows
+plus a little noise. Bytes are the resident vector storage (codes for float16 / int8).
+"""
+import argparse
+import time
+
+import numpy as np
+
+from newsrag_retrieval import quantize, storage
+from newsrag_retrieval.ann import recall_at_k
+from newsrag_retrieval.vector_faiss import FaissStore
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)).astype("float32")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Memory vs recall of truncated / quantized vectors")
+    p.add_argument("--corpus", help="Corpus id to benchmark (default: synthetic data)")
+    p.add_argument("--rows", type=int, default=50_000)
+    p.add_argument("--dim", type=int, default=1536)
+    p.add_argument("--dims", default="1536,1024,512,256", help="Truncated widths to try")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=10)
+    args = p.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.corpus:
+        vecs, _, _ = storage.load(args.corpus)
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+    else:
+        decay = (1.0 + np.arange(args.dim, dtype="float32")) ** -0.5
+        vecs = _unit(rng.standard_normal((args.rows, args.dim)).astype("float32") * decay)
+    n, dim = vecs.shape
+    queries = _unit(vecs[rng.integers(0, n, args.queries)] + 0.02 * rng.standard_normal((args.queries, dim)))
+    metas = [{}] * n
+
+    t0 = time.perf_counter()
+    _, exact = FaissStore.from_numpy(vecs, metas, dim).search(queries, args.k)
+    base_ms = (time.perf_counter() - t0) * 1000 / args.queries
+    base_bytes = vecs.nbytes
+    print(f"[+] {n:,} vectors x {dim}, {args.queries} queries, k={args.k}")
+    print(f"{'dims':>5} {'dtype':<8} {'MB':>9} {'saved':>7} {'recall@k':>9} {'ms/query':>9}")
+    print(f"{dim:>5} {'float32':<8} {base_bytes / 2**20:>9.1f} {0.0:>6.1%} {1.0:>9.3f} {base_ms:>9.3f}")
+
+    for d in sorted({int(x) for x in args.dims.split(",") if 0 < int(x) <= dim}, reverse=True):
+        tv, tq = _unit(vecs[:, :d]), _unit(queries[:, :d])
+        for dtype in quantize.VECTOR_DTYPES:
+            if d == dim and dtype == "float32":
+                continue
+            stored, scale = quantize.encode(tv, dtype)
+            store = FaissStore(d)
+            store.attach(stored, metas, scale=scale)
+            t0 = time.perf_counter()
+            _, approx = store.search(tq, args.k)
+            ms = (time.perf_counter() - t0) * 1000 / args.queries
+            print(f"{d:>5} {dtype:<8} {stored.nbytes / 2**20:>9.1f} {1 - stored.nbytes / base_bytes:>6.1%} "
+                  f"{recall_at_k(approx, exact):>9.3f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_vector_buffer.py
+"""
+Append N vectors in fixed-size batches: VectorBuffer (capacity doubling) vs. the old
+np.vstack-per-add mirror. The vstack baseline is O(N^2) in copies, so it is capped
+with --baseline-rows by default.
+
+    python benchmarks/bench_vector_buffer.py --rows 1000000 --batch 1000 --dim 128
+"""
+import argparse
+import time
+
+import numpy as np
+
+from newsrag_retrieval.vector_faiss import VectorBuffer
+
+
+def bench_buffer(rows: int, batch: int, dim: int, block: np.ndarray) -> float:
+    buf = VectorBuffer(dim)
+    t0 = time.perf_counter()
+    for _ in range(rows // batch):
+        buf.append(block)
+    dt = time.perf_counter() - t0
+    assert len(buf) == (rows // batch) * batch
+    return dt
+
+
+def bench_vstack(rows: int, batch: int, block: np.ndarray) -> float:
+    matrix = None
+    t0 = time.perf_counter()
+    for _ in range(rows // batch):
+        matrix = block.copy() if matrix is None else np.vstack((matrix, block))
+    return time.perf_counter() - t0
+
+
+def main():
+    p = argparse.ArgumentParser(description="VectorBuffer append microbenchmark")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--batch", type=int, default=1_000)
+    p.add_argument("--dim", type=int, default=128)
+    p.add_argument("--baseline-rows", type=int, default=100_000,
+                   help="Rows for the np.vstack baseline (0 to skip)")
+    args = p.parse_args()
+
+    block = np.random.default_rng(0).random((args.batch, args.dim), dtype="float32")
+
+    dt = bench_buffer(args.rows, args.batch, args.dim, block)
+    print(f"[+] VectorBuffer: {args.rows:,} rows x {args.dim} in {args.batch}-row batches: "
+          f"{dt:.3f}s ({args.rows / dt:,.0f} rows/s)")
+
+    if args.baseline_rows:
+        dt = bench_vstack(args.baseline_rows, args.batch, block)
+        print(f"[+] np.vstack:    {args.baseline_rows:,} rows x {args.dim} in {args.batch}-row batches: "
+              f"{dt:.3f}s ({args.baseline_rows / dt:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
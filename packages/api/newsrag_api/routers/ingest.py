@@ -6,5 +6,6 @@ router = APIRouter(prefix="/ingest", tags=["ingest"])
 
 @router.post("", response_model=JobSubmissionResponse)
 def ingest(req: IngestRequest):
-    job = ingest_urls_task.delay(req.corpus_id, req.urls)
+    options = {k: v for k, v in (("dimensions", req.dimensions), ("vector_dtype", req.vector_dtype)) if v is not None}
+    job = ingest_urls_task.delay(req.corpus_id, req.urls, options or None)
     return JobSubmissionResponse(job_id=job.id)
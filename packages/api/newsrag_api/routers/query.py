@@ -1,12 +1,25 @@
 from fastapi import APIRouter
-from newsrag_api.schemas import QueryRequest, JobSubmissionResponse
-from newsrag_tasks.tasks import answer_question_task
+from newsrag_api.schemas import QueryRequest, BatchQueryRequest, JobSubmissionResponse, QueryResponse
+from newsrag_tasks import answer_cache
+from newsrag_tasks.tasks import answer_question_task, answer_questions_task
 
 router = APIRouter(prefix="/query", tags=["query"])
 
-@router.post("", response_model=JobSubmissionResponse)
+@router.post("", response_model=QueryResponse)
 def query(req: QueryRequest):
+    """Answers already cached for the corpus' current version are returned inline; otherwise a job is enqueued."""
+    cached = answer_cache.lookup(req.corpus_id, req.question, req.retriever, req.k, req.max_per_url, req.alpha)
+    if cached is not None:
+        return QueryResponse(cached=True, result=cached)
     job = answer_question_task.delay(
         req.corpus_id, req.question, req.retriever, req.k, req.max_per_url, req.alpha
     )
+    return QueryResponse(job_id=job.id)
+
+@router.post("/batch", response_model=JobSubmissionResponse)
+def query_batch(req: BatchQueryRequest):
+    """One job for many questions: shared corpus load, one embeddings call, one batched search."""
+    job = answer_questions_task.delay(
+        req.corpus_id, req.questions, req.retriever, req.k, req.max_per_url, req.alpha
+    )
     return JobSubmissionResponse(job_id=job.id)
@@ -4,6 +4,9 @@ from pydantic import BaseModel, Field
 class IngestRequest(BaseModel):
     corpus_id: str = Field(min_length=1)
     urls: List[str] = Field(min_items=1)
+    # Only used when this request creates the corpus
+    dimensions: Optional[int] = Field(default=None, gt=0)  # truncated embedding width (text-embedding-3)
+    vector_dtype: Optional[Literal["float32", "float16", "int8"]] = None
 
 class IngestResponse(BaseModel):
     corpus_id: str
@@ -17,6 +20,14 @@ class QueryRequest(BaseModel):
     max_per_url: int = 2
     alpha: float = 0.6  # hybrid mixing weight
 
+class BatchQueryRequest(BaseModel):
+    corpus_id: str
+    questions: List[str] = Field(min_items=1, max_items=256)
+    retriever: Literal["hybrid", "vector"] = "hybrid"
+    k: int = 6
+    max_per_url: int = 2
+    alpha: float = 0.6  # hybrid mixing weight
+
 class SourceItem(BaseModel):
     id: int
     url: str
@@ -32,6 +43,11 @@ class AnswerResponse(BaseModel):
 class JobSubmissionResponse(BaseModel):
     job_id: str
 
+class QueryResponse(BaseModel):
+    job_id: Optional[str] = None   # set when the answer is being computed: poll /jobs/{job_id}
+    cached: bool = False
+    result: Optional[Any] = None   # the answer, when it was already cached for this corpus version
+
 class JobStatusResponse(BaseModel):
     job_id: str
     state: Literal["PENDING","STARTED","PROGRESS","SUCCESS","FAILURE","RETRY","REVOKED"]
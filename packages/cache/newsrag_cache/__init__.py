@@ -4,21 +4,55 @@ from __future__ import annotations
 # Primary cache client API
 from .client import (
     get_redis,
+    get_redis_bytes,
+    redis_status,
     get_json,
     set_json,
     cache_json,
     mget_json,
     mset_json,
+    mget_raw,
+    mset_raw,
+    mget_vectors,
+    mset_vectors,
     sha1,
 )
+from .codec import encode_vector, decode_vector
+from .singleflight import single_flight, single_flight_many
+from .ratelimit import RateBudget
+from .local import (
+    LocalCache,
+    l1_stats,
+    tiered_get_json,
+    tiered_set_json,
+    tiered_mget_vectors,
+    tiered_mset_vectors,
+)
 
 __all__ = [
     "get_redis",
+    "get_redis_bytes",
+    "redis_status",
     "get_json",
     "set_json",
     "cache_json",
     "mget_json",
     "mset_json",
+    "mget_raw",
+    "mset_raw",
+    "mget_vectors",
+    "mset_vectors",
+    "encode_vector",
+    "decode_vector",
+    "single_flight",
+    "single_flight_many",
+    "RateBudget",
+    "LocalCache",
+    "l1_stats",
+    "tiered_get_json",
+    "tiered_set_json",
+    "tiered_mget_vectors",
+    "tiered_mset_vectors",
     "sha1",
 ]
 
@@ -1,7 +1,9 @@
 # packages/cache/newsrag_cache/client.py
 from __future__ import annotations
-import os, json, hashlib
-from typing import Any, Dict, Iterable, List, Optional
+import os, json, hashlib, threading, time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from .codec import decode_vector, encode_vector
 
 try:
     import redis  # type: ignore
@@ -9,47 +11,182 @@ except Exception:  # pragma: no cover
     redis = None  # type: ignore
 
 
-def get_redis() -> Optional["redis.Redis"]:
+# Keys per MGET / pipelined SETEX round trip
+PIPELINE_CHUNK = int(os.getenv("CACHE_PIPELINE_CHUNK", "500"))
+# Pooled connections are checked with PING only when idle longer than this, not per call
+HEALTH_CHECK_SEC = int(os.getenv("REDIS_HEALTH_CHECK_SEC", "30"))
+MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Circuit breaker: after this many consecutive connection failures, treat Redis as absent
+# for BREAKER_COOLDOWN_SEC, then let one call through to probe it again.
+BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SEC = float(os.getenv("REDIS_BREAKER_COOLDOWN_SEC", "30"))
+
+
+class CircuitBreaker:
     """
-    Return a connected Redis client or None if:
-      - REDIS_URL missing/empty/invalid
-      - redis package missing
-      - connectivity probe fails
+    closed -> (`failures` consecutive failures) -> open for `cooldown_sec` -> half-open: the
+    first thread to ask becomes the probe and may use Redis; everyone else is refused until
+    the probe records a success (closed) or a failure (open again). A probe that never
+    reports back is replaced after another cooldown.
     """
-    if redis is None:
-        return None
 
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_sec: float = BREAKER_COOLDOWN_SEC):
+        self.failures = failures
+        self.cooldown_sec = cooldown_sec
+        self._count = 0
+        self._tripped = False
+        self._open_until = 0.0
+        self._probe: Optional[int] = None  # thread id of the half-open probe
+        self._probe_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self._tripped:
+            return True
+        me, now = threading.get_ident(), time.monotonic()
+        with self._lock:
+            if not self._tripped:
+                return True
+            if now < self._open_until:
+                return False
+            if self._probe is None or now >= self._probe_until:
+                self._probe, self._probe_until = me, now + self.cooldown_sec
+            return self._probe == me
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._count = 0
+            self._tripped, self._probe = False, None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._count += 1
+            if self._tripped or self._count >= self.failures:  # a failed probe re-opens straight away
+                self._tripped, self._probe = True, None
+                self._open_until = time.monotonic() + self.cooldown_sec
+
+    @property
+    def is_open(self) -> bool:
+        """Refusing this thread (unlike allow(), never takes the probe)."""
+        if not self._tripped:
+            return False
+        with self._lock:
+            if not self._tripped:
+                return False
+            if time.monotonic() < self._open_until:
+                return True
+            return self._probe is not None and self._probe != threading.get_ident() \
+                and time.monotonic() < self._probe_until
+
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, bool], "redis.Redis"] = {}  # (url, decode_responses) -> pooled client
+_breaker = CircuitBreaker()
+
+
+def _reset_after_fork() -> None:
+    """Prefork children must not share the parent's sockets: drop pools, start clean."""
+    global _lock, _breaker
+    _lock = threading.Lock()
+    _clients.clear()
+    _breaker = CircuitBreaker()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _redis_url() -> str:
     url = (os.getenv("REDIS_URL") or "").strip()
-    if not url:
-        return None
     if not (url.startswith("redis://") or url.startswith("rediss://") or url.startswith("unix://")):
-        return None
+        return ""
+    return url
 
-    try:
-        r = redis.Redis.from_url(
-            url,
-            decode_responses=True,
-            socket_connect_timeout=0.25,
-            socket_timeout=0.5,
-        )
-        r.ping()
-        return r
-    except Exception:
+
+def _client(decode_responses: bool) -> Optional["redis.Redis"]:
+    if redis is None:
         return None
+    url = _redis_url()
+    if not url or not _breaker.allow():
+        return None
+    key = (url, decode_responses)
+    r = _clients.get(key)
+    if r is not None:
+        return r
+    with _lock:
+        r = _clients.get(key)
+        if r is None:
+            try:
+                pool = redis.ConnectionPool.from_url(
+                    url,
+                    decode_responses=decode_responses,
+                    socket_connect_timeout=0.25,
+                    socket_timeout=0.5,
+                    health_check_interval=HEALTH_CHECK_SEC,
+                    max_connections=MAX_CONNECTIONS,
+                )
+            except Exception:
+                return None
+            r = _clients[key] = redis.Redis(connection_pool=pool)
+        return r
+
+
+def _ok() -> None:
+    _breaker.record_success()
+
+
+def _failed(exc: BaseException) -> None:
+    """Count connection-level errors toward the breaker (not e.g. WRONGTYPE replies)."""
+    if redis is not None and isinstance(exc, (redis.ConnectionError, redis.TimeoutError)):
+        _breaker.record_failure()
+
+
+def get_redis() -> Optional["redis.Redis"]:
+    """
+    Process-wide pooled Redis client (str responses), or None if:
+      - REDIS_URL missing/empty/invalid
+      - redis package missing
+      - the circuit breaker is open (recent connection failures)
+    No network I/O happens here; connections are made lazily by the pool.
+    """
+    return _client(decode_responses=True)
+
+
+def get_redis_bytes() -> Optional["redis.Redis"]:
+    """Like get_redis(), but responses stay raw bytes (for binary values, see codec.py)."""
+    return _client(decode_responses=False)
+
+
+def redis_status() -> Dict[str, Any]:
+    return {"configured": bool(_redis_url()), "breaker_open": _breaker.is_open, "pools": len(_clients)}
+
+
+def _chunks(seq: List, n: int):
+    for i in range(0, len(seq), max(1, n)):
+        yield seq[i:i + n]
+
+
+def _pairs(mapping: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]]) -> List[Tuple[str, Any]]:
+    return list(mapping.items()) if isinstance(mapping, Mapping) else list(mapping)
 
 
 def get_json(r: Optional["redis.Redis"], key: str) -> Optional[Any]:
-    if r is None:
+    if r is None or _breaker.is_open:
         return None
     try:
         s = r.get(key)
+    except Exception as e:
+        _failed(e)
+        return None
+    _ok()
+    try:
         return json.loads(s) if s else None
     except Exception:
         return None
 
 
 def set_json(r: Optional["redis.Redis"], key: str, value: Any, ttl_sec: int = 0) -> None:
-    if r is None:
+    if r is None or _breaker.is_open:
         return
     try:
         payload = json.dumps(value)
@@ -57,8 +194,9 @@ def set_json(r: Optional["redis.Redis"], key: str, value: Any, ttl_sec: int = 0)
             r.setex(key, ttl_sec, payload)
         else:
             r.set(key, payload)
-    except Exception:
-        return
+        _ok()
+    except Exception as e:
+        _failed(e)
 
 
 # ---------- Back-compat helpers (used by feeds/pump etc.) ----------
@@ -72,23 +210,88 @@ def cache_json(r: Optional["redis.Redis"], key: str, compute_fn, ttl_sec: int =
     Read-through cache:
       - If cached present → return it
       - Else compute via compute_fn(), store JSON, return result
-    Works even if r is None (just calls compute_fn()).
+    Concurrent misses on the same key are coalesced (see singleflight.py): one caller
+    computes, the others (in this process or other workers) wait for its result.
+    Works even if r is None (just calls compute_fn(), coalesced within the process).
     """
+    from .singleflight import single_flight
+
     cached = get_json(r, key)
     if cached is not None:
         return cached
-    val = compute_fn()
-    try:
-        set_json(r, key, val, ttl_sec=ttl_sec)
-    except Exception:
-        pass
-    return val
+
+    def compute():
+        val = compute_fn()
+        try:
+            set_json(r, key, val, ttl_sec=ttl_sec)
+        except Exception:
+            pass
+        return val
+    return single_flight(key, compute, read=lambda: get_json(r, key), r=r)
+
+
+def mget_raw(r: Optional["redis.Redis"], keys: Iterable[str]) -> List[Optional[Any]]:
+    """Values for `keys` via MGET, PIPELINE_CHUNK keys per round trip; None for misses/errors."""
+    keys = list(keys)
+    if r is None or not keys:
+        return [None] * len(keys)
+    out: List[Optional[Any]] = []
+    for chunk in _chunks(keys, PIPELINE_CHUNK):
+        if _breaker.is_open:  # gave up mid-batch; don't pay a timeout per remaining chunk
+            out.extend([None] * len(chunk))
+            continue
+        try:
+            out.extend(r.mget(chunk))
+            _ok()
+        except Exception as e:
+            _failed(e)
+            out.extend([None] * len(chunk))
+    return out
+
+
+def mset_raw(r: Optional["redis.Redis"], mapping: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+             ttl_sec: int = 0) -> None:
+    """SET/SETEX many keys over a non-transactional pipeline, PIPELINE_CHUNK keys per round trip."""
+    if r is None:
+        return
+    for chunk in _chunks(_pairs(mapping), PIPELINE_CHUNK):
+        if _breaker.is_open:
+            return
+        try:
+            pipe = r.pipeline(transaction=False)
+            for k, v in chunk:
+                if ttl_sec > 0:
+                    pipe.setex(k, ttl_sec, v)
+                else:
+                    pipe.set(k, v)
+            pipe.execute()
+            _ok()
+        except Exception as e:
+            _failed(e)
+            return
 
 
 def mget_json(r: Optional["redis.Redis"], keys: Iterable[str]) -> List[Optional[Any]]:
-    return [get_json(r, k) for k in keys]
+    out: List[Optional[Any]] = []
+    for s in mget_raw(r, keys):
+        try:
+            out.append(json.loads(s) if s else None)
+        except Exception:
+            out.append(None)
+    return out
+
+
+def mset_json(r: Optional["redis.Redis"], mapping: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+              ttl_sec: int = 0) -> None:
+    """Accepts a dict or an iterable of (key, value) pairs."""
+    mset_raw(r, [(k, json.dumps(v)) for k, v in _pairs(mapping)], ttl_sec=ttl_sec)
+
+
+def mget_vectors(r: Optional["redis.Redis"], keys: Iterable[str]) -> List[Optional["np.ndarray"]]:
+    """Binary-encoded vectors (see codec.py) via MGET; r must be a bytes-mode client."""
+    return [decode_vector(b) for b in mget_raw(r, keys)]
 
 
-def mset_json(r: Optional["redis.Redis"], mapping: Dict[str, Any], ttl_sec: int = 0) -> None:
-    for k, v in mapping.items():
-        set_json(r, k, v, ttl_sec=ttl_sec)
+def mset_vectors(r: Optional["redis.Redis"], mapping: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+                 ttl_sec: int = 0, dtype: str = "float32") -> None:
+    mset_raw(r, [(k, encode_vector(v, dtype)) for k, v in _pairs(mapping)], ttl_sec=ttl_sec)
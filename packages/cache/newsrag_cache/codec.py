@@ -0,0 +1,35 @@
+# packages/cache/newsrag_cache/codec.py
+"""
+Compact binary encoding for cached embedding vectors.
+
+Layout: b"V1" + dtype tag (b"f" float32 | b"h" float16) + little-endian raw values.
+A float32 vector is dim*4 bytes (vs ~4-5x that as a JSON float list) and decodes with
+a single np.frombuffer. float16 halves that again; fine for L2-normalized vectors
+whose components are well inside float16 precision for cosine ranking.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+_MAGIC = b"V1"
+_TAGS = {"float32": b"f", "float16": b"h"}
+_DTYPES = {b"f": np.dtype("<f4"), b"h": np.dtype("<f2")}
+
+
+def encode_vector(vec, dtype: str = "float32") -> bytes:
+    if dtype not in _TAGS:
+        raise ValueError(f"Unsupported vector dtype {dtype!r}; expected one of {sorted(_TAGS)}")
+    arr = np.asarray(vec, dtype=_DTYPES[_TAGS[dtype]])
+    return _MAGIC + _TAGS[dtype] + arr.tobytes()
+
+
+def decode_vector(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    """float32 vector from encode_vector() bytes; None for a miss or anything not in this format."""
+    if not blob or blob[:2] != _MAGIC:
+        return None
+    dt = _DTYPES.get(blob[2:3])
+    if dt is None or (len(blob) - 3) % dt.itemsize:
+        return None
+    return np.frombuffer(blob, dtype=dt, offset=3).astype("float32")
@@ -8,3 +8,27 @@ def key_page(url: str) -> str:
 
 def key_embed(model: str, text: str) -> str:
     return f"embed:{model}:{sha1(text)}"
+
+def key_embed_bin(model: str, text: str) -> str:
+    """Binary (codec.py) embedding entry; separate from key_embed's JSON lists."""
+    return f"embedb:{model}:{sha1(text)}"
+
+def key_corpus_pages(corpus_id: str) -> str:
+    """Redis hash of url -> content hash for the pages indexed into a corpus."""
+    return f"corpus_pages:{corpus_id}"
+
+def key_corpus_aliases(corpus_id: str) -> str:
+    """Redis hash of "url#chunk" -> JSON list of URLs carrying a near-duplicate of that chunk."""
+    return f"corpus_aliases:{corpus_id}"
+
+def key_corpus_version(corpus_id: str) -> str:
+    """Latest published manifest version of a corpus (written by storage after each swap)."""
+    return f"corpus_version:{corpus_id}"
+
+def key_compact(corpus_id: str) -> str:
+    """Lease held from enqueueing a compaction of a corpus until that compaction finishes."""
+    return f"compact:{corpus_id}"
+
+def key_answer(corpus_id: str, version: int, digest: str) -> str:
+    """Finished answer for one question + retrieval params against one corpus version."""
+    return f"answer:{corpus_id}:{version}:{digest}"
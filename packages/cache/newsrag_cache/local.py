@@ -0,0 +1,148 @@
+# packages/cache/newsrag_cache/local.py
+"""
+In-process L1 cache in front of Redis (L2).
+
+Hot entries (query embeddings, recently fetched page texts) are served from a size-bounded
+LRU with per-entry TTL, using the same keys as Redis (keys.key_embed_bin / keys.key_page),
+so a repeated question costs no network round trip at all. Misses fall through to Redis,
+and whatever Redis returns is promoted into L1.
+Each worker process has its own L1; a forked child starts with a copy of the parent's.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+from .client import _pairs, get_json, mget_vectors, mset_vectors, set_json
+
+L1_ENABLE = os.getenv("CACHE_L1_ENABLE", "1") != "0"
+L1_EMBED_MAX_MB = float(os.getenv("CACHE_L1_EMBED_MAX_MB", "64"))
+L1_EMBED_TTL_SEC = float(os.getenv("CACHE_L1_EMBED_TTL_SEC", "3600"))
+L1_PAGE_MAX_MB = float(os.getenv("CACHE_L1_PAGE_MAX_MB", "64"))
+L1_PAGE_TTL_SEC = float(os.getenv("CACHE_L1_PAGE_TTL_SEC", "600"))
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):  # e.g. page records: dominated by their text
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class LocalCache:
+    """Thread-safe LRU bounded by total value bytes, with a TTL per entry."""
+
+    def __init__(self, max_bytes: int, ttl_sec: float, name: str = ""):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self._data: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()  # key -> (value, nbytes, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, nbytes, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self._bytes -= nbytes
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl_sec: Optional[float] = None) -> None:
+        nbytes = _sizeof(value)
+        if nbytes > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.ttl_sec if ttl_sec is None else ttl_sec)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, nbytes, expires)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._data), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": (self.hits / lookups) if lookups else 0.0}
+
+
+embed_l1 = LocalCache(int(L1_EMBED_MAX_MB * 1024 * 1024), L1_EMBED_TTL_SEC, "embed")
+page_l1 = LocalCache(int(L1_PAGE_MAX_MB * 1024 * 1024), L1_PAGE_TTL_SEC, "page")
+
+
+def l1_stats() -> Dict[str, Dict[str, Any]]:
+    """L1 hit/miss counters per cache (for metrics / health endpoints)."""
+    return {c.name: c.stats() for c in (embed_l1, page_l1)}
+
+
+def tiered_mget_vectors(r, keys: Iterable[str]) -> List[Optional[np.ndarray]]:
+    """Vectors from L1, then one bulk Redis read for the rest (promoted into L1)."""
+    keys = list(keys)
+    if not L1_ENABLE:
+        return mget_vectors(r, keys)
+    out = [embed_l1.get(k) for k in keys]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        for i, v in zip(missing, mget_vectors(r, [keys[i] for i in missing])):
+            if v is not None:
+                v.flags.writeable = False  # shared between callers
+                embed_l1.set(keys[i], v)
+                out[i] = v
+    return out
+
+
+def tiered_mset_vectors(r, mapping: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+                        ttl_sec: int = 0, dtype: str = "float32") -> None:
+    pairs = _pairs(mapping)
+    if L1_ENABLE:
+        for k, v in pairs:
+            v = np.array(v, dtype="float32")
+            v.flags.writeable = False
+            embed_l1.set(k, v)
+    mset_vectors(r, pairs, ttl_sec=ttl_sec, dtype=dtype)
+
+
+def tiered_get_json(r, key: str, l1: LocalCache = page_l1) -> Optional[Any]:
+    if not L1_ENABLE:
+        return get_json(r, key)
+    value = l1.get(key)
+    if value is None:
+        value = get_json(r, key)
+        if value is not None:
+            l1.set(key, value)
+    return value
+
+
+def tiered_set_json(r, key: str, value: Any, ttl_sec: int = 0, l1: LocalCache = page_l1) -> None:
+    if L1_ENABLE:
+        l1.set(key, value, ttl_sec=min(l1.ttl_sec, ttl_sec) if ttl_sec > 0 else None)
+    set_json(r, key, value, ttl_sec=ttl_sec)
@@ -0,0 +1,126 @@
+# packages/cache/newsrag_cache/ratelimit.py
+"""
+Per-minute budgets shared by every worker, e.g. an API quota of N tokens and M requests
+per minute.
+
+Usage is counted in fixed windows (window_sec, default 60s). acquire() atomically adds a
+request's cost to all of the window's counters in Redis (one Lua call), but only if every
+limit still has room; otherwise the caller sleeps until the next window (plus a little
+jitter, so waiting workers don't all retry at the same instant) and tries again. A request
+larger than a whole limit is let through in an otherwise empty window, never starved.
+Without Redis (or while its breaker is open) the same accounting runs per process.
+"""
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+from . import client
+
+_ACQUIRE = """
+local n = #KEYS
+for i = 1, n do
+    local used = tonumber(redis.call("GET", KEYS[i]) or "0")
+    local cost = tonumber(ARGV[2 * i - 1])
+    if used > 0 and used + cost > tonumber(ARGV[2 * i]) then
+        return 0
+    end
+end
+for i = 1, n do
+    redis.call("INCRBY", KEYS[i], ARGV[2 * i - 1])
+    redis.call("PEXPIRE", KEYS[i], ARGV[2 * n + 1])
+end
+return 1
+"""
+
+
+_budgets: "weakref.WeakSet[RateBudget]" = weakref.WeakSet()
+
+
+class RateBudget:
+    """Shared fixed-window budget over named limits, e.g. {"tokens": 1_000_000, "requests": 3000}."""
+
+    def __init__(self, name: str, limits: Dict[str, int], window_sec: float = 60.0):
+        self.name = name
+        self.limits = {k: int(v) for k, v in limits.items() if v and int(v) > 0}
+        self.window_sec = window_sec
+        self._lock = threading.Lock()
+        self._local: Dict[str, int] = {}
+        self._local_window = -1
+        self.waits = 0
+        self.waited_sec = 0.0
+        _budgets.add(self)
+
+    def _window(self, now: float) -> int:
+        return int(now // self.window_sec)
+
+    def _try_redis(self, r, window: int, cost: Dict[str, int]) -> Optional[bool]:
+        if r is None or client._breaker.is_open:
+            return None
+        names = list(self.limits)
+        keys = [f"rate:{self.name}:{window}:{k}" for k in names]
+        args = []
+        for k in names:
+            args += [int(cost.get(k, 0)), self.limits[k]]
+        args.append(int(self.window_sec * 2000))  # keep counters a little past their window
+        try:
+            ok = bool(r.eval(_ACQUIRE, len(keys), *keys, *args))
+        except Exception as e:
+            client._failed(e)
+            return None
+        client._ok()
+        return ok
+
+    def _try_local(self, window: int, cost: Dict[str, int]) -> bool:
+        with self._lock:
+            if window != self._local_window:
+                self._local, self._local_window = {}, window
+            for k, limit in self.limits.items():
+                used = self._local.get(k, 0)
+                if used > 0 and used + int(cost.get(k, 0)) > limit:
+                    return False
+            for k in self.limits:
+                self._local[k] = self._local.get(k, 0) + int(cost.get(k, 0))
+            return True
+
+    def acquire(self, cost: Dict[str, int], r=None, max_wait_sec: Optional[float] = None) -> float:
+        """
+        Block until `cost` fits in the current window's budget; returns seconds waited.
+        Raises TimeoutError if that would take longer than max_wait_sec.
+        """
+        if not self.limits:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.time()
+            window = self._window(now)
+            ok = self._try_redis(r, window, cost)
+            if ok is None:
+                ok = self._try_local(window, cost)
+            if ok:
+                if waited:
+                    self.waits += 1
+                    self.waited_sec += waited
+                return waited
+            delay = (window + 1) * self.window_sec - now + random.uniform(0, min(1.0, self.window_sec / 10))
+            if max_wait_sec is not None and waited + delay > max_wait_sec:
+                raise TimeoutError(f"rate budget {self.name!r} exhausted for {max_wait_sec:.0f}s")
+            time.sleep(delay)
+            waited += delay
+
+    def stats(self) -> Dict[str, object]:
+        return {"limits": dict(self.limits), "window_sec": self.window_sec,
+                "waits": self.waits, "waited_sec": round(self.waited_sec, 3)}
+
+
+def _reset_after_fork() -> None:
+    for b in list(_budgets):
+        b._lock = threading.Lock()  # may have been held by a parent thread at fork time
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
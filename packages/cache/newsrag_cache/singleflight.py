@@ -0,0 +1,193 @@
+# packages/cache/newsrag_cache/singleflight.py
+"""
+Single-flight (request coalescing) for cache misses.
+
+When many callers miss the same key at once, only one computes it:
+  - within a process, followers wait on the leader's in-flight call and share its result;
+  - across workers, the leader holds a Redis lease (SET NX PX lease:<key>, token-checked
+    release), and other workers poll the cache for the value instead of recomputing.
+A lease expires after LEASE_TTL_SEC, so a crashed holder only delays others that long;
+waiters that run out of patience (or find the lease gone without a value) compute themselves.
+Without Redis this degrades to in-process coalescing only.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from . import client
+
+LEASE_TTL_SEC = float(os.getenv("CACHE_LEASE_TTL_SEC", "30"))
+LEASE_WAIT_SEC = float(os.getenv("CACHE_LEASE_WAIT_SEC", "20"))
+POLL_SEC = 0.05
+POLL_MAX_SEC = 0.5
+
+_RELEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(key: str) -> str:
+    return f"lease:{key}"
+
+
+class _Call:
+    __slots__ = ("done", "value", "ok")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.ok = False
+
+
+_lock = threading.Lock()
+_inflight: Dict[str, _Call] = {}
+
+stats = {"leader": 0, "joined_local": 0, "joined_remote": 0, "lease_timeouts": 0}
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    _lock = threading.Lock()
+    _inflight.clear()  # calls in flight in the parent never complete in the child
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _acquire(r, keys: Sequence[str], token: str, ttl_sec: float) -> Optional[List[bool]]:
+    """Try to take the lease on each key in one round trip; None if Redis is unusable."""
+    if r is None or client._breaker.is_open or not keys:
+        return None
+    try:
+        pipe = r.pipeline(transaction=False)
+        for k in keys:
+            pipe.set(lease_key(k), token, nx=True, px=int(ttl_sec * 1000))
+        return [bool(x) for x in pipe.execute()]
+    except Exception as e:
+        client._failed(e)
+        return None
+
+
+def _release(r, keys: Sequence[str], token: str) -> None:
+    if r is None or not keys:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for k in keys:
+            pipe.eval(_RELEASE, 1, lease_key(k), token)
+        pipe.execute()
+    except Exception as e:
+        client._failed(e)
+
+
+def _leases_held(r, keys: Sequence[str]) -> List[bool]:
+    try:
+        pipe = r.pipeline(transaction=False)
+        for k in keys:
+            pipe.exists(lease_key(k))
+        return [bool(x) for x in pipe.execute()]
+    except Exception as e:
+        client._failed(e)
+        return [False] * len(keys)
+
+
+def _await_remote(r, keys: List[str], read_many: Callable[[List[str]], List[Any]],
+                  wait_sec: float) -> Dict[str, Any]:
+    """Poll the cache for values another worker is computing; stops when leases vanish."""
+    found: Dict[str, Any] = {}
+    pending = list(keys)
+    delay, deadline = POLL_SEC, time.monotonic() + wait_sec
+    while pending and time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_SEC)
+        for k, v in zip(pending, read_many(pending)):
+            if v is not None:
+                found[k] = v
+        pending = [k for k in pending if k not in found]
+        if pending:
+            held = _leases_held(r, pending)
+            pending = [k for k, h in zip(pending, held) if h]  # holder finished/died without a value
+    if pending:
+        stats["lease_timeouts"] += 1
+    return found
+
+
+def single_flight_many(keys: Sequence[str], compute_many: Callable[[List[str]], List[Any]],
+                       read_many: Optional[Callable[[List[str]], List[Any]]] = None, r=None,
+                       lease_ttl_sec: float = LEASE_TTL_SEC, wait_sec: float = LEASE_WAIT_SEC) -> List[Any]:
+    """
+    Values for `keys` (aligned), computing each key at most once across concurrent callers.
+    compute_many(keys) must return values aligned with keys *and* write them to the cache that
+    read_many(keys) reads (so waiting workers can pick them up); read_many returns None for misses.
+    """
+    unique = list(dict.fromkeys(keys))
+    lead: List[str] = []
+    follow: Dict[str, _Call] = {}
+    with _lock:
+        for k in unique:
+            call = _inflight.get(k)
+            if call is None:
+                _inflight[k] = _Call()
+                lead.append(k)
+            else:
+                follow[k] = call
+
+    results: Dict[str, Any] = {}
+    try:
+        if lead:
+            token = uuid.uuid4().hex
+            won = _acquire(r, lead, token, lease_ttl_sec)
+            mine = lead if won is None else [k for k, w in zip(lead, won) if w]
+            theirs = [] if won is None else [k for k, w in zip(lead, won) if not w]
+            try:
+                if mine:
+                    stats["leader"] += 1
+                    results.update(zip(mine, compute_many(mine)))
+            finally:
+                if won is not None:
+                    _release(r, mine, token)
+            if theirs:
+                stats["joined_remote"] += 1
+                results.update(_await_remote(r, theirs, read_many or (lambda ks: [None] * len(ks)), wait_sec))
+                leftover = [k for k in theirs if k not in results]
+                if leftover:
+                    results.update(zip(leftover, compute_many(leftover)))
+    finally:
+        with _lock:
+            for k in lead:
+                call = _inflight.pop(k)
+                if k in results:
+                    call.value, call.ok = results[k], True
+                call.done.set()
+
+    if follow:
+        stats["joined_local"] += 1
+        retry = []
+        for k, call in follow.items():
+            call.done.wait(wait_sec)
+            if call.ok:
+                results[k] = call.value
+            else:  # leader failed or is too slow: compute it here
+                retry.append(k)
+        if retry:
+            results.update(zip(retry, compute_many(retry)))
+    return [results[k] for k in keys]
+
+
+def single_flight(key: str, compute: Callable[[], Any], read: Optional[Callable[[], Any]] = None,
+                  r=None, lease_ttl_sec: float = LEASE_TTL_SEC, wait_sec: float = LEASE_WAIT_SEC) -> Any:
+    """Single-key form: compute() must also store the value where read() finds it."""
+    return single_flight_many(
+        [key],
+        lambda ks: [compute()],
+        (lambda ks: [read()]) if read is not None else None,
+        r=r, lease_ttl_sec=lease_ttl_sec, wait_sec=wait_sec,
+    )[0]
@@ -1,3 +1,4 @@
 from .config import OPENAI_API_KEY, LLM_MODEL
+from .extract import extract_text
 from .fetcher import fetch_article_text
 from .summarize import summarize  
@@ -0,0 +1,189 @@
+# packages/core/newsrag_core/extract.py
+"""
+HTML -> plain text extraction for ingest.
+
+Engines (HTML_EXTRACTOR):
+  - "lxml" (default): libxml2 parse, drop script/style/comments, text of <article>/<main>/<body>.
+    Same output shape as the old BeautifulSoup path, several times faster.
+  - "readability": readability-lxml boilerplate removal (nav, sidebars, footers, link farms)
+    first, then the lxml text pass. Slower than "lxml" but cleaner chunks for news pages;
+    falls back to "lxml" when readability keeps too little text.
+  - "bs4": the original BeautifulSoup(html.parser) implementation, kept as a reference.
+Inputs are capped at HTML_MAX_CHARS before parsing, so one huge page can't stall a worker.
+
+Block-level elements (<p>, <div>, headings, list items, ...) become paragraphs separated by
+a blank line; whitespace is collapsed only within a paragraph, so the chunker can still close
+chunks at paragraph breaks.
+"""
+from __future__ import annotations
+
+import os
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import lxml.html
+from lxml import etree
+
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "lxml")
+HTML_MAX_CHARS = int(os.getenv("HTML_MAX_CHARS", str(2_000_000)))
+# readability output shorter than this (chars) is treated as a miss
+READABILITY_MIN_CHARS = int(os.getenv("HTML_READABILITY_MIN_CHARS", "200"))
+
+_DROP_TAGS = ("script", "style", "noscript", "template")
+_BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main",
+    "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class _Paragraphs:
+    """Text pieces in document order, cut into paragraphs at block element boundaries."""
+
+    def __init__(self):
+        self.paras: List[str] = []
+        self._cur: List[str] = []
+
+    def add(self, text: Optional[str]) -> None:
+        if text:
+            self._cur.append(text)
+
+    def cut(self) -> None:
+        para = _normalize(" ".join(self._cur))
+        if para:
+            self.paras.append(para)
+        self._cur = []
+
+    def text(self) -> str:
+        self.cut()
+        return "\n\n".join(self.paras)
+
+
+def _bs4_blocks(root) -> str:
+    from bs4 import NavigableString, Tag
+
+    out = _Paragraphs()
+    stack: List[Tuple[Iterator, bool]] = [(iter(root.children), True)]  # (children, is block)
+    while stack:
+        node = next(stack[-1][0], None)
+        if node is None:
+            if stack.pop()[1]:
+                out.cut()
+        elif isinstance(node, Tag):
+            block = node.name in _BLOCK_TAGS
+            if block:
+                out.cut()
+            stack.append((iter(node.children), block))
+        elif type(node) is NavigableString:  # not comments, doctypes, CDATA, ...
+            out.add(str(node))
+    return out.text()
+
+
+def _lxml_blocks(root) -> str:
+    out = _Paragraphs()
+    for event, el in etree.iterwalk(root, events=("start", "end")):
+        block = el.tag in _BLOCK_TAGS
+        if event == "start":
+            if block:
+                out.cut()
+            out.add(el.text)
+        else:
+            if block:
+                out.cut()
+            if el is not root:
+                out.add(el.tail)
+    return out.text()
+
+
+def _bs4_text(html: str) -> str:
+    """
+    Very lightweight readability:
+    - strip <script>/<style>
+    - return visible text, normalized
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    for tag in soup(["script", "style", "noscript", "template"]):
+        tag.decompose()
+
+    # Prefer article/main if present
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    text = _bs4_blocks(root)
+
+    # If nothing, try the title as a minimum signal
+    if not text:
+        title = (soup.title.string.strip() if soup.title and soup.title.string else "").strip()
+        text = _normalize(title)
+
+    return text
+
+
+def _tree_text(doc) -> str:
+    etree.strip_elements(doc, etree.Comment, etree.ProcessingInstruction, *_DROP_TAGS, with_tail=False)
+    root = doc.find(".//article")
+    if root is None:
+        root = doc.find(".//main")
+    if root is None:
+        root = doc.find(".//body")
+    if root is None:
+        root = doc
+    text = _lxml_blocks(root)
+    if not text:
+        title = doc.find(".//title")
+        text = _normalize(title.text_content()) if title is not None else ""
+    return text
+
+
+def _parse(html: str):
+    try:
+        return lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):  # empty document / encoding declaration in a str
+        try:
+            return lxml.html.document_fromstring(html.encode("utf-8", "replace"))
+        except (etree.ParserError, ValueError):
+            return None
+
+
+def _lxml_text(html: str) -> str:
+    doc = _parse(html)
+    return _tree_text(doc) if doc is not None else ""
+
+
+def _readability_text(html: str) -> str:
+    try:
+        from readability import Document
+
+        summary = Document(html).summary(html_partial=True)
+    except Exception:
+        return _lxml_text(html)
+    text = _lxml_text(summary)
+    if len(text) < READABILITY_MIN_CHARS:
+        fallback = _lxml_text(html)
+        if len(fallback) > len(text):
+            return fallback
+    return text
+
+
+EXTRACTORS: Dict[str, Callable[[str], str]] = {
+    "lxml": _lxml_text,
+    "readability": _readability_text,
+    "bs4": _bs4_text,
+}
+
+
+def extract_text(html: str, engine: Optional[str] = None, max_chars: Optional[int] = None) -> str:
+    """Visible article text of an HTML page, one paragraph per block, blank-line separated ("" if none)."""
+    if not html:
+        return ""
+    fn = EXTRACTORS.get(engine or HTML_EXTRACTOR)
+    if fn is None:
+        raise ValueError(f"Unknown HTML extractor: {engine or HTML_EXTRACTOR!r} (expected one of {sorted(EXTRACTORS)})")
+    cap = HTML_MAX_CHARS if max_chars is None else max_chars
+    if cap > 0 and len(html) > cap:
+        html = html[:cap]  # the parsers recover from the truncated tail
+    return fn(html)
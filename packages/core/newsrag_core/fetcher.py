@@ -1,13 +1,19 @@
 # packages/core/newsrag_core/fetcher.py
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
 
 import httpx
-from bs4 import BeautifulSoup
 
-from newsrag_cache.client import get_redis, get_json, set_json
+from newsrag_cache import get_redis, key_page, sha1, tiered_get_json, tiered_set_json
+
+from .extract import extract_text
 
 
 DEFAULT_TIMEOUT = float(os.getenv("HTTP_TIMEOUT_SEC", "15"))
@@ -15,65 +21,276 @@ USER_AGENT = os.getenv(
     "HTTP_USER_AGENT",
     "newsrag-bot/0.1 (+https://example.com) python-httpx",
 )
+PAGE_TTL = int(os.getenv("CACHE_PAGE_TTL_SEC", "21600"))  # 6 hours default: served without revalidating
+# How long a page record (text + validators) is kept for conditional refreshes after that
+PAGE_RECORD_TTL = int(os.getenv("CACHE_PAGE_RECORD_TTL_SEC", str(30 * 86400)))
+
+# Async batch fetching (shared keep-alive client; limits are per process)
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "16"))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))
+FETCH_BATCH_DEADLINE_SEC = float(os.getenv("FETCH_BATCH_DEADLINE_SEC", "60"))
+FETCH_HTTP2 = os.getenv("FETCH_HTTP2", "1") != "0"  # needs h2 (the httpx[http2] extra, a dependency)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
 
+class _Response(NamedTuple):
+    url: str
+    status: int                   # 0 if the request failed
+    body: Optional[str]           # None for 304 / failures
+    headers: Optional[httpx.Headers]
+    error: Optional[BaseException]
 
-def _fetch_html(url: str) -> str:
-    headers = {"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"}
-    with httpx.Client(follow_redirects=True, timeout=DEFAULT_TIMEOUT, headers=headers) as client:
-        resp = client.get(url)
-        resp.raise_for_status()
-        return resp.text
 
+class Page(NamedTuple):
+    url: str
+    text: str
+    content_hash: str             # sha1 of the extracted text ("" when there is no text)
+    unchanged: bool               # served from cache, 304, or identical body: no re-extraction happened
 
-def _html_to_text(html: str) -> str:
+
+class _HostSlot:
+    """A host's concurrency semaphore and the number of requests using or waiting on it."""
+    __slots__ = ("sem", "users")
+
+    def __init__(self):
+        self.sem = asyncio.Semaphore(FETCH_PER_HOST)
+        self.users = 0
+
+
+class _AsyncFetcher:
     """
-    Very lightweight readability:
-    - strip <script>/<style>
-    - return visible text, normalized
+    One event loop thread per process owning a shared httpx.AsyncClient (HTTP/2 when
+    available, keep-alive pool), a global concurrency semaphore and per-host semaphores.
+    Sync callers submit batches with stream(); results arrive on a queue as they complete.
+    A host's semaphore is dropped once no request uses it, so a long-lived worker only
+    holds them for the hosts it is fetching from right now.
     """
-    soup = BeautifulSoup(html, "html.parser")
 
-    for tag in soup(["script", "style", "noscript", "template"]):
-        tag.decompose()
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="newsrag-fetch", daemon=True)
+        self._thread.start()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._hosts: Dict[str, _HostSlot] = {}  # only touched on the loop thread
 
-    # Prefer article/main if present
-    root = soup.find("article") or soup.find("main") or soup.body or soup
-    text = root.get_text(separator=" ", strip=True)
+    def _setup(self) -> None:  # runs on the loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=FETCH_HTTP2 and _http2_available(),
+                follow_redirects=True,
+                timeout=DEFAULT_TIMEOUT,
+                headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+                limits=httpx.Limits(max_connections=FETCH_CONCURRENCY, max_keepalive_connections=FETCH_CONCURRENCY),
+            )
+            self._global = asyncio.Semaphore(FETCH_CONCURRENCY)
 
-    # If nothing, try the title as a minimum signal
-    if not text:
-        title = (soup.title.string.strip() if soup.title and soup.title.string else "").strip()
-        text = title
+    async def _fetch_one(self, url: str, headers: Dict[str, str]) -> "_Response":
+        host = urlsplit(url).netloc.lower()
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = _HostSlot()
+        slot.users += 1
+        try:
+            async with slot.sem, self._global:  # never hold a global slot while queued on a busy host
+                resp = await self._client.get(url, headers=headers)
+                if resp.status_code == 304:
+                    return _Response(url, 304, None, resp.headers, None)
+                resp.raise_for_status()
+                return _Response(url, resp.status_code, resp.text, resp.headers, None)
+        except Exception as e:
+            return _Response(url, 0, None, None, e)
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                del self._hosts[host]
 
-    # Normalize whitespace
-    return " ".join(text.split())
+    async def _run(self, requests: List[Tuple[str, Dict[str, str]]], out: "queue.Queue", deadline_sec: float) -> None:
+        self._setup()
+        tasks = [asyncio.ensure_future(self._fetch_one(u, h)) for u, h in requests]
+        try:
+            for fut in asyncio.as_completed(tasks, timeout=deadline_sec):
+                out.put(await fut)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+            out.put(None)
 
+    def stream(self, requests: List[Tuple[str, Dict[str, str]]], deadline_sec: float) -> Iterator["_Response"]:
+        """Responses to (url, extra headers) in completion order; requests pending at the deadline are dropped."""
+        out: "queue.Queue" = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._run(requests, out, deadline_sec), self._loop)
+        while True:
+            item = out.get()
+            if item is None:
+                return
+            yield item
 
-def fetch_article_text(url: str) -> str:
+
+_fetcher: Optional[_AsyncFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _fetcher, _fetcher_lock
+    _fetcher, _fetcher_lock = None, threading.Lock()  # the loop thread does not survive fork
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_fetcher() -> _AsyncFetcher:
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = _AsyncFetcher()
+    return _fetcher
+
+
+def _validators(record: Optional[dict]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if record and record.get("text"):
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+    return headers
+
+
+class Fetched(NamedTuple):
+    """A URL's cached page record plus the outcome of revalidating it (not yet extracted)."""
+    url: str
+    record: Optional[dict]
+    response: Optional[_Response]  # None: the cached record is fresh, nothing was fetched
+
+    @property
+    def needs_extraction(self) -> bool:
+        """True if there is a new body to extract (not a 304, a failure or identical bytes)."""
+        resp, old = self.response, self.record or {}
+        if resp is None or resp.body is None:
+            return False
+        return not (old.get("text") and old.get("body_hash") == sha1(resp.body))
+
+
+def _refreshed(record: Optional[dict], resp: "_Response", text: Optional[str] = None) -> Tuple[dict, bool]:
     """
-    Fetches a URL and returns plain text content.
-    Uses Redis cache when available; gracefully no-ops if Redis is absent.
+    New page record for a response, and whether the page is unchanged since `record`.
+    `text` is the already-extracted text of resp.body, if the caller extracted it elsewhere.
+    """
+    old = record or {}
+    if resp.status == 304 and old.get("text"):
+        text, body_hash, unchanged = old["text"], old.get("body_hash", ""), True
+    elif resp.body is not None:
+        body_hash = sha1(resp.body)
+        if old.get("text") and old.get("body_hash") == body_hash:
+            text, unchanged = old["text"], True  # same bytes: skip re-extraction
+        else:
+            if text is None:
+                try:
+                    text = extract_text(resp.body)  # inline extraction, off the event loop
+                except Exception:
+                    text = ""
+            unchanged = bool(text) and sha1(text) == old.get("hash")
+    else:
+        # Fetch failed: keep serving the last good text if there is one
+        text, body_hash, unchanged = old.get("text", ""), old.get("body_hash", ""), bool(old.get("text"))
+    headers = resp.headers or {}
+    rec = {
+        "text": text,
+        "hash": sha1(text) if text else "",
+        "body_hash": body_hash,
+        "etag": headers.get("etag") or old.get("etag"),
+        "last_modified": headers.get("last-modified") or old.get("last_modified"),
+        # a failed refresh isn't a successful check: retry it next time
+        "checked_at": time.time() if resp.status else old.get("checked_at", 0),
+    }
+    return rec, unchanged
+
+
+def fetch_raw(urls: Iterable[str], deadline_sec: float = FETCH_BATCH_DEADLINE_SEC) -> Iterator[Fetched]:
+    """
+    The network half of fetch_pages(): yields each URL's record and response as soon as it is
+    available, without extracting text. Pass each item to finish_page(), optionally with text
+    extracted elsewhere (e.g. in a process pool) when item.needs_extraction.
     """
     r = get_redis()  # may be None in tests/dev
-    cache_key = f"page:{url}"
+    records: Dict[str, Optional[dict]] = {}
+    todo: List[Tuple[str, Dict[str, str]]] = []
+    now = time.time()
+    for url in dict.fromkeys(urls):
+        rec = tiered_get_json(r, key_page(url))
+        rec = rec if isinstance(rec, dict) else None  # plain-text entries predate page records
+        if rec and rec.get("text") and now - rec.get("checked_at", 0) < PAGE_TTL:
+            yield Fetched(url, rec, None)
+            continue
+        records[url] = rec
+        todo.append((url, _validators(rec)))
+    if not todo:
+        return
 
-    cached = get_json(r, cache_key)
-    if isinstance(cached, str) and cached:
-        return cached
+    started = time.monotonic()
+    done = set()
+    for resp in _get_fetcher().stream(todo, deadline_sec):
+        done.add(resp.url)
+        yield Fetched(resp.url, records[resp.url], resp)
+    for url, _ in todo:
+        if url not in done:
+            print(f"[warn] fetch deadline ({deadline_sec:.0f}s) hit after {time.monotonic() - started:.1f}s; skipped {url}")
 
-    try:
-        html = _fetch_html(url)
-        text = _html_to_text(html)
-    except Exception as e:
-        # Best-effort fallback if the request/parsing fails
-        text = f""  # keep empty; callers can handle empty if needed
-        # You could log 'e' to your logger here if you have one
 
+def finish_page(item: Fetched, text: Optional[str] = None) -> Page:
+    """Page for a fetch_raw() item; stores the refreshed record in the page cache."""
+    if item.response is None:
+        rec = item.record or {}
+        return Page(item.url, rec.get("text", ""), rec.get("hash", ""), True)
+    rec, unchanged = _refreshed(item.record, item.response, text)
     # Cache best-effort result (even empty) to avoid hammering hosts during tests/dev
-    ttl = int(os.getenv("CACHE_PAGE_TTL_SEC", "21600"))  # 6 hours default
     try:
-        set_json(r, cache_key, text, ttl_sec=ttl)
+        tiered_set_json(get_redis(), key_page(item.url), rec, ttl_sec=PAGE_RECORD_TTL)
     except Exception:
         pass  # never let cache errors fail core logic
+    return Page(item.url, rec["text"], rec["hash"], unchanged)
 
-    return text
+
+def fetch_pages(urls: Iterable[str], deadline_sec: float = FETCH_BATCH_DEADLINE_SEC) -> Iterator[Page]:
+    """
+    Fetch many URLs concurrently and yield a Page as each one is ready, so callers can chunk
+    early pages while slow ones are still downloading. Total time tracks the slowest URL.
+
+    The page cache keeps a record per URL (text, content hash, ETag / Last-Modified):
+      - within CACHE_PAGE_TTL_SEC of the last check the cached text is used as is;
+      - after that the page is revalidated with If-None-Match / If-Modified-Since, and a 304
+        (or an identical body) reuses the cached text without re-extracting it.
+    Failed fetches yield the last good text, or "" if there is none; URLs not done within
+    deadline_sec are skipped.
+    """
+    for item in fetch_raw(urls, deadline_sec):
+        yield finish_page(item)
+
+
+def fetch_articles(urls: Iterable[str], deadline_sec: float = FETCH_BATCH_DEADLINE_SEC) -> Iterator[Tuple[str, str]]:
+    """(url, text) in completion order; see fetch_pages()."""
+    for page in fetch_pages(urls, deadline_sec):
+        yield page.url, page.text
+
+
+def fetch_article_text(url: str) -> str:
+    """
+    Fetches a URL and returns plain text content.
+    Uses the in-process L1 + Redis cache when available; gracefully no-ops if Redis is absent.
+    Goes through the shared async client (keep-alive), so repeated calls reuse connections.
+    """
+    for _, text in fetch_articles([url], deadline_sec=DEFAULT_TIMEOUT * 2):
+        return text
+    return ""
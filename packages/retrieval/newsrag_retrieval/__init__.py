@@ -1,2 +1,2 @@
 # Minimal init to avoid eager submodule imports during package discovery.
-__all__ = ["chunking", "embeddings", "vector_faiss", "ingest", "retrieve", "hybrid"]
+__all__ = ["chunking", "embeddings", "microbatch", "quantize", "vector_faiss", "ingest", "pipeline", "neardup", "retrieve", "hybrid", "storage", "corpus_cache"]
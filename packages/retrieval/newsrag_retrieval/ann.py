@@ -0,0 +1,107 @@
+# packages/retrieval/newsrag_retrieval/ann.py
+"""
+Approximate-nearest-neighbour index specs for FaissStore.
+
+A corpus selects its index in manifest["index"], e.g.
+    {"type": "ivf_flat", "nlist": 1024, "nprobe": 16}
+    {"type": "ivf_pq",   "nlist": 1024, "m": 64, "nbits": 8, "nprobe": 32}
+    {"type": "hnsw",     "M": 32, "efConstruction": 200, "efSearch": 64}
+Missing keys take the defaults below; "flat" (exact search) is the default type.
+IVF indexes are trained from the corpus vectors, so they are only built once a corpus
+has at least "min_rows" vectors; smaller corpora stay on exact search.
+"""
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import numpy as np
+import faiss
+
+INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "flat")  # default for newly created corpora
+ANN_NPROBE = os.getenv("ANN_NPROBE")              # query-time overrides of the per-corpus values
+ANN_EF_SEARCH = os.getenv("ANN_EF_SEARCH")
+
+DEFAULTS = {
+    "flat": {},
+    "ivf_flat": {"nlist": 1024, "nprobe": 16, "min_rows": 5000},
+    "ivf_pq": {"nlist": 1024, "m": 64, "nbits": 8, "nprobe": 32, "min_rows": 10000},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64, "min_rows": 0},
+}
+
+
+def resolve_spec(spec: Optional[dict] = None) -> dict:
+    """Fill in defaults for an index spec (None → the ANN_INDEX_TYPE default)."""
+    spec = dict(spec or {"type": INDEX_TYPE})
+    kind = spec.get("type", "flat")
+    if kind not in DEFAULTS:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {sorted(DEFAULTS)}")
+    return {"type": kind, **DEFAULTS[kind], **spec}
+
+
+def is_exact(spec: dict) -> bool:
+    return spec["type"] == "flat"
+
+
+def _factory_string(spec: dict, dim: int, n: int) -> str:
+    kind = spec["type"]
+    if kind == "hnsw":
+        return f"HNSW{int(spec['M'])},Flat"
+    # FAISS wants ~39 training points per centroid; shrink nlist for smaller corpora.
+    nlist = max(1, min(int(spec["nlist"]), n // 39))
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    m = int(spec["m"])
+    while dim % m:  # PQ sub-quantizers must divide the dimension
+        m -= 1
+    return f"IVF{nlist},PQ{m}x{int(spec['nbits'])}"
+
+
+def can_build(spec: dict, n: int) -> bool:
+    if is_exact(spec):
+        return False
+    if spec["type"] == "ivf_pq" and n < 2 ** int(spec["nbits"]):
+        return False
+    return n >= int(spec.get("min_rows", 0))
+
+
+def build_index(vecs: np.ndarray, spec: dict) -> "faiss.Index":
+    """Train (if needed) and fill an inner-product index over `vecs`."""
+    n, dim = vecs.shape
+    index = faiss.index_factory(dim, _factory_string(spec, dim, n), faiss.METRIC_INNER_PRODUCT)
+    if spec["type"] == "hnsw":
+        index.hnsw.efConstruction = int(spec["efConstruction"])
+    if not index.is_trained:
+        index.train(vecs)
+    index.add(vecs)
+    return index
+
+
+def search_params(spec: dict, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None) -> Optional["faiss.SearchParameters"]:
+    """Per-call search parameters (thread-safe; the index itself is not mutated)."""
+    if spec["type"] == "hnsw":
+        ef = ef_search or ANN_EF_SEARCH or spec["efSearch"]
+        return faiss.SearchParametersHNSW(efSearch=int(ef))
+    if spec["type"] in ("ivf_flat", "ivf_pq"):
+        probe = nprobe or ANN_NPROBE or spec["nprobe"]
+        return faiss.SearchParametersIVF(nprobe=int(probe))
+    return None
+
+
+def estimate_nbytes(spec: dict, ntotal: int, dim: int) -> int:
+    """Rough resident size of an index's own storage (codes + graph/lists)."""
+    if spec["type"] == "ivf_pq":
+        return ntotal * (int(spec["m"]) * int(spec["nbits"]) // 8 + 8)
+    if spec["type"] == "hnsw":
+        return ntotal * (dim * 4 + int(spec["M"]) * 2 * 4)
+    if spec["type"] == "ivf_flat":
+        return ntotal * (dim * 4 + 8)
+    return 0
+
+
+def recall_at_k(approx_idx: np.ndarray, exact_idx: np.ndarray) -> float:
+    """Mean fraction of the exact top-k ids that the approximate search also returned."""
+    hits = [len(set(a[a >= 0]) & set(e[e >= 0])) / max(1, int((e >= 0).sum()))
+            for a, e in zip(approx_idx, exact_idx)]
+    return float(np.mean(hits)) if hits else 0.0
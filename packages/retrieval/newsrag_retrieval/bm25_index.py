@@ -0,0 +1,195 @@
+# packages/retrieval/newsrag_retrieval/bm25_index.py
+"""
+Persistent, incremental BM25 inverted index.
+
+Each corpus segment gets its own postings (built once at ingest, stored next to its vectors):
+  bm25.json  - sorted term list
+  bm25.npz   - term_off (T+1), doc (local row id), tf, doc_len
+BM25Index stacks the segments of a corpus in row order and computes collection statistics
+(N, avgdl, df) across them at query time, so appending a segment never rewrites the others.
+Scoring only touches the postings of the query terms.
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+K1 = 1.5
+B = 0.75
+
+BM25_FILES = ("bm25.json", "bm25.npz")
+
+_token = re.compile(r"\w+")
+
+
+def tokenize(s: str) -> List[str]:
+    return _token.findall(s.lower())
+
+
+class SegmentPostings:
+    """Inverted index over one segment's rows (doc ids are local to the segment)."""
+
+    def __init__(self, terms: List[str], term_off: np.ndarray, doc: np.ndarray, tf: np.ndarray,
+                 doc_len: np.ndarray):
+        self._term_id = {t: i for i, t in enumerate(terms)}
+        self._terms = terms
+        self._term_off = term_off
+        self._doc = doc
+        self._tf = tf
+        self.doc_len = doc_len
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "SegmentPostings":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths: List[int] = []
+        for d, text in enumerate(texts):
+            toks = tokenize(text or "")
+            lengths.append(len(toks))
+            for term, tf in Counter(toks).items():
+                postings.setdefault(term, []).append((d, tf))
+        terms = sorted(postings)
+        term_off = np.zeros(len(terms) + 1, dtype="int64")
+        for i, t in enumerate(terms):
+            term_off[i + 1] = term_off[i] + len(postings[t])
+        flat = [p for t in terms for p in postings[t]]
+        doc = np.fromiter((d for d, _ in flat), dtype="int32", count=len(flat))
+        tf = np.fromiter((f for _, f in flat), dtype="int32", count=len(flat))
+        return cls(terms, term_off, doc, tf, np.asarray(lengths, dtype="int32"))
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.doc_len.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        arrays = self._term_off.nbytes + self._doc.nbytes + self._tf.nbytes + self.doc_len.nbytes
+        return arrays + 64 * len(self._terms)  # rough cost of the term dict
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self._term_id.get(term)
+        if i is None:
+            return self._doc[:0], self._tf[:0]
+        a, b = int(self._term_off[i]), int(self._term_off[i + 1])
+        return self._doc[a:b], self._tf[a:b]
+
+    def df(self, term: str) -> int:
+        i = self._term_id.get(term)
+        return 0 if i is None else int(self._term_off[i + 1] - self._term_off[i])
+
+    def encode(self) -> Dict[str, bytes]:
+        cols = io.BytesIO()
+        np.savez(cols, term_off=self._term_off, doc=self._doc, tf=self._tf, doc_len=self.doc_len)
+        return {"bm25.json": json.dumps({"format": 1, "terms": self._terms}).encode("utf-8"),
+                "bm25.npz": cols.getvalue()}
+
+    @classmethod
+    def decode(cls, read: Callable[[str], Any]) -> "SegmentPostings":
+        terms = json.loads(read("bm25.json"))["terms"]
+        with np.load(io.BytesIO(read("bm25.npz"))) as cols:
+            return cls(terms, cols["term_off"], cols["doc"], cols["tf"], cols["doc_len"])
+
+
+def texts_of(metas: Sequence[dict]) -> Iterable[str]:
+    """Chunk texts of a meta sequence without materializing the dicts of columnar metadata."""
+    if hasattr(metas, "text"):
+        return (metas.text(i) for i in range(len(metas)))
+    return ((m.get("text") or "") for m in metas)
+
+
+def write_dir(d: str, texts: Iterable[str]) -> None:
+    for name, blob in SegmentPostings.build(texts).encode().items():
+        with open(os.path.join(d, name), "wb") as f:
+            f.write(blob)
+
+
+def read_dir(d: str) -> Optional[SegmentPostings]:
+    """Postings stored in a segment dir, or None for segments written before BM25 indexing."""
+    if not os.path.exists(os.path.join(d, "bm25.json")):
+        return None
+
+    def read(name: str) -> bytes:
+        with open(os.path.join(d, name), "rb") as f:
+            return f.read()
+    return SegmentPostings.decode(read)
+
+
+class BM25Index:
+    """
+    BM25 over a corpus' segments, in the same row order as its FaissStore.
+    idf uses the Lucene form log(1 + (N - df + 0.5) / (df + 0.5)), which stays positive
+    for very common terms, so no corpus-wide epsilon pass is needed.
+    """
+
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        self._segments: List[Tuple[int, SegmentPostings]] = []  # (row offset, postings)
+        self._n_docs = 0
+        self._total_len = 0
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str]) -> "BM25Index":
+        index = cls()
+        index.add_segment(SegmentPostings.build(texts))
+        return index
+
+    def add_segment(self, postings: SegmentPostings) -> None:
+        self._segments.append((self._n_docs, postings))
+        self._n_docs += postings.n_docs
+        self._total_len += int(postings.doc_len.sum())
+
+    def copy(self) -> "BM25Index":
+        """An index sharing this one's (immutable) segment postings."""
+        out = BM25Index(self.k1, self.b)
+        out._segments, out._n_docs, out._total_len = list(self._segments), self._n_docs, self._total_len
+        return out
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.nbytes for _, p in self._segments)
+
+    def scores(self, query_tokens: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse BM25: (row ids, scores) for rows matching at least one query token, ids ascending."""
+        if not self._n_docs or not query_tokens:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        avgdl = self._total_len / self._n_docs or 1.0
+        ids, contribs = [], []
+        for term, qtf in Counter(query_tokens).items():
+            df = sum(p.df(term) for _, p in self._segments)
+            if not df:
+                continue
+            idf = np.log1p((self._n_docs - df + 0.5) / (df + 0.5))
+            for offset, p in self._segments:
+                doc, tf = p.postings(term)
+                if not doc.size:
+                    continue
+                tf = tf.astype("float32")
+                norm = self.k1 * (1 - self.b + self.b * p.doc_len[doc] / avgdl)
+                ids.append(doc.astype("int64") + offset)
+                contribs.append(qtf * idf * tf * (self.k1 + 1) / (tf + norm))
+        if not ids:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        uniq, inv = np.unique(np.concatenate(ids), return_inverse=True)
+        return uniq, np.bincount(inv, weights=np.concatenate(contribs)).astype("float32")
+
+    def get_scores(self, query_tokens: Sequence[str], ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dense scores for `ids` (default: every row); rows without a matching term score 0."""
+        hit_ids, hit_scores = self.scores(query_tokens)
+        if ids is None:
+            out = np.zeros(self._n_docs, dtype="float32")
+            out[hit_ids] = hit_scores
+            return out
+        ids = np.asarray(ids, dtype="int64")
+        if not hit_ids.size:
+            return np.zeros(ids.shape, dtype="float32")
+        pos = np.minimum(np.searchsorted(hit_ids, ids), hit_ids.size - 1)
+        return np.where(hit_ids[pos] == ids, hit_scores[pos], 0.0).astype("float32")
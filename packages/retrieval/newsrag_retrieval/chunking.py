@@ -1,3 +1,41 @@
+"""
+Chunkers for page text.
+
+token_chunks() packs whole sentences into chunks of at most CHUNK_MAX_TOKENS tokens,
+closing a chunk early at a paragraph break once it is at least half full, and carries up
+to CHUNK_OVERLAP_TOKENS of trailing sentences into the next chunk. Sentences longer than
+the budget are split at word boundaries. It is a generator over match positions, so a large
+text is never split into a list or copied; each Chunk carries its [start, end) character
+offsets into the source text, which lets the meta store slice overlapping chunks out of one
+shared heap.
+
+Token counts default to a ~4 chars/token estimate, which is what the deployed images use
+(tiktoken is not a dependency; the estimate is close for English prose, and budgets leave
+headroom below the model limits). With CHUNK_TOKENIZER=tiktoken and tiktoken installed,
+exact cl100k_base counts (the embedding models' encoding) are used instead.
+"""
+import os
+import re
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "estimate")  # "estimate" | "tiktoken" (if installed)
+
+# A sentence: from a non-space char up to terminal punctuation (plus closing quotes/brackets)
+# followed by whitespace, a paragraph break, or the end of the text.
+_SENTENCE = re.compile(r"\S.*?(?:[.!?]+[\"'”’)\]]*(?=\s|$)|(?=\n[ \t]*\n)|$)", re.S)
+_PARAGRAPH = re.compile(r"[ \t]*\n[ \t]*\n")
+_WORD = re.compile(r"\S+")
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int   # character offsets into the source text: text == source[start:end]
+    end: int
+    tokens: int
+
+
 def simple_chunks(text: str, max_chars: int = 1200, overlap: int = 150):
     """Greedy char-based chunker with overlap (Phase-2 simple baseline)."""
     i, n = 0, len(text)
@@ -6,3 +44,98 @@ def simple_chunks(text: str, max_chars: int = 1200, overlap: int = 150):
         yield text[i:j]
         if j == n: break
         i = max(0, j - overlap)
+
+
+_counter: Optional[Callable[[str], int]] = None
+_counter_name = "estimate"
+
+
+def _estimate(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text` for the embedding model (see tokenizer() for how they are counted)."""
+    global _counter, _counter_name
+    if _counter is None:
+        _counter = _estimate
+        if CHUNK_TOKENIZER == "tiktoken":
+            try:
+                import tiktoken
+                enc = tiktoken.get_encoding("cl100k_base")
+                _counter, _counter_name = (lambda s: len(enc.encode_ordinary(s))), "tiktoken:cl100k_base"
+            except Exception:  # not installed, or the BPE file can't be fetched
+                print("[warn] CHUNK_TOKENIZER=tiktoken but tiktoken is unavailable; estimating tokens")
+    return _counter(text)
+
+
+def tokenizer() -> str:
+    """"estimate" or "tiktoken:cl100k_base": what count_tokens() uses in this process."""
+    count_tokens("")
+    return _counter_name
+
+
+def _sentences(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """(start, end, ends_paragraph) for each sentence, in order."""
+    for m in _SENTENCE.finditer(text):
+        yield m.start(), m.end(), _PARAGRAPH.match(text, m.end()) is not None
+
+
+def _split_long(text: str, start: int, end: int, max_tokens: int,
+                count: Callable[[str], int]) -> Iterator[Tuple[int, int, int]]:
+    """Word-boundary pieces (start, end, tokens) of an over-budget sentence."""
+    a = b = start
+    used = 0
+    for w in _WORD.finditer(text, start, end):
+        n = count(text[b:w.end()]) if b > a else count(w.group())
+        if used and used + n > max_tokens:
+            yield a, b, used
+            a, used = w.start(), count(w.group())
+        else:
+            used += n
+        b = w.end()
+    if b > a:
+        yield a, b, used
+
+
+def token_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 count: Optional[Callable[[str], int]] = None) -> Iterator[Chunk]:
+    """
+    Stream sentence-aligned chunks of at most ~max_tokens tokens (sum of sentence counts)
+    with about overlap_tokens of trailing sentences repeated at the start of the next chunk.
+    """
+    count = count or count_tokens
+    max_tokens = max(1, max_tokens)
+    window: List[Tuple[int, int, int]] = []  # sentences of the open chunk: (start, end, tokens)
+    used = 0
+    emitted_end = 0  # end offset of the last chunk yielded
+
+    def flush() -> Iterator[Chunk]:
+        nonlocal window, used, emitted_end
+        if not window or window[-1][1] <= emitted_end:  # nothing new beyond the overlap
+            return
+        s, e = window[0][0], window[-1][1]
+        yield Chunk(text[s:e], s, e, used)
+        emitted_end = e
+        keep: List[Tuple[int, int, int]] = []
+        kept = 0
+        for sent in reversed(window[1:]):  # never carry the whole chunk over
+            if kept + sent[2] > overlap_tokens:
+                break
+            keep.insert(0, sent)
+            kept += sent[2]
+        window, used = keep, kept
+
+    for s, e, para_end in _sentences(text):
+        n = count(text[s:e])
+        pieces = [(s, e, n)] if n <= max_tokens else list(_split_long(text, s, e, max_tokens, count))
+        for piece in pieces:
+            if window and used + piece[2] > max_tokens:
+                yield from flush()
+                while window and used + piece[2] > max_tokens:  # overlap + piece would not fit
+                    used -= window.pop(0)[2]
+            window.append(piece)
+            used += piece[2]
+        if para_end and used >= max_tokens // 2:
+            yield from flush()
+    yield from flush()
@@ -0,0 +1,211 @@
+# packages/retrieval/newsrag_retrieval/corpus_cache.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from . import ann, storage
+from .bm25_index import BM25Index, SegmentPostings, texts_of
+from .vector_faiss import FaissStore
+
+MAX_BYTES = int(float(os.getenv("CORPUS_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+REVALIDATE_SEC = float(os.getenv("CORPUS_CACHE_REVALIDATE_SEC", "1"))
+
+
+def _segment_ids(manifest: dict) -> List[str]:
+    return [s["id"] for s in storage.segments(manifest)]
+
+
+def _index_name(manifest: dict) -> Optional[str]:
+    return (manifest.get("index_file") or {}).get("name")
+
+
+def _fingerprint(manifest: dict) -> Tuple:
+    # Legacy manifests have no version; the segment list still identifies the content.
+    # Publishing a trained index doesn't bump the version, but does change the fingerprint.
+    return manifest.get("version"), tuple(_segment_ids(manifest)), _index_name(manifest)
+
+
+class _Entry:
+    __slots__ = ("store", "manifest", "nbytes", "checked_at")
+
+    def __init__(self, store: FaissStore, manifest: dict):
+        self.store = store
+        self.manifest = manifest
+        self.nbytes = store.nbytes()
+        self.checked_at = time.monotonic()
+
+
+class CorpusCache:
+    """
+    Process-level cache of built FaissStores, keyed by corpus id.
+
+    - Entries are revalidated against the corpus manifest at most every `revalidate_sec`.
+    - When new segments were appended, only those segments are loaded and added to the
+      resident store; any other manifest change (e.g. compaction) triggers a full reload.
+    - Each segment's persisted BM25 postings are attached as store.bm25 alongside its rows.
+    - ANN indexes are restored from the persisted index file when one matches the manifest,
+      and adopted on refresh once one is published. They are never trained here (queries
+      would wait on it, in every worker at once): until ingest or compaction publishes one
+      (train_index()), rows it doesn't cover are searched exactly.
+    - Total size is bounded by `max_bytes`; least-recently-used corpora are evicted first.
+
+    Refreshes are serialized per corpus and never touch a published store: new segments are
+    attached to a copy (sharing the resident blocks, metadata and postings), which replaces
+    the entry in one swap, so concurrent readers see either the old rows or all of the new
+    ones. If loading fails the entry is dropped and the next get() rebuilds it.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, revalidate_sec: float = REVALIDATE_SEC):
+        self.max_bytes = max_bytes
+        self.revalidate_sec = revalidate_sec
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._corpus_locks: Dict[str, threading.Lock] = {}
+        self.hits = self.misses = self.refreshes = self.evictions = 0
+
+    def get(self, corpus_id: str) -> Tuple[FaissStore, dict]:
+        """Return (store, manifest) for a corpus, loading or refreshing it if needed."""
+        entry = self._fresh(corpus_id)
+        if entry is not None:
+            return entry.store, entry.manifest
+
+        with self._corpus_lock(corpus_id):
+            entry = self._fresh(corpus_id)  # another thread may have refreshed meanwhile
+            if entry is not None:
+                return entry.store, entry.manifest
+            manifest = storage.load_manifest(corpus_id)
+            with self._lock:
+                entry = self._entries.get(corpus_id)
+            if entry is not None and _fingerprint(entry.manifest) == _fingerprint(manifest):
+                entry.checked_at = time.monotonic()
+                self.hits += 1
+                return entry.store, entry.manifest
+            try:
+                entry = self._refresh(corpus_id, entry, manifest) if entry is not None else None
+                if entry is None:
+                    entry = self._build(corpus_id, manifest)
+            except BaseException:
+                self.invalidate(corpus_id)  # the next get() rebuilds from the manifest
+                raise
+            self._insert(corpus_id, entry)
+            return entry.store, entry.manifest
+
+    def invalidate(self, corpus_id: Optional[str] = None) -> None:
+        with self._lock:
+            if corpus_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(corpus_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "corpora": len(self._entries),
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+            }
+
+    # ---------- internals ----------
+
+    def _corpus_lock(self, corpus_id: str) -> threading.Lock:
+        with self._lock:
+            return self._corpus_locks.setdefault(corpus_id, threading.Lock())
+
+    def _fresh(self, corpus_id: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(corpus_id)
+            if entry is None or time.monotonic() - entry.checked_at > self.revalidate_sec:
+                return None
+            self._entries.move_to_end(corpus_id)
+            self.hits += 1
+            return entry
+
+    def _build(self, corpus_id: str, manifest: dict) -> _Entry:
+        self.misses += 1
+        store = FaissStore(int(manifest["dim"]), manifest.get("index"))
+        store.bm25 = BM25Index()
+        for seg in storage.segments(manifest):
+            self._attach(corpus_id, store, seg)
+        index = storage.load_index(corpus_id, manifest)
+        if index is not None:
+            store.use_index(index)
+        return _Entry(store, manifest)
+
+    def _attach(self, corpus_id: str, store: FaissStore, seg: dict) -> None:
+        seg_id = seg["id"]
+        vecs, metas = storage.load_segment(corpus_id, seg_id)
+        store.attach(vecs, metas, scale=seg.get("scale"))  # float32 mmap'd on FS: no copy; float16/int8: codes only
+        postings = storage.load_postings(corpus_id, seg_id)
+        if postings is None:  # segment written before BM25 postings were persisted
+            postings = SegmentPostings.build(texts_of(metas))
+        store.bm25.add_segment(postings)
+
+    def _refresh(self, corpus_id: str, entry: _Entry, manifest: dict) -> Optional[_Entry]:
+        """A copy of the resident store with the newly appended segments; None if a full reload is needed."""
+        old, new = _segment_ids(entry.manifest), _segment_ids(manifest)
+        if int(manifest.get("dim", entry.store.dim)) != entry.store.dim or new[:len(old)] != old:
+            return None
+        if manifest.get("index") != entry.manifest.get("index"):
+            return None
+        self.refreshes += 1
+        store = entry.store.copy()
+        for seg in storage.segments(manifest)[len(old):]:
+            self._attach(corpus_id, store, seg)  # exact-search tail until retrained
+        if _index_name(manifest) != _index_name(entry.manifest):
+            index = storage.load_index(corpus_id, manifest)  # trained by ingest / compaction
+            if index is not None:
+                store.use_index(index)
+        return _Entry(store, manifest)
+
+    def _insert(self, corpus_id: str, entry: _Entry) -> None:
+        with self._lock:
+            self._entries[corpus_id] = entry
+            self._entries.move_to_end(corpus_id)
+            total = sum(e.nbytes for e in self._entries.values())
+            while total > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                total -= evicted.nbytes
+                self.evictions += 1
+
+
+_default_cache = CorpusCache()
+
+
+def get_store(corpus_id: str) -> Tuple[FaissStore, dict]:
+    """(store, manifest) for a corpus from the process-wide cache."""
+    return _default_cache.get(corpus_id)
+
+
+def train_index(corpus_id: str, manifest: Optional[dict] = None) -> Optional[dict]:
+    """
+    Train the corpus' IVF/HNSW index over all its rows and persist it for the workers'
+    caches to load. Runs on ingest / compaction, never on the query path. Returns the
+    published manifest, or None if the spec is flat, the corpus is below min_rows, or it
+    changed while training (the index was then stale).
+    """
+    manifest = manifest or storage.load_manifest(corpus_id)
+    store = FaissStore(int(manifest["dim"]), manifest.get("index"))
+    if not ann.can_build(store.index_spec, int(manifest.get("doc_count", 0))):
+        return None
+    for seg in storage.segments(manifest):
+        vecs, metas = storage.load_segment(corpus_id, seg["id"])
+        store.attach(vecs, metas, scale=seg.get("scale"))
+    if not store.build_index():
+        return None
+    return storage.save_index(corpus_id, store.index, _segment_ids(manifest), manifest.get("index"))
+
+
+def cache_stats() -> dict:
+    return _default_cache.stats()
+
+
+def invalidate(corpus_id: Optional[str] = None) -> None:
+    _default_cache.invalidate(corpus_id)
@@ -1,51 +1,235 @@
-from typing import List
+from typing import List, Optional, Tuple
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import openai
 from openai import OpenAI
 from newsrag_core.config import OPENAI_API_KEY
-from newsrag_cache import get_redis, key_embed, mget_json, mset_json
+from newsrag_cache import RateBudget, get_redis, get_redis_bytes, key_embed_bin, single_flight_many, tiered_mget_vectors, tiered_mset_vectors
+from .chunking import count_tokens
+from .microbatch import MicroBatcher
 
-_EMBED_MODEL = "text-embedding-3-small"
+_EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 EMBED_MODEL = _EMBED_MODEL
-__all__ = ["embed_texts", "embedding_dim", "EMBED_MODEL"]
-_client = OpenAI(api_key=OPENAI_API_KEY)
+__all__ = ["embed_texts", "embed_queries", "embedding_dim", "EMBED_MODEL", "EMBED_DIMENSIONS", "EMBED_DIMS"]
+_client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)  # retries are ours (rate budget + jittered backoff)
 
 EMBED_TTL = int(os.getenv("CACHE_EMBED_TTL_SEC", "2592000"))  # 30d
 ENABLE_CACHE = os.getenv("CACHE_ENABLE", "1") != "0"
+EMBED_CACHE_DTYPE = os.getenv("CACHE_EMBED_DTYPE", "float32")  # "float32" | "float16" (half the bytes)
+
+# Output width per model, so nobody has to embed a probe string to learn a constant.
+# text-embedding-3-* can also return fewer dimensions (the API's `dimensions` parameter:
+# a prefix of the full vector, re-normalized); EMBED_DIMENSIONS requests that for new
+# embeddings. Models missing here can be described with EMBED_DIM.
+EMBED_DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+_TRUNCATABLE = ("text-embedding-3-",)
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "0")) or None
+_EMBED_DIM = int(os.getenv("EMBED_DIM", "0")) or None
+
+# Request scheduling: misses are split into sub-batches of at most EMBED_BATCH_TOKENS tokens /
+# EMBED_BATCH_ITEMS inputs, sent EMBED_CONCURRENCY at a time under a tokens/requests-per-minute
+# budget shared by all workers through Redis (EMBED_TPM / EMBED_RPM; 0 disables a limit).
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_ITEMS = int(os.getenv("EMBED_BATCH_ITEMS", "512"))  # API max is 2048 inputs
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_SEC = float(os.getenv("EMBED_BACKOFF_SEC", "0.5"))
+EMBED_BACKOFF_MAX_SEC = float(os.getenv("EMBED_BACKOFF_MAX_SEC", "30"))
+
+# Query embeddings from concurrent tasks/threads of a worker are coalesced into one call:
+# requests queued while a call is in flight share the next one, which keeps taking arrivals
+# for up to EMBED_MICROBATCH_WINDOW_MS (up to EMBED_MICROBATCH_MAX texts); a request with no
+# company is sent at once. EMBED_MICROBATCH=0 sends each request on its own.
+EMBED_MICROBATCH = os.getenv("EMBED_MICROBATCH", "1") != "0"
+EMBED_MICROBATCH_WINDOW_MS = float(os.getenv("EMBED_MICROBATCH_WINDOW_MS", "10"))
+EMBED_MICROBATCH_MAX = int(os.getenv("EMBED_MICROBATCH_MAX", "64"))
+
+_budget = RateBudget(f"embed:{_EMBED_MODEL}", {"tokens": EMBED_TPM, "requests": EMBED_RPM})
+_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+stats = {"requests": 0, "inputs": 0, "tokens": 0, "retries": 0, "rate_limited": 0}
+
+
+def _reset_after_fork() -> None:
+    global _executor, _executor_lock
+    _executor, _executor_lock = None, threading.Lock()  # pool threads don't survive fork
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, EMBED_CONCURRENCY), thread_name_prefix="embed")
+    return _executor
 
 def _normalize_rows(arr: np.ndarray) -> np.ndarray:
     norms = np.linalg.norm(arr, axis=1, keepdims=True) + 1e-12
     return (arr / norms).astype("float32")
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Embedding with Redis cache. Returns L2-normalized vectors for cosine via IP."""
+def _sub_batches(texts: List[str]) -> List[List[int]]:
+    """Index lists of consecutive texts, each within EMBED_BATCH_TOKENS / EMBED_BATCH_ITEMS."""
+    batches, cur, used = [], [], 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t)
+        if cur and (used + n > EMBED_BATCH_TOKENS or len(cur) >= EMBED_BATCH_ITEMS):
+            batches.append(cur)
+            cur, used = [], 0
+        cur.append(i)
+        used += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+def _backoff(attempt: int, exc: BaseException) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it sends one."""
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), EMBED_BACKOFF_MAX_SEC) + random.uniform(0, EMBED_BACKOFF_SEC)
+    except ValueError:
+        pass
+    return random.uniform(0, min(EMBED_BACKOFF_MAX_SEC, EMBED_BACKOFF_SEC * (2 ** attempt)))
+
+def _native_dim(model: str = _EMBED_MODEL) -> Optional[int]:
+    return EMBED_DIMS.get(model) or (_EMBED_DIM if model == _EMBED_MODEL else None)
+
+def _dimensions(dimensions: Optional[int]) -> Optional[int]:
+    """
+    The `dimensions` to request: EMBED_DIMENSIONS unless given, None for the model's full
+    width (so full-width vectors share cache entries however they were asked for).
+    """
+    dims = EMBED_DIMENSIONS if dimensions is None else (int(dimensions) or None)
+    if dims is None or dims == _native_dim():
+        return None
+    if not _EMBED_MODEL.startswith(_TRUNCATABLE):
+        raise ValueError(f"{_EMBED_MODEL} does not support reduced dimensions (asked for {dims})")
+    native = _native_dim()
+    if dims < 1 or (native is not None and dims > native):
+        raise ValueError(f"{_EMBED_MODEL} returns at most {native} dimensions (asked for {dims})")
+    return dims
+
+def _cache_model(dims: Optional[int]) -> str:
+    return _EMBED_MODEL if dims is None else f"{_EMBED_MODEL}@{dims}"
+
+def _embed_request(texts: List[str], dims: Optional[int] = None) -> np.ndarray:
+    """One embeddings call under the shared rate budget, retried with backoff on 429 / transient errors."""
+    tokens = sum(count_tokens(t) for t in texts)
+    r = get_redis()
+    extra = {"dimensions": dims} if dims else {}
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        _budget.acquire({"tokens": tokens, "requests": 1}, r=r)
+        try:
+            res = _client.embeddings.create(model=_EMBED_MODEL, input=texts, **extra)
+        except _RETRYABLE as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            stats["retries"] += 1
+            if isinstance(e, openai.RateLimitError):
+                stats["rate_limited"] += 1
+            time.sleep(_backoff(attempt, e))
+            continue
+        stats["requests"] += 1
+        stats["inputs"] += len(texts)
+        stats["tokens"] += tokens
+        return _normalize_rows(np.array([d.embedding for d in res.data], dtype="float32"))
+
+def _embed_uncached(texts: List[str], dims: Optional[int] = None) -> np.ndarray:
+    """Embed texts (in order) with token-budgeted sub-batches sent concurrently."""
+    batches = _sub_batches(texts)
+    if len(batches) == 1:
+        return _embed_request(texts, dims)
+    parts = _get_executor().map(lambda idx: _embed_request([texts[i] for i in idx], dims), batches)
+    return np.vstack(list(parts))  # map() yields in submission order: rows stay aligned with texts
+
+def embed_texts(texts: List[str], dimensions: Optional[int] = None) -> np.ndarray:
+    """
+    Embedding with in-process L1 + Redis cache. Returns a float32 (N, dim) array of
+    L2-normalized vectors for cosine via IP.
+    dimensions: width to truncate to (default EMBED_DIMENSIONS; part of the cache key).
+    """
     if not texts:
-        return []
+        return np.empty((0, embedding_dim(dimensions)), dtype="float32")
+    dims = _dimensions(dimensions)
 
     if ENABLE_CACHE:
-        r = get_redis()
-        keys = [key_embed(_EMBED_MODEL, t) for t in texts]
-        cached = mget_json(r, keys)
+        r = get_redis_bytes()
+        model = _cache_model(dims)
+        keys = [key_embed_bin(model, t) for t in texts]
+        cached = tiered_mget_vectors(r, keys)  # L1, then MGET in chunks (binary vectors)
         missing_idx = [i for i, v in enumerate(cached) if v is None]
         if missing_idx:
-            to_embed = [texts[i] for i in missing_idx]
-            res = _client.embeddings.create(model=_EMBED_MODEL, input=to_embed)
-            new_vecs = np.array([d.embedding for d in res.data], dtype="float32")
-            new_vecs = _normalize_rows(new_vecs)
-            # write back to cache
-            mset_json(r, [(keys[i], new_vecs[j].tolist()) for j, i in enumerate(missing_idx)], ttl_sec=EMBED_TTL)
-            # merge into cached list
-            for j, i in enumerate(missing_idx):
-                cached[i] = new_vecs[j].tolist()
+            by_key = dict(zip(keys, texts))
+
+            def embed_and_store(miss_keys: List[str]) -> List[np.ndarray]:
+                new_vecs = _embed_uncached([by_key[k] for k in miss_keys], dims)
+                # write back to cache (L1 + pipelined SETEX) before waiters poll for it
+                tiered_mset_vectors(r, dict(zip(miss_keys, new_vecs)), ttl_sec=EMBED_TTL, dtype=EMBED_CACHE_DTYPE)
+                return list(new_vecs)
+
+            # Concurrent misses on the same text (this process or other workers) embed once
+            fresh = single_flight_many([keys[i] for i in missing_idx], embed_and_store,
+                                       lambda ks: tiered_mget_vectors(r, ks), r=r)
+            for i, v in zip(missing_idx, fresh):
+                cached[i] = v
         # All entries now present
-        return cached  # type: ignore[return-value]
+        return np.vstack(cached).astype("float32", copy=False)
 
     # No cache path
-    res = _client.embeddings.create(model=_EMBED_MODEL, input=texts)
-    arr = np.array([d.embedding for d in res.data], dtype="float32")
-    arr = _normalize_rows(arr)
-    return arr.tolist()
-
-def embedding_dim() -> int:
-    # single probe, cached by caller if needed
-    return len(embed_texts(["probe"])[0])
+    return _embed_uncached(texts, dims)
+
+def _embed_keyed(items: List[Tuple[str, Optional[int]]]) -> List[np.ndarray]:
+    """embed_texts() over (text, dims) pairs: one call per distinct width, rows in order."""
+    out: List[Optional[np.ndarray]] = [None] * len(items)
+    for dims in dict.fromkeys(d for _, d in items):
+        idx = [i for i, (_, d) in enumerate(items) if d == dims]
+        for i, v in zip(idx, embed_texts([items[i][0] for i in idx], dims if dims is not None else 0)):
+            out[i] = v
+    return out
+
+_query_batcher = MicroBatcher(lambda items: _embed_keyed(items), EMBED_MICROBATCH_WINDOW_MS,
+                              EMBED_MICROBATCH_MAX, name="embed-microbatch")
+
+
+def embed_queries(texts: List[str], dimensions: Optional[int] = None) -> np.ndarray:
+    """
+    embed_texts() for query-time callers: shares a batched call with concurrent requests.
+    Pass the corpus' width as `dimensions` so queries match its (possibly truncated) vectors.
+    """
+    if not EMBED_MICROBATCH:
+        return embed_texts(texts, dimensions)
+    dims = _dimensions(dimensions)
+    if not texts:
+        return embed_texts(texts, dimensions)
+    return np.vstack(_query_batcher([(t, dims) for t in texts]))
+
+def embedding_dim(dimensions: Optional[int] = None) -> int:
+    """
+    Width of the vectors embed_texts() returns, from the model registry (no API call).
+    Only a model that is neither registered nor described by EMBED_DIM is probed, once.
+    """
+    global _EMBED_DIM
+    dims = _dimensions(dimensions)
+    if dims is not None:
+        return dims
+    native = _native_dim()
+    if native is None:
+        native = _EMBED_DIM = len(embed_texts(["probe"])[0])
+    return native
+
+def embed_stats() -> dict:
+    """Request/retry counters of this process, query micro-batch sizes and the shared rate budget's waits."""
+    return {**stats, "microbatch": _query_batcher.stats(), "budget": _budget.stats()}
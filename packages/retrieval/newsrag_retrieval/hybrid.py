@@ -1,47 +1,112 @@
-from typing import List, Tuple
-from rank_bm25 import BM25Okapi
-import re
-from .embeddings import embed_texts
+import os
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from .bm25_index import BM25Index, texts_of, tokenize
+from .embeddings import embed_queries
 
-_token = re.compile(r"\w+")
+FUSION = os.getenv("HYBRID_FUSION", "minmax")  # "minmax" (alpha-weighted scores) | "rrf" (reciprocal rank)
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+OVERFETCH = int(os.getenv("HYBRID_OVERFETCH", "5"))  # vector candidates per result slot
 
-def _tok(s: str) -> List[str]:
-    return _token.findall(s.lower())
+def lexical_index(store) -> BM25Index:
+    """
+    The store's BM25 index. Stores from the corpus cache carry one built from the persisted
+    per-segment postings; for ad-hoc stores it is built once here and kept on the store.
+    """
+    bm25 = getattr(store, "bm25", None)
+    if bm25 is None or len(bm25) != store.ntotal():
+        bm25 = BM25Index.from_texts(list(texts_of(store.metas)))
+        store.bm25 = bm25
+    return bm25
+
+def _minmax(x: np.ndarray, lo: float, hi: float) -> np.ndarray:
+    return np.zeros_like(x) if hi == lo else (x - lo) / (hi - lo)
+
+def _ranks(scores: np.ndarray) -> np.ndarray:
+    """1-based rank of each entry when sorted by descending score."""
+    ranks = np.empty(scores.shape[0], dtype="int64")
+    ranks[np.argsort(-scores, kind="stable")] = np.arange(1, scores.shape[0] + 1)
+    return ranks
+
+def _gather(ids: np.ndarray, hit_ids: np.ndarray, hit_values: np.ndarray, default) -> np.ndarray:
+    """hit_values at the positions of `ids` in the sorted `hit_ids`; `default` where absent."""
+    out = np.full(ids.shape, default, dtype=hit_values.dtype)
+    if hit_ids.size:
+        pos = np.minimum(np.searchsorted(hit_ids, ids), hit_ids.size - 1)
+        found = hit_ids[pos] == ids
+        out[found] = hit_values[pos[found]]
+    return out
+
+def fuse(vec_ids: np.ndarray, vec_scores: np.ndarray, bm_ids: np.ndarray, bm_scores: np.ndarray,
+         n_docs: int, alpha: float = 0.6, fusion: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse one query's vector hits (row ids + scores, -1 ids ignored) with its sparse BM25 scores
+    (ascending row ids, from BM25Index.scores). Returns (row ids, fused scores), best first.
+
+    minmax: alpha * minmax(vector) + (1 - alpha) * minmax(BM25) over the vector candidates,
+            BM25 normalized over the whole corpus (rows without a query term score 0).
+    rrf:    alpha / (RRF_K + vector rank) + (1 - alpha) / (RRF_K + BM25 rank) over the union of
+            the vector candidates and the top BM25 rows; a missing list contributes 0.
+    """
+    fusion = fusion or FUSION
+    keep = vec_ids >= 0
+    vec_ids, vec_scores = vec_ids[keep].astype("int64"), vec_scores[keep].astype("float32")
+    if fusion == "rrf":
+        top_bm = bm_ids[np.argsort(-bm_scores, kind="stable")[:max(vec_ids.size, 1)]]
+        cand = np.concatenate([vec_ids, np.setdiff1d(top_bm, vec_ids, assume_unique=True)])
+        vrank = np.full(cand.shape, np.inf)
+        vrank[:vec_ids.size] = _ranks(vec_scores)
+        brank = _gather(cand, bm_ids, _ranks(bm_scores).astype("float64"), np.inf)
+        fused = alpha / (RRF_K + vrank) + (1 - alpha) / (RRF_K + brank)
+    elif fusion == "minmax":
+        if not vec_ids.size:
+            return vec_ids, vec_scores
+        cand = vec_ids
+        # Rows matching no query term score 0, so they set the BM25 minimum unless every row matches.
+        bmin = float(bm_scores.min()) if bm_ids.size == n_docs and bm_ids.size else 0.0
+        bmax = float(bm_scores.max()) if bm_ids.size else 0.0
+        b = _gather(cand, bm_ids, bm_scores, 0.0)
+        fused = (alpha * _minmax(vec_scores, float(vec_scores.min()), float(vec_scores.max()))
+                 + (1 - alpha) * _minmax(b, bmin, bmax))
+    else:
+        raise ValueError(f"Unknown fusion {fusion!r}; expected 'minmax' or 'rrf'")
+    order = np.argsort(-fused, kind="stable")
+    return cand[order], fused[order].astype("float32")
+
+def select(store, ids: np.ndarray, scores: np.ndarray, k: int,
+           max_per_url: Optional[int] = None) -> List[Tuple[dict, float]]:
+    """Top-k (meta, score) from ranked row ids, at most max_per_url chunks per source URL."""
+    out: List[Tuple[dict, float]] = []
+    per_url: dict = {}
+    for i, s in zip(ids.tolist(), scores.tolist()):
+        if max_per_url:
+            url = store.metas.url(i)
+            if per_url.get(url, 0) >= max_per_url:
+                continue
+            per_url[url] = per_url.get(url, 0) + 1
+        out.append((store.metas[i], float(s)))  # only selected rows are decoded
+        if len(out) >= k:
+            break
+    return out
+
+def fuse_hits(store, query: str, vec_scores: np.ndarray, vec_ids: np.ndarray, k: int = 8, alpha: float = 0.6,
+              max_per_url: Optional[int] = None, fusion: Optional[str] = None) -> List[Tuple[dict, float]]:
+    """Hybrid results for one query whose vector hits were already searched (e.g. one row of a batch)."""
+    bm_ids, bm_scores = lexical_index(store).scores(tokenize(query))
+    ids, fused = fuse(np.asarray(vec_ids), np.asarray(vec_scores), bm_ids, bm_scores,
+                      store.ntotal(), alpha, fusion)
+    return select(store, ids, fused, k, max_per_url)
 
-def hybrid_retrieve(query: str, store, k: int = 8, alpha: float = 0.6) -> List[Tuple[dict, float]]:
+def hybrid_retrieve(query: str, store, k: int = 8, alpha: float = 0.6, max_per_url: Optional[int] = None,
+                    fusion: Optional[str] = None, qvec: Optional[Sequence[float]] = None) -> List[Tuple[dict, float]]:
     """
     alpha: weight for vector score; (1-alpha) for BM25 score
+    fusion: "minmax" or "rrf" (default HYBRID_FUSION)
+    qvec: precomputed query embedding (skips the embeddings call)
     Returns list of (meta, combined_score)
     """
-    # Vector search
-    qvec = embed_texts([query])[0]
-    vec_hits = store.search(qvec, k=max(k*5, k))  # over-fetch
-
-    # BM25 over ALL docs in store.meta (uses text in meta)
-    corpus = [m.get("text", "") for m in store.meta]
-    tokenized = [ _tok(t) for t in corpus ]
-    bm25 = BM25Okapi(tokenized)
-    bm_scores = bm25.get_scores(_tok(query))
-
-    # Normalize both scores to [0,1] (simple min-max)
-    import numpy as np
-    vec_scores = np.array([s for _, s in vec_hits], dtype="float32")
-    if vec_scores.size == 0:
-        return []
-    vmin, vmax = float(vec_scores.min()), float(vec_scores.max())
-    def norm_v(s): return 0.0 if vmax==vmin else (s - vmin) / (vmax - vmin)
-
-    b = np.array(bm_scores, dtype="float32")
-    bmin, bmax = float(b.min()), float(b.max())
-    def norm_b(s): return 0.0 if bmax==bmin else (s - bmin) / (bmax - bmin)
-
-    # Combine: for each candidate from vector hits, mix with its BM25
-    combined = []
-    for meta, vscore in vec_hits:
-        idx = store.meta.index(meta)  # meta identity is preserved in list
-        score = alpha*norm_v(vscore) + (1-alpha)*norm_b(b[idx])
-        combined.append((meta, float(score)))
-
-    # sort & return top-k
-    combined.sort(key=lambda x: x[1], reverse=True)
-    return combined[:k]
+    if qvec is None:
+        qvec = embed_queries([query], dimensions=store.dim)[0]
+    q = np.asarray(qvec, dtype="float32").reshape(1, -1)
+    vec_scores, vec_ids = store.search(q, k=max(k * OVERFETCH, k))  # over-fetch
+    return fuse_hits(store, query, vec_scores[0], vec_ids[0], k, alpha, max_per_url, fusion)
@@ -1,28 +1,25 @@
-from typing import List, Tuple
-from newsrag_core.fetcher import fetch_article_text
-from .chunking import simple_chunks
-from .embeddings import embed_texts
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .neardup import NearDupIndex
+from .pipeline import run_ingest
 
-def ingest_urls(urls: List[str]) -> Tuple[list, list, list]:
+def ingest_urls(urls: List[str], indexed: Optional[Dict[str, str]] = None,
+                stats: Optional[Dict[str, Any]] = None, dedup: Optional[NearDupIndex] = None,
+                aliases: Optional[List[Tuple[str, Any]]] = None,
+                dimensions: Optional[int] = None) -> Tuple[np.ndarray, list, list]:
     """
-    Fetch each URL, chunk content, embed chunks.
-    Returns (vectors, metas, texts) in aligned order.
-    meta = { "url": str, "chunk": int, "text": str }
-    """
-    all_texts, metas = [], []
-    for url in urls:
-        try:
-            text = fetch_article_text(url)
-        except Exception as e:
-            # Skip bad URLs but continue the batch
-            print(f"[warn] failed to fetch {url}: {e}")
-            continue
-        for i, chunk in enumerate(simple_chunks(text)):
-            metas.append({"url": url, "chunk": i, "text": chunk})
-            all_texts.append(chunk)
-
-    if not all_texts:
-        return [], [], []
+    Fetch the URLs concurrently, extract + chunk pages in a process pool as they arrive, and
+    embed chunks in batches while later pages are still downloading (see pipeline.py).
+    Returns (vectors, metas, texts) in aligned order; vectors is a float32 (N, dim) array.
+    meta = { "url": str, "chunk": int, "text": str, "start": int, "end": int }
+    (start/end: character offsets of the chunk in the extracted page text; with dedup, also
+    "simhash", which storage.append() moves into the segment's simhash.npy)
 
-    vecs = embed_texts(all_texts)
-    return vecs, metas, all_texts
+    indexed: optional {url: content hash} of pages already in the target corpus. Pages whose
+    text hash is unchanged are skipped (no chunking/embedding); the dict is updated in place
+    with the hashes of the pages that were chunked.
+    stats: optional dict, filled in place with per-stage throughput.
+    dedup / aliases: near-duplicate chunk filtering, see pipeline.run_ingest().
+    dimensions: embedding width to request (default EMBED_DIMENSIONS, i.e. the model's full width).
+    """
+    return run_ingest(urls, indexed=indexed, stats=stats, dedup=dedup, aliases=aliases, dimensions=dimensions)
@@ -0,0 +1,220 @@
+# packages/retrieval/newsrag_retrieval/metastore.py
+"""
+Columnar chunk metadata for corpus segments (replaces pickled lists of meta dicts).
+
+A segment's metadata is three files:
+  meta.json  - unique urls, their titles, and sparse per-row extra keys
+  meta.npz   - int columns: url_idx, chunk, start/end (chunk char offsets in the page text,
+               -1 if unknown), text_start/text_end (byte span of each row in text.bin)
+  text.bin   - UTF-8 heap of chunk texts
+
+Consecutive chunks of a page that overlap (by their start/end offsets) share the overlapping
+bytes in the heap instead of storing them twice. Format-1 segments (text_off: N+1 offsets
+into a heap of back-to-back texts) are still read.
+
+Columns load eagerly (a few bytes per row); chunk text is decoded only for rows that are
+actually read, and on the filesystem the heap is memory-mapped.
+"""
+from __future__ import annotations
+
+import bisect
+import io
+import json
+import mmap
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+META_FILES = ("meta.json", "meta.npz", "text.bin")
+_COLUMNS = ("url", "chunk", "title", "text", "start", "end")  # everything else goes to the sparse extras
+
+Heap = Union[bytes, mmap.mmap]
+
+
+class MetaTable(Sequence):
+    """Read-only Sequence[dict] over one segment's columnar metadata."""
+
+    def __init__(self, urls: List[str], titles: List[Optional[str]], url_idx: np.ndarray,
+                 chunk: np.ndarray, text_start: np.ndarray, text_end: np.ndarray, heap: Heap,
+                 extras: Dict[int, dict], start: Optional[np.ndarray] = None, end: Optional[np.ndarray] = None):
+        self._urls = urls
+        self._titles = titles
+        self._url_idx = url_idx
+        self._chunk = chunk
+        self._text_start = text_start
+        self._text_end = text_end
+        self._heap = heap
+        self._extras = extras
+        self._start = start
+        self._end = end
+
+    def __len__(self) -> int:
+        return int(self._url_idx.shape[0])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        u = int(self._url_idx[i])
+        meta: Dict[str, Any] = {"url": self._urls[u], "chunk": int(self._chunk[i]), "text": self.text(i)}
+        if self._titles[u] is not None:
+            meta["title"] = self._titles[u]
+        if self._start is not None and self._start[i] >= 0:
+            meta["start"], meta["end"] = int(self._start[i]), int(self._end[i])
+        meta.update(self._extras.get(i, {}))
+        return meta
+
+    def url(self, i: int) -> str:
+        return self._urls[int(self._url_idx[i])]
+
+    def text(self, i: int) -> str:
+        a, b = int(self._text_start[i]), int(self._text_end[i])
+        return self._heap[a:b].decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        heap = 0 if isinstance(self._heap, mmap.mmap) else len(self._heap)
+        cols = (self._url_idx, self._chunk, self._text_start, self._text_end, self._start, self._end)
+        return sum(c.nbytes for c in cols if c is not None) + heap
+
+
+def encode(metas: Sequence[dict]) -> Dict[str, bytes]:
+    """Serialize meta dicts into {filename: bytes} for META_FILES."""
+    n = len(metas)
+    url_ids: Dict[str, int] = {}
+    titles: List[Optional[str]] = []
+    url_idx = np.empty(n, dtype="int32")
+    chunk = np.empty(n, dtype="int32")
+    start = np.full(n, -1, dtype="int64")
+    end = np.full(n, -1, dtype="int64")
+    text_start = np.empty(n, dtype="int64")
+    text_end = np.empty(n, dtype="int64")
+    heap = bytearray()
+    extras: Dict[str, dict] = {}
+    prev: Optional[tuple] = None  # (url, end offset, text) of the previous row, if it had offsets
+    for i, m in enumerate(metas):
+        url = m.get("url") or ""
+        if url not in url_ids:
+            url_ids[url] = len(url_ids)
+            titles.append(m.get("title"))
+        url_idx[i] = url_ids[url]
+        chunk[i] = int(m.get("chunk", i))
+        text = m.get("text") or ""
+        shared = ""
+        if m.get("start") is not None and m.get("end") is not None:
+            start[i], end[i] = int(m["start"]), int(m["end"])
+            if prev is not None and prev[0] == url:
+                ov = prev[1] - int(m["start"])  # chars this chunk repeats from the previous one
+                if 0 < ov <= min(len(text), len(prev[2])) and prev[2][-ov:] == text[:ov]:
+                    shared = text[:ov]
+            prev = (url, int(m["end"]), text)
+        else:
+            prev = None
+        tail = text[len(shared):].encode("utf-8")
+        text_start[i] = len(heap) - len(shared.encode("utf-8"))  # the shared bytes end the heap
+        heap += tail
+        text_end[i] = len(heap)
+        extra = {k: v for k, v in m.items() if k not in _COLUMNS}
+        if extra:
+            extras[str(i)] = extra
+    cols = io.BytesIO()
+    np.savez(cols, url_idx=url_idx, chunk=chunk, start=start, end=end, text_start=text_start, text_end=text_end)
+    header = {"format": 2, "rows": n, "urls": list(url_ids), "titles": titles, "extras": extras}
+    return {"meta.json": json.dumps(header).encode("utf-8"), "meta.npz": cols.getvalue(), "text.bin": bytes(heap)}
+
+
+def decode(read: Callable[[str], Any]) -> MetaTable:
+    """Build a MetaTable from `read(filename)`; text.bin may be bytes or an mmap."""
+    header = json.loads(read("meta.json"))
+    with np.load(io.BytesIO(read("meta.npz"))) as cols:
+        url_idx, chunk = cols["url_idx"], cols["chunk"]
+        if "text_off" in cols:  # format 1
+            text_off = cols["text_off"]
+            text_start, text_end, start, end = text_off[:-1], text_off[1:], None, None
+        else:
+            text_start, text_end, start, end = cols["text_start"], cols["text_end"], cols["start"], cols["end"]
+    extras = {int(k): v for k, v in header.get("extras", {}).items()}
+    return MetaTable(header["urls"], header["titles"], url_idx, chunk, text_start, text_end,
+                     read("text.bin"), extras, start, end)
+
+
+def write_dir(d: str, metas: Sequence[dict]) -> None:
+    for name, blob in encode(metas).items():
+        with open(os.path.join(d, name), "wb") as f:
+            f.write(blob)
+
+
+def read_dir(d: str, use_mmap: bool = True) -> MetaTable:
+    def read(name: str):
+        with open(os.path.join(d, name), "rb") as f:
+            if name == "text.bin" and use_mmap and os.fstat(f.fileno()).st_size:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return f.read()
+    return decode(read)
+
+
+class MetaList(Sequence):
+    """
+    Row-ordered concatenation of meta blocks (MetaTables from segments, plain lists from add()),
+    so a multi-segment store never has to decode or copy its metadata into one list.
+    """
+
+    def __init__(self, blocks: Iterable[Sequence[dict]] = ()):
+        self._blocks: List[Sequence[dict]] = []
+        self._starts: List[int] = []
+        self._n = 0
+        for b in blocks:
+            self.extend(b)
+
+    def extend(self, metas: Sequence[dict]) -> None:
+        if not len(metas):
+            return
+        if isinstance(metas, MetaTable):
+            self._blocks.append(metas)
+            self._starts.append(self._n)
+        elif self._blocks and isinstance(self._blocks[-1], list):
+            self._blocks[-1].extend(metas)
+        else:
+            self._blocks.append(list(metas))
+            self._starts.append(self._n)
+        self._n += len(metas)
+
+    def copy(self) -> "MetaList":
+        """A list that shares this one's MetaTables; extending either leaves the other as it was."""
+        out = MetaList()
+        out._blocks = [list(b) if isinstance(b, list) else b for b in self._blocks]
+        out._starts, out._n = list(self._starts), self._n
+        return out
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _locate(self, i: int):
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        b = bisect.bisect_right(self._starts, i) - 1
+        return self._blocks[b], i - self._starts[b]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        block, j = self._locate(i)
+        return block[j]
+
+    def url(self, i: int) -> Optional[str]:
+        block, j = self._locate(i)
+        return block.url(j) if isinstance(block, MetaTable) else block[j].get("url")
+
+    def text(self, i: int) -> str:
+        block, j = self._locate(i)
+        return block.text(j) if isinstance(block, MetaTable) else (block[j].get("text") or "")
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._blocks if isinstance(b, MetaTable))
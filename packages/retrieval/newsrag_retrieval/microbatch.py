@@ -0,0 +1,128 @@
+# packages/retrieval/newsrag_retrieval/microbatch.py
+"""
+Request coalescing for query-time calls.
+
+Query embeddings are requested one question at a time by concurrent tasks and threads;
+each one would otherwise be its own API round trip. A MicroBatcher makes a single call on
+the union of the queued requests' inputs (duplicates sent once) and hands every caller back
+its own slice of the results, in order.
+
+A request that finds nobody else waiting is sent at once, so a lone caller pays no added
+latency. One collector thread per batcher makes the calls, so while a batch is in flight
+the next one accumulates; when it is collected with other requests already queued, the
+batcher keeps taking arrivals for up to window_ms (or until max_items inputs are waiting).
+Under load, batches grow towards max_items instead of requests queueing one by one.
+Errors are re-raised in every caller of the failed batch.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+_batchers: "weakref.WeakSet[MicroBatcher]" = weakref.WeakSet()
+
+
+class MicroBatcher:
+    """Coalesces concurrent submit() calls into one fn(inputs) -> results call per window."""
+
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], window_ms: float = 10.0,
+                 max_items: int = 64, name: str = "microbatch"):
+        self.fn = fn
+        self.window_sec = max(0.0, window_ms) / 1000.0
+        self.max_items = max(1, max_items)
+        self.name = name
+        self._reset()
+        self.batches = 0
+        self.items = 0
+        self.requests = 0
+        self.max_batch = 0
+        self.last_batch = 0
+        _batchers.add(self)
+
+    def _reset(self) -> None:
+        self._queue: "queue.Queue[Tuple[List[Any], Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, inputs: Sequence[Any]) -> "Future[List[Any]]":
+        """Queue inputs for the next batch; the future resolves to their results, in order."""
+        fut: Future = Future()
+        if not inputs:
+            fut.set_result([])
+            return fut
+        self._ensure_thread()
+        self._queue.put((list(inputs), fut))
+        return fut
+
+    def __call__(self, inputs: Sequence[Any]) -> List[Any]:
+        return self.submit(inputs).result()
+
+    def _collect(self) -> List[Tuple[List[Any], Future]]:
+        pending = [self._queue.get()]
+        n = len(pending[0][0])
+        deadline = time.monotonic() + self.window_sec
+        while n < self.max_items:
+            try:
+                req = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if len(pending) == 1 or remaining <= 0:
+                    break  # nobody else was waiting: don't hold a lone request back
+                try:
+                    req = self._queue.get(timeout=remaining)  # requests are still arriving
+                except queue.Empty:
+                    break
+            pending.append(req)
+            n += len(req[0])
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            pending = self._collect()
+            unique: Dict[Any, int] = {}
+            for inputs, _ in pending:
+                for x in inputs:
+                    unique.setdefault(x, len(unique))
+            try:
+                results = list(self.fn(list(unique)))
+                outs = [[results[unique[x]] for x in inputs] for inputs, _ in pending]
+            except BaseException as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(pending)
+            self.items += len(unique)
+            self.last_batch = len(unique)
+            self.max_batch = max(self.max_batch, len(unique))
+            for (_, fut), out in zip(pending, outs):
+                fut.set_result(out)
+
+    def stats(self) -> Dict[str, Any]:
+        """Achieved batch sizes: inputs per call (avg/max/last) and requests coalesced per call."""
+        return {"window_ms": round(self.window_sec * 1000, 3), "max_items": self.max_items,
+                "batches": self.batches, "requests": self.requests, "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "avg_requests": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch, "last_batch": self.last_batch}
+
+
+def _reset_after_fork() -> None:
+    for b in list(_batchers):
+        b._reset()  # the collector thread and anything queued belong to the parent
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,235 @@
+# packages/retrieval/newsrag_retrieval/neardup.py
+"""
+Near-duplicate chunk detection with 64-bit SimHash.
+
+Syndicated wire stories reach a corpus through many outlets (and through overlapping feed
+sources) under different URLs. Before embedding, each chunk's SimHash (over word
+3-shingles) is looked up in the corpus' near-dup index. A chunk within DEDUP_MAX_HAMMING
+bits of an indexed one is dropped, and its URL is recorded as an alias of the surviving chunk.
+
+Storage: each segment persists its rows' hashes as simhash.npy (uint64, 0 = too short to
+hash) next to its other files; legacy segments are hashed from their text on first use.
+Chunks hashed during ingest carry their hash in meta[SIMHASH_KEY], which the segment writer
+takes (and strips) instead of hashing the text again.
+Lookups use the pigeonhole trick: the 64 bits are cut into DEDUP_MAX_HAMMING + 1 bands, so
+any hash within the distance matches at least one band exactly. Bands are kept as sorted
+numpy arrays per segment (a few bytes per row) and searched with searchsorted.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEDUP_ENABLE = os.getenv("DEDUP_ENABLE", "1") != "0"
+# Copies whose chunk boundaries are shifted by a sentence (an extra byline, say) are ~6 bits
+# apart; unrelated chunks ~32.
+DEDUP_MAX_HAMMING = int(os.getenv("DEDUP_MAX_HAMMING", "6"))
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "3"))
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "16"))  # shorter chunks are never deduplicated
+# Corpora whose index a worker keeps resident; least recently used ones are dropped first
+DEDUP_MAX_CORPORA = int(os.getenv("DEDUP_MAX_CORPORA", "16"))
+
+SIMHASH_FILE = "simhash.npy"
+SIMHASH_KEY = "simhash"  # per-chunk hash in ingest metas, consumed by the segment writer
+
+_WORD = re.compile(r"\w+")
+_popcount = getattr(np, "bitwise_count", None)
+
+
+def simhash(text: str, shingle: int = DEDUP_SHINGLE_WORDS, min_words: int = DEDUP_MIN_WORDS) -> int:
+    """64-bit SimHash of a text's word shingles; 0 if it has fewer than min_words words."""
+    words = _WORD.findall(text.lower())
+    if len(words) < max(1, min_words):
+        return 0
+    n = min(shingle, len(words))
+    digests = b"".join(hashlib.blake2b(" ".join(words[i:i + n]).encode("utf-8"), digest_size=8).digest()
+                       for i in range(len(words) - n + 1))
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = (bits.sum(axis=0) * 2 > bits.shape[0]).astype(np.uint8)
+    return int(np.packbits(majority, bitorder="little").view("<u8")[0]) or 1  # 0 is reserved
+
+
+def simhashes(texts: Iterable[str]) -> np.ndarray:
+    return np.fromiter((simhash(t) for t in texts), dtype=np.uint64)
+
+
+def encode(hashes: np.ndarray) -> bytes:
+    b = io.BytesIO()
+    np.save(b, np.asarray(hashes, dtype=np.uint64))
+    return b.getvalue()
+
+
+def decode(blob: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(blob))
+
+
+def _hamming(a: np.ndarray, h: int) -> np.ndarray:
+    x = a ^ np.uint64(h)
+    if _popcount is not None:
+        return _popcount(x)
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _bands(max_hamming: int) -> List[Tuple[int, int]]:
+    """(shift, mask) of max_hamming + 1 bit bands covering 64 bits."""
+    n = max(1, min(max_hamming + 1, 64))
+    width, out, shift = 64 // n, [], 0
+    for i in range(n):
+        w = width if i < n - 1 else 64 - shift
+        out.append((shift, (1 << w) - 1))
+        shift += w
+    return out
+
+
+class _Block:
+    """One segment's hashes with a sorted copy of each band for exact band lookups."""
+
+    def __init__(self, key: Any, hashes: np.ndarray, bands: List[Tuple[int, int]]):
+        self.key = key
+        self.hashes = hashes
+        self.sorted: List[Tuple[np.ndarray, np.ndarray]] = []
+        valid = np.flatnonzero(hashes)
+        for shift, mask in bands:
+            vals = (hashes[valid] >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(vals, kind="stable")
+            self.sorted.append((vals[order], valid[order].astype(np.int64)))
+
+    def find(self, h: int, bands: List[Tuple[int, int]], max_hamming: int) -> Optional[int]:
+        best, best_d = None, max_hamming + 1
+        for (shift, mask), (vals, rows) in zip(bands, self.sorted):
+            v = np.uint64((h >> shift) & mask)
+            lo, hi = np.searchsorted(vals, v, "left"), np.searchsorted(vals, v, "right")
+            if lo == hi:
+                continue
+            cand = rows[lo:hi]
+            d = _hamming(self.hashes[cand], h)
+            i = int(np.argmin(d))
+            if d[i] < best_d:
+                best, best_d = int(cand[i]), int(d[i])
+        return best
+
+    @property
+    def nbytes(self) -> int:
+        return self.hashes.nbytes + sum(v.nbytes + r.nbytes for v, r in self.sorted)
+
+
+class NearDupIndex:
+    """
+    SimHash index over persisted blocks (one per segment) plus entries added by the
+    current batch. find() returns the ref of the nearest indexed chunk within
+    max_hamming bits: (block key, row) for block rows, or whatever ref was given to add().
+    """
+
+    def __init__(self, max_hamming: int = DEDUP_MAX_HAMMING):
+        self.max_hamming = max_hamming
+        self._bands = _bands(max_hamming)
+        self._blocks: List[_Block] = []
+        self._recent: Dict[Tuple[int, int], List[Tuple[int, Any]]] = {}
+
+    def add_block(self, key: Any, hashes: np.ndarray) -> None:
+        self._blocks.append(_Block(key, np.asarray(hashes, dtype=np.uint64), self._bands))
+
+    def block_keys(self) -> List[Any]:
+        return [b.key for b in self._blocks]
+
+    def add(self, h: int, ref: Any) -> None:
+        if not h:
+            return
+        for i, (shift, mask) in enumerate(self._bands):
+            self._recent.setdefault((i, (h >> shift) & mask), []).append((h, ref))
+
+    def find(self, h: int) -> Optional[Any]:
+        if not h:
+            return None
+        best, best_d = None, self.max_hamming + 1
+        seen = set()
+        for i, (shift, mask) in enumerate(self._bands):
+            for other, ref in self._recent.get((i, (h >> shift) & mask), ()):
+                if id(ref) in seen:
+                    continue
+                seen.add(id(ref))
+                d = bin(h ^ other).count("1")
+                if d < best_d:
+                    best, best_d = ref, d
+        if best is not None:
+            return best
+        for block in self._blocks:
+            row = block.find(h, self._bands, self.max_hamming)
+            if row is not None:
+                return block.key, row
+        return None
+
+    def batch(self) -> "NearDupIndex":
+        """A view sharing this index's blocks, for one ingest batch's own add()s."""
+        view = NearDupIndex(self.max_hamming)
+        view._blocks = list(self._blocks)
+        return view
+
+    def __len__(self) -> int:
+        return sum(int(np.count_nonzero(b.hashes)) for b in self._blocks) + \
+            len({id(r) for refs in self._recent.values() for _, r in refs})
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._blocks)
+
+
+# -------------------------
+# Per-corpus indexes (one per worker process)
+# -------------------------
+
+_indexes: "OrderedDict[str, NearDupIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def corpus_index(corpus_id: str) -> NearDupIndex:
+    """
+    The near-dup index of a corpus' published segments (empty for a new corpus). Cached per
+    process; newly appended segments are loaded incrementally, compaction triggers a rebuild.
+    """
+    from . import storage
+
+    try:
+        manifest = storage.load_manifest(corpus_id)
+    except FileNotFoundError:
+        return NearDupIndex()
+    seg_ids = [s["id"] for s in storage.segments(manifest)]
+    with _lock:
+        index = _indexes.get(corpus_id)
+        if index is None or index.block_keys() != seg_ids[:len(index.block_keys())]:
+            index = _indexes[corpus_id] = NearDupIndex()
+        _indexes.move_to_end(corpus_id)
+        while len(_indexes) > max(1, DEDUP_MAX_CORPORA):
+            _indexes.popitem(last=False)
+        for sid in seg_ids[len(index.block_keys()):]:
+            index.add_block(sid, storage.load_simhashes(corpus_id, sid))
+        return index
+
+
+def resolve(corpus_id: str, refs: Sequence[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """(url, chunk) of the surviving chunks behind block refs (segment id, row)."""
+    from . import storage
+
+    out, by_seg = [], {}
+    for sid, row in refs:
+        if sid not in by_seg:
+            by_seg[sid] = storage.load_metas(corpus_id, sid)  # no vectors needed
+        meta = by_seg[sid][row]
+        out.append((meta.get("url"), int(meta.get("chunk", row))))
+    return out
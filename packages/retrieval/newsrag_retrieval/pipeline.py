@@ -0,0 +1,365 @@
+# packages/retrieval/newsrag_retrieval/pipeline.py
+"""
+Staged ingest pipeline: fetch -> extract/chunk -> embed, with bounded queues in between.
+
+  fetch    (thread)   fetch_raw(): async HTTP on the shared client, pages in completion order
+  process  (pool)     HTML extraction + chunking in INGEST_PROCESSES worker processes; the
+                      calling thread only dispatches work and writes page-cache records
+  embed    (thread)   chunks batched into INGEST_EMBED_BATCH-text embed_texts() calls
+
+With a near-dup index (neardup.py), chunks are SimHashed in the process stage and
+near-copies of indexed or earlier chunks are dropped before they reach the embed stage.
+
+Network waits, CPU-bound parsing and embedding round trips overlap instead of serializing,
+and a slow stage back-pressures the one before it (queues hold INGEST_QUEUE_SIZE items).
+The pool also starts inside daemonic workers (Celery's prefork children): its processes are
+launched with the caller's daemon flag lifted, since they are shut down with the pool anyway.
+With INGEST_PROCESSES=0, or if the pool breaks, extraction runs inline in the calling
+thread; the other stages still overlap.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import forkserver
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from newsrag_core.extract import extract_text
+from newsrag_core.fetcher import Fetched, fetch_raw, finish_page
+
+from .chunking import Chunk, token_chunks
+from .embeddings import embed_texts
+from .neardup import SIMHASH_KEY, NearDupIndex, simhash
+
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", str(min(4, os.cpu_count() or 1))))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+# forkserver/spawn: never fork a process that runs the fetch loop and Redis pool threads
+INGEST_MP_CONTEXT = os.getenv("INGEST_MP_CONTEXT",
+                              "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+
+_DONE = object()
+
+
+def _process(body: Optional[str], text: Optional[str],
+             hashed: bool = False) -> Tuple[str, List[Chunk], Optional[List[int]], float]:
+    """
+    Pool job: extract text from an HTML body (unless given), chunk it and, if `hashed`,
+    SimHash the chunks. Returns (text, chunks, hashes, seconds).
+    """
+    t = time.perf_counter()
+    if text is None:
+        try:
+            text = extract_text(body or "")
+        except Exception:
+            text = ""
+    chunks = list(token_chunks(text)) if text else []
+    hashes = [simhash(c.text) for c in chunks] if hashed else None
+    return text, chunks, hashes, time.perf_counter() - t
+
+
+# -------------------------
+# Process pool (one per worker process, created lazily)
+# -------------------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_failed = False
+_pool_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _pool, _pool_failed, _pool_lock
+    _pool, _pool_failed, _pool_lock = None, False, threading.Lock()  # pool processes belong to the parent
+    fs = getattr(forkserver, "_forkserver", None)
+    if getattr(fs, "_forkserver_pid", None) is not None:
+        # so does the parent's fork server (waitpid() on it fails here): start our own on first use
+        try:
+            os.close(fs._forkserver_alive_fd)
+        except (OSError, TypeError):
+            pass
+        fs._forkserver_pid = fs._forkserver_address = fs._forkserver_alive_fd = None
+        fs._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _PoolProcess(mp.get_context(INGEST_MP_CONTEXT).Process):
+    """
+    INGEST_MP_CONTEXT process that may be started from a daemonic process. multiprocessing
+    refuses children of daemonic processes ("daemonic processes are not allowed to have
+    children") because they'd be orphaned on exit; pool processes are joined by
+    shutdown_pool() / the interpreter's executor atexit hook instead.
+    """
+
+    def start(self):
+        config = mp.current_process()._config
+        daemon = config.pop("daemon", None)
+        try:
+            super().start()
+        finally:
+            if daemon is not None:
+                config["daemon"] = daemon
+
+
+class _PoolContext(type(mp.get_context(INGEST_MP_CONTEXT))):
+    Process = _PoolProcess
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool, _pool_failed
+    if INGEST_PROCESSES <= 0 or _pool_failed:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None and not _pool_failed:
+                try:
+                    _pool = ProcessPoolExecutor(INGEST_PROCESSES, mp_context=_PoolContext())
+                except Exception as e:
+                    print(f"[warn] ingest process pool unavailable ({e!r}); extracting inline")
+                    _pool_failed = True
+    return _pool
+
+
+def _pool_broke(e: BaseException) -> None:
+    global _pool, _pool_failed
+    print(f"[warn] ingest process pool failed ({e!r}); extracting inline")
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_failed = None, True
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+
+
+# -------------------------
+# Stage bookkeeping
+# -------------------------
+
+class _Stage:
+    """
+    Items handled and time spent working, excluding waits on neighbouring stages
+    (for the process stage: summed over pool processes, so items_per_sec is per process).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.t0 = self.t1 = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"items": self.items, "busy_sec": round(self.busy, 4), "wall_sec": round(self.t1 - self.t0, 4),
+                "items_per_sec": round(self.items / self.busy, 2) if self.busy > 0 else 0.0}
+
+
+def _fetch_stage(urls: List[str], out: "queue.Queue", stage: _Stage, stop: threading.Event,
+                 errors: List[BaseException]) -> None:
+    stage.t0 = time.perf_counter()
+    try:
+        t = time.perf_counter()
+        for item in fetch_raw(urls):
+            stage.busy += time.perf_counter() - t
+            stage.items += 1
+            if stop.is_set():
+                break
+            out.put(item)  # blocks while the process stage is behind
+            t = time.perf_counter()
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        stage.t1 = time.perf_counter()
+        out.put(_DONE)
+
+
+def _embed_stage(inq: "queue.Queue", stage: _Stage, vecs: list, metas: list, batch_size: int,
+                 errors: List[BaseException], dimensions: Optional[int] = None) -> None:
+    stage.t0 = time.perf_counter()
+    pending: List[dict] = []
+
+    def flush(batch: List[dict]) -> None:
+        if errors:
+            return  # keep draining so upstream never blocks, but stop calling the API
+        t = time.perf_counter()
+        try:
+            vecs.append(embed_texts([m["text"] for m in batch], dimensions))
+            metas.extend(batch)
+        except BaseException as e:
+            errors.append(e)
+        stage.busy += time.perf_counter() - t
+        stage.items += len(batch)
+
+    while True:
+        item = inq.get()
+        if item is _DONE:
+            break
+        pending.extend(item)
+        while len(pending) >= batch_size:
+            flush(pending[:batch_size])
+            pending = pending[batch_size:]
+    if pending:
+        flush(pending)
+    stage.t1 = time.perf_counter()
+
+
+def run_ingest(urls: List[str], indexed: Optional[Dict[str, str]] = None,
+               stats: Optional[Dict[str, Any]] = None, inline: bool = False,
+               embed_batch: int = INGEST_EMBED_BATCH, dedup: Optional[NearDupIndex] = None,
+               aliases: Optional[List[Tuple[str, Any]]] = None,
+               dimensions: Optional[int] = None) -> Tuple[np.ndarray, list, list]:
+    """
+    (vectors, metas, texts) for the URLs; see ingest.ingest_urls(). vectors is one float32
+    (N, dim) array. `stats`, if given, is
+    filled with per-stage throughput: {"fetch"|"process"|"embed": {items, busy_sec, wall_sec,
+    items_per_sec}, "pool": "process:N" | "inline", "wall_sec", "dedup": {...}}.
+    inline=True skips the process pool for this call.
+
+    dedup: near-dup index to check chunks against (and add this batch's chunks to). A
+    near-copy of a chunk from this batch adds its URL to that chunk's meta["alt_urls"];
+    a near-copy of an indexed chunk appends (url, ref) to `aliases` (ref as from dedup.find()).
+    dimensions: embedding width (see embeddings.embed_texts()).
+    """
+    t_start = time.perf_counter()
+    fetch_st, proc_st, embed_st = _Stage("fetch"), _Stage("process"), _Stage("embed")
+    fetched: "queue.Queue" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    chunks: "queue.Queue" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stop = threading.Event()
+    fetch_errors: List[BaseException] = []
+    embed_errors: List[BaseException] = []
+    vecs: List[np.ndarray] = []  # one (batch, dim) array per embed_texts() call
+    metas: list = []
+
+    fetcher = threading.Thread(target=_fetch_stage, args=(urls, fetched, fetch_st, stop, fetch_errors),
+                               name="ingest-fetch", daemon=True)
+    embedder = threading.Thread(target=_embed_stage, args=(chunks, embed_st, vecs, metas, max(1, embed_batch),
+                                                           embed_errors, dimensions),
+                                name="ingest-embed", daemon=True)
+    fetcher.start()
+    embedder.start()
+
+    pool = None if inline else _get_pool()
+    max_inflight = 2 * max(1, INGEST_PROCESSES)
+    inflight: Dict[Future, Fetched] = {}
+    hashed = dedup is not None
+    dropped = 0
+
+    def keep(url: str, meta: dict, h: int) -> bool:
+        nonlocal dropped
+        ref = dedup.find(h)
+        if ref is None:
+            dedup.add(h, meta)
+            return True
+        dropped += 1
+        if isinstance(ref, dict):  # survivor from this batch
+            if ref["url"] != url and url not in ref.setdefault("alt_urls", []):
+                ref["alt_urls"].append(url)
+        elif aliases is not None:
+            aliases.append((url, ref))
+        return False
+
+    def emit(item: Fetched, text: Optional[str] = None, page_chunks: Optional[List[Chunk]] = None,
+             hashes: Optional[List[int]] = None) -> None:
+        t = time.perf_counter()
+        page = finish_page(item, text)
+        proc_st.items += 1
+        if not page.text:
+            # Skip bad URLs but continue the batch
+            print(f"[warn] failed to fetch {page.url}")
+        elif indexed is not None and indexed.get(page.url) == page.content_hash:
+            pass  # resurfaced article, same content: nothing to re-embed
+        else:
+            if indexed is not None:
+                indexed[page.url] = page.content_hash
+            if page_chunks is None:  # cached / 304 text: chunk it here
+                _, page_chunks, hashes, _ = _process(None, page.text, hashed)
+            metas_out = [{"url": page.url, "chunk": i, "text": c.text, "start": c.start, "end": c.end}
+                         for i, c in enumerate(page_chunks)]
+            if hashed:
+                for m, h in zip(metas_out, hashes):
+                    m[SIMHASH_KEY] = h  # persisted by the segment writer instead of rehashing
+                metas_out = [m for m, h in zip(metas_out, hashes) if keep(page.url, m, h)]
+            if metas_out:
+                chunks.put(metas_out)
+        proc_st.busy += time.perf_counter() - t
+
+    def run_inline(item: Fetched) -> None:
+        text, page_chunks, hashes, secs = _process(item.response.body, None, hashed)
+        proc_st.busy += secs
+        emit(item, text, page_chunks, hashes)
+
+    def collect(futures) -> None:
+        nonlocal pool
+        for fut in futures:
+            item = inflight.pop(fut)
+            try:
+                text, page_chunks, hashes, secs = fut.result()
+            except Exception as e:  # BrokenProcessPool & co: redo this page inline
+                if pool is not None:
+                    _pool_broke(e)
+                    pool = None
+                run_inline(item)
+                continue
+            proc_st.busy += secs
+            emit(item, text, page_chunks, hashes)
+
+    proc_st.t0 = time.perf_counter()
+    try:
+        while True:
+            item = fetched.get()
+            if item is _DONE:
+                break
+            if not item.needs_extraction:
+                emit(item)  # cached / 304 / same body / failed: no HTML to parse
+            elif pool is None:
+                run_inline(item)
+            else:
+                try:
+                    inflight[pool.submit(_process, item.response.body, None, hashed)] = item
+                except Exception as e:
+                    _pool_broke(e)
+                    pool = None
+                    run_inline(item)
+                    continue
+                if len(inflight) >= max_inflight:
+                    collect(wait(list(inflight), return_when=FIRST_COMPLETED)[0])
+                else:
+                    collect([f for f in list(inflight) if f.done()])
+        if inflight:
+            collect(wait(list(inflight))[0])
+    finally:
+        stop.set()
+        while fetcher.is_alive():  # unblock the fetch thread if we bailed out early
+            try:
+                fetched.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        proc_st.t1 = time.perf_counter()
+        chunks.put(_DONE)
+        embedder.join()
+
+    if stats is not None:
+        stats.update({"fetch": fetch_st.stats(), "process": proc_st.stats(), "embed": embed_st.stats(),
+                      "pool": f"process:{INGEST_PROCESSES}" if pool is not None else "inline",
+                      "wall_sec": round(time.perf_counter() - t_start, 4)})
+        if hashed:
+            stats["dedup"] = {"dropped": dropped, "kept": len(metas)}
+    if fetch_errors:
+        raise fetch_errors[0]
+    if embed_errors:
+        raise embed_errors[0]
+    if not metas:
+        return np.empty((0, 0), dtype="float32"), [], []
+    return np.vstack(vecs), metas, [m["text"] for m in metas]
@@ -0,0 +1,90 @@
+# packages/retrieval/newsrag_retrieval/quantize.py
+"""
+Compact storage for corpus vectors.
+
+A corpus picks its vector dtype when it is created (manifest["vector_dtype"]):
+  float32   4 bytes/dim, as embedded (default)
+  float16   2 bytes/dim
+  int8      1 byte/dim, symmetric scalar quantization: x ~= q * scale, q in [-127, 127]
+Every segment is encoded on write; int8 segments record their scale in their manifest
+entry (rows are L2-normalized, so one scale per segment, max|x| / 127, loses little).
+
+Resident stores don't expand compact segments back to float32: a CompactBlock keeps the
+stored array as loaded (a read-only memmap on FS, so worker processes share the page cache)
+and search decodes it DECODE_CHUNK_MB at a time into a scratch float32 buffer for faiss.knn.
+decode() gives float32 back for anything that needs the whole matrix (compaction, ANN training).
+"""
+from __future__ import annotations
+
+import os
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")  # default for newly created corpora
+# float32 scratch per search step over a compact block (bounds the transient decode copy)
+DECODE_CHUNK_MB = float(os.getenv("VECTOR_DECODE_CHUNK_MB", "16"))
+
+
+def check_dtype(dtype: Optional[str]) -> str:
+    dtype = dtype or "float32"
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype {dtype!r}; expected one of {list(VECTOR_DTYPES)}")
+    return dtype
+
+
+def encode(vecs: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[float]]:
+    """(stored array, scale) for float32 rows; scale is None except for int8."""
+    dtype = check_dtype(dtype)
+    vecs = np.asarray(vecs, dtype="float32")
+    if dtype == "float32":
+        return vecs, None
+    if dtype == "float16":
+        return vecs.astype(np.float16), None
+    peak = float(np.abs(vecs).max()) if vecs.size else 0.0
+    scale = (peak or 1.0) / 127.0
+    return np.clip(np.rint(vecs / scale), -127, 127).astype(np.int8), scale
+
+
+def decode(stored: np.ndarray, scale: Optional[float] = None) -> np.ndarray:
+    """float32 rows back from a stored array (float32 input is returned as is)."""
+    if stored.dtype == np.int8:
+        if scale is None:
+            raise ValueError("int8 vectors need their scale (manifest segment entry)")
+        return stored.astype("float32") * np.float32(scale)
+    return stored if stored.dtype == np.float32 else stored.astype("float32")
+
+
+def is_compact(stored: np.ndarray) -> bool:
+    return stored.dtype in (np.int8, np.float16)
+
+
+class CompactBlock:
+    """
+    A float16 / int8 block as stored (int8 with its segment scale), decoded to float32 one
+    chunk of rows at a time; the codes are never copied, so a memmap stays shared.
+    """
+    __slots__ = ("codes", "scale")
+
+    def __init__(self, codes: np.ndarray, scale: Optional[float] = None):
+        if codes.dtype == np.int8 and scale is None:
+            raise ValueError("int8 vectors need their scale (manifest segment entry)")
+        if not is_compact(codes):
+            raise ValueError(f"Not a compact vector dtype: {codes.dtype}")
+        self.codes = codes
+        self.scale = scale
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.codes.shape
+
+    def decode(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        return decode(self.codes[start:stop], self.scale)
+
+    def chunks(self, start: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+        """(row offset, float32 rows) for rows [start, N), DECODE_CHUNK_MB of float32 at a time."""
+        n, dim = self.codes.shape
+        step = max(1, int(DECODE_CHUNK_MB * 2**20) // (4 * max(1, dim)))
+        for a in range(start, n, step):
+            yield a, self.decode(a, min(a + step, n))
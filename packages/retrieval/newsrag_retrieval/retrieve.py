@@ -1,6 +1,7 @@
 from typing import List, Tuple
-from .embeddings import embed_texts
+from .embeddings import embed_queries
 
 def retrieve(query: str, store, k: int = 8) -> List[Tuple[dict, float]]:
-    qvec = embed_texts([query])[0]
-    return store.search(qvec, k=k)
+    qvec = embed_queries([query], dimensions=store.dim)
+    scores, idx = store.search(qvec, k=k)
+    return [(store.metas[i], float(s)) for i, s in zip(idx[0].tolist(), scores[0].tolist()) if i >= 0]
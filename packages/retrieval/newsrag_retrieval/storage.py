@@ -1,29 +1,288 @@
-import os, io, json, pickle
-from typing import Tuple, List
+import os, io, json, pickle, shutil, time, uuid, contextlib
+from typing import Tuple, List, Optional, Sequence
 import numpy as np
 
+from newsrag_cache import get_redis, key_corpus_version
+
+from . import bm25_index, metastore, neardup, quantize
+from .metastore import MetaList
+
+try:
+    import fcntl  # POSIX only; used to serialize manifest swaps between local workers
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
 BACKEND = os.getenv("STORAGE_BACKEND", "fs")  # "fs" | "s3"
 RAGDB_ROOT = os.getenv("RAGDB_ROOT", ".ragdb")
 BUCKET = os.getenv("S3_BUCKET", "")
 PREFIX = os.getenv("S3_PREFIX", "ragdb")
+MANIFEST_RETRIES = int(os.getenv("STORAGE_MANIFEST_RETRIES", "20"))
+MMAP = os.getenv("STORAGE_MMAP", "1") != "0"  # FS only: map vectors.npy read-only instead of reading it
+# Segments replaced by compaction stay on disk this long, for readers still on the old manifest
+RETIRE_GRACE_SEC = float(os.getenv("STORAGE_RETIRE_GRACE_SEC", "600"))
+
+# Corpus layout (same shape on FS and S3):
+#   <corpus>/manifest.json                      <- the only mutable object, swapped atomically
+#   <corpus>/segments/<seg_id>/vectors.npy      <- immutable once listed in the manifest; float32, or
+#                                                  float16/int8 per manifest["vector_dtype"] (see quantize)
+#   <corpus>/segments/<seg_id>/meta.{json,npz}, text.bin   (columnar metadata, see metastore)
+#   <corpus>/segments/<seg_id>/bm25.{json,npz}              (BM25 postings, see bm25_index)
+#   <corpus>/segments/<seg_id>/simhash.npy                  (near-dup hashes per row, see neardup)
+#   <corpus>/indexes/<name>.faiss               <- serialized ANN index, see manifest["index_file"]
+# Corpora written before segments existed keep vectors.npy/meta.pkl at the corpus root;
+# they load as a single LEGACY_SEGMENT and keep working when new segments are appended.
+# meta.pkl is only ever read for such legacy data; new segments are never pickled.
+# Segments replaced by compaction (or save), and index files replaced by a newer index or
+# dropped by compaction, are listed in manifest["retired"] with the time they were replaced
+# (index files as {"kind": "index"}), and deleted by the first sweep after RETIRE_GRACE_SEC.
+LEGACY_SEGMENT = "."
+
+
+def _new_segment_id() -> str:
+    # Sortable by creation time, unique across concurrent writers.
+    return f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+
+
+def segments(manifest: dict) -> List[dict]:
+    """Segment entries listed by a manifest (legacy single-file corpora included)."""
+    if "segments" in manifest:
+        return list(manifest["segments"])
+    if int(manifest.get("doc_count", 0)) > 0:
+        return [{"id": LEGACY_SEGMENT, "seq": 0, "rows": int(manifest["doc_count"])}]
+    return []
+
+
+def _with_segment(current: Optional[dict], entry: dict, base: dict) -> dict:
+    """Return the manifest that results from publishing `entry` on top of `current`."""
+    manifest = dict(base)
+    manifest.update(current or {})
+    dim = int(base.get("dim", manifest.get("dim", 0)))
+    if current and int(current.get("dim", dim)) != dim:
+        raise ValueError(f"Segment dim {dim} does not match corpus dim {current['dim']}")
+    segs = segments(current or {})
+    entry = dict(entry, seq=int(manifest.get("next_seq", len(segs))))
+    segs.append(entry)
+    manifest.update({
+        "segments": segs,
+        "next_seq": entry["seq"] + 1,
+        "doc_count": sum(int(s["rows"]) for s in segs),
+        "version": int(manifest.get("version", 0)) + 1,
+    })
+    return manifest
+
+
+def _retire(current: dict, seg_ids: List[str], index_file: Optional[dict] = None) -> List[dict]:
+    """current["retired"] plus `seg_ids` (and the `index_file` entry, if any), stamped now."""
+    now = int(time.time())
+    retired = list(current.get("retired", [])) + [{"id": sid, "at": now} for sid in seg_ids]
+    if index_file:
+        retired.append({"id": index_file["name"], "kind": "index", "at": now})
+    return retired
+
+
+def _replaced_by(current: Optional[dict], entry: dict, base: dict) -> dict:
+    """Return the manifest that results from replacing all segments with `entry`."""
+    current = current or {}
+    seq = int(current.get("next_seq", len(segments(current))))
+    manifest = dict(base)
+    manifest.update({
+        "segments": [dict(entry, seq=seq)],
+        "retired": _retire(current, [s["id"] for s in segments(current)], current.get("index_file")),
+        "next_seq": seq + 1,
+        "doc_count": int(entry["rows"]),
+        "version": int(current.get("version", 0)) + 1,
+    })
+    return manifest
+
+
+def _compacted(current: Optional[dict], entry: dict, replaced: List[str], overrides: dict) -> Optional[dict]:
+    """
+    Return the manifest with the `replaced` segments swapped for the merged `entry`; segments
+    published meanwhile are kept after it. None if another compaction got there first.
+    """
+    segs = segments(current or {})
+    if not set(replaced) <= {s["id"] for s in segs}:
+        return None
+    seq = int(current.get("next_seq", len(segs)))
+    kept = [s for s in segs if s["id"] not in set(replaced)]
+    manifest = dict(current)
+    manifest.update(overrides)
+    manifest.pop("index_file", None)  # covered the replaced segments; retrained after compaction
+    manifest.update({
+        "segments": [dict(entry, seq=seq)] + kept,
+        "retired": _retire(current, replaced, current.get("index_file")),
+        "next_seq": seq + 1,
+        "doc_count": int(entry["rows"]) + sum(int(s["rows"]) for s in kept),
+        "version": int(current.get("version", 0)) + 1,
+    })
+    return manifest
+
+
+def _index_valid(manifest: dict, entry: Optional[dict]) -> bool:
+    """An index file applies while its segments are still a prefix of the corpus and its spec is current."""
+    if not entry:
+        return False
+    seg_ids = [s["id"] for s in segments(manifest)]
+    covered = list(entry["segments"])
+    return seg_ids[:len(covered)] == covered and entry.get("spec") == manifest.get("index")
+
+
+def _without_retired(current: Optional[dict], seg_ids: List[str]) -> Optional[dict]:
+    if not current:
+        return None
+    return dict(current, retired=[r for r in current.get("retired", []) if r["id"] not in set(seg_ids)])
+
+
+def _with_index(current: Optional[dict], entry: dict) -> Optional[dict]:
+    if not current or not _index_valid(current, entry):
+        return None  # corpus was compacted or re-specced meanwhile; this index is already stale
+    return dict(current, index_file=entry, retired=_retire(current, [], current.get("index_file")))
+
+
+# ---------- Filesystem backend ----------
 
 def _fs_paths(corpus_id: str):
     d = os.path.join(RAGDB_ROOT, corpus_id)
     return d, os.path.join(d, "vectors.npy"), os.path.join(d, "meta.pkl"), os.path.join(d, "manifest.json")
 
-def save_fs(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict):
-    os.makedirs(_fs_paths(corpus_id)[0], exist_ok=True)
-    _, v, m, man = _fs_paths(corpus_id)
-    np.save(v, vecs)
-    with open(m, "wb") as f: pickle.dump(metas, f)
-    with open(man, "w") as f: json.dump(manifest, f, indent=2)
+def _fs_segment_dir(corpus_id: str, seg_id: str) -> str:
+    d = _fs_paths(corpus_id)[0]
+    return d if seg_id == LEGACY_SEGMENT else os.path.join(d, "segments", seg_id)
+
+@contextlib.contextmanager
+def _fs_manifest_lock(corpus_id: str):
+    d = _fs_paths(corpus_id)[0]
+    os.makedirs(d, exist_ok=True)
+    with open(os.path.join(d, ".manifest.lock"), "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _fs_read_manifest(corpus_id: str) -> Optional[dict]:
+    man = _fs_paths(corpus_id)[3]
+    if not os.path.exists(man):
+        return None
+    with open(man, "r") as f: return json.load(f)
+
+def _fs_write_manifest(corpus_id: str, manifest: dict) -> None:
+    d, _, _, man = _fs_paths(corpus_id)
+    tmp = os.path.join(d, f".manifest.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, man)  # readers see either the old or the new manifest, never a partial one
+
+def _fs_swap_manifest(corpus_id: str, update) -> Optional[dict]:
+    """Apply `update(current) -> new | None` to the manifest under the corpus lock."""
+    with _fs_manifest_lock(corpus_id):
+        new = update(_fs_read_manifest(corpus_id))
+        if new is not None:
+            _fs_write_manifest(corpus_id, new)
+    return new
+
+def _fs_write_segment(corpus_id: str, vecs: np.ndarray, metas: List[dict], dtype: Optional[str] = None,
+                      hashes: Optional[np.ndarray] = None) -> dict:
+    seg_id = _new_segment_id()
+    final = _fs_segment_dir(corpus_id, seg_id)
+    staging = os.path.join(os.path.dirname(final), f".tmp-{seg_id}")
+    os.makedirs(staging, exist_ok=True)
+    stored, quant = _encode(vecs, dtype)
+    np.save(os.path.join(staging, "vectors.npy"), stored)
+    metastore.write_dir(staging, metas)
+    bm25_index.write_dir(staging, bm25_index.texts_of(metas))
+    with open(os.path.join(staging, neardup.SIMHASH_FILE), "wb") as f:
+        f.write(neardup.encode(_segment_hashes(metas, hashes)))
+    os.rename(staging, final)
+    return {"id": seg_id, "rows": int(len(metas)), **quant}
+
+def _fs_delete_segment(corpus_id: str, seg_id: str) -> None:
+    d = _fs_segment_dir(corpus_id, seg_id)
+    if seg_id == LEGACY_SEGMENT:  # root-level files of a pre-segment corpus, not the corpus dir
+        for name in ("vectors.npy", "meta.pkl"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(d, name))
+        return
+    shutil.rmtree(d, ignore_errors=True)  # open mmaps stay valid until their readers drop them
+
+def load_manifest_fs(corpus_id: str) -> dict:
+    manifest = _fs_read_manifest(corpus_id)
+    if manifest is None:
+        raise FileNotFoundError(f"No manifest for corpus {corpus_id!r} under {RAGDB_ROOT}")
+    return manifest
+
+def load_metas_fs(corpus_id: str, seg_id: str, mmap: Optional[bool] = None) -> Sequence[dict]:
+    d = _fs_segment_dir(corpus_id, seg_id)
+    mmap = MMAP if mmap is None else mmap
+    if os.path.exists(os.path.join(d, "meta.json")):
+        return metastore.read_dir(d, use_mmap=mmap)
+    with open(os.path.join(d, "meta.pkl"), "rb") as f: return pickle.load(f)  # legacy data only
+
+def load_segment_fs(corpus_id: str, seg_id: str, mmap: Optional[bool] = None) -> Tuple[np.ndarray, Sequence[dict]]:
+    """
+    Vectors as stored (float32, float16 or int8). With mmap=True, they (and the chunk text
+    heap) are read-only maps backed by the page cache, so every worker process on the node
+    shares one copy.
+    """
+    d = _fs_segment_dir(corpus_id, seg_id)
+    mmap = MMAP if mmap is None else mmap
+    vecs = np.load(os.path.join(d, "vectors.npy"), mmap_mode="r" if mmap else None)
+    return vecs, load_metas_fs(corpus_id, seg_id, mmap)
+
+def load_postings_fs(corpus_id: str, seg_id: str) -> Optional[bm25_index.SegmentPostings]:
+    return bm25_index.read_dir(_fs_segment_dir(corpus_id, seg_id))
+
+def load_simhashes_fs(corpus_id: str, seg_id: str) -> Optional[np.ndarray]:
+    path = os.path.join(_fs_segment_dir(corpus_id, seg_id), neardup.SIMHASH_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return neardup.decode(f.read())
+
+def append_fs(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict,
+              hashes: Optional[np.ndarray] = None) -> dict:
+    entry = _fs_write_segment(corpus_id, vecs, metas, manifest.get("vector_dtype"), hashes)
+    update = lambda cur: _with_segment(cur, entry, manifest)
+    return _publish(corpus_id, entry, lambda: _fs_swap_manifest(corpus_id, update))
+
+def save_fs(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict,
+            hashes: Optional[np.ndarray] = None):
+    entry = _fs_write_segment(corpus_id, vecs, metas, manifest.get("vector_dtype"), hashes)
+    update = lambda cur: _replaced_by(cur, entry, manifest)
+    return _publish(corpus_id, entry, lambda: _fs_swap_manifest(corpus_id, update))
+
+def save_index_fs(corpus_id: str, index, entry: dict) -> Optional[dict]:
+    import faiss
+    d = os.path.join(_fs_paths(corpus_id)[0], "indexes")
+    os.makedirs(d, exist_ok=True)
+    tmp = os.path.join(d, f".tmp-{entry['name']}")
+    faiss.write_index(index, tmp)
+    os.rename(tmp, os.path.join(d, entry["name"]))
+    published = _fs_swap_manifest(corpus_id, lambda cur: _with_index(cur, entry))
+    if published is None:  # stale: nothing lists it
+        _fs_delete_index(corpus_id, entry["name"])
+    return published
+
+def _fs_delete_index(corpus_id: str, name: str) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(_fs_paths(corpus_id)[0], "indexes", name))  # mmaps stay valid
+
+def load_index_fs(corpus_id: str, entry: dict, mmap: Optional[bool] = None):
+    import faiss
+    path = os.path.join(_fs_paths(corpus_id)[0], "indexes", entry["name"])
+    mmap = MMAP if mmap is None else mmap
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0)
+
+def load_fs(corpus_id: str, mmap: Optional[bool] = None) -> Tuple[np.ndarray, Sequence[dict], dict]:
+    manifest = load_manifest_fs(corpus_id)
+    parts = [(s, load_segment_fs(corpus_id, s["id"], mmap)) for s in segments(manifest)]
+    return _concat([(decode_vectors(v, s), m) for s, (v, m) in parts], manifest)
+
 
-def load_fs(corpus_id: str) -> Tuple[np.ndarray, List[dict], dict]:
-    _, v, m, man = _fs_paths(corpus_id)
-    vecs = np.load(v).astype("float32")
-    with open(m, "rb") as f: metas = pickle.load(f)
-    with open(man, "r") as f: manifest = json.load(f)
-    return vecs, metas, manifest
+# ---------- S3 backend ----------
 
 def _s3():
     import boto3
@@ -33,27 +292,366 @@ def _s3_keys(corpus_id: str):
     base = f"{PREFIX}/{corpus_id}"
     return f"{base}/vectors.npy", f"{base}/meta.pkl", f"{base}/manifest.json"
 
-def save_s3(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict):
+def _s3_segment_base(corpus_id: str, seg_id: str) -> str:
+    base = f"{PREFIX}/{corpus_id}"
+    return base if seg_id == LEGACY_SEGMENT else f"{base}/segments/{seg_id}"
+
+def _s3_read_manifest(s3, corpus_id: str) -> Tuple[Optional[dict], Optional[str]]:
+    """Return (manifest, etag); (None, None) if the corpus has no manifest yet."""
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=_s3_keys(corpus_id)[2])
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(obj["Body"].read().decode("utf-8")), obj["ETag"]
+
+def _s3_write_segment(s3, corpus_id: str, vecs: np.ndarray, metas: List[dict], dtype: Optional[str] = None,
+                      hashes: Optional[np.ndarray] = None) -> dict:
+    seg_id = _new_segment_id()
+    base = _s3_segment_base(corpus_id, seg_id)
+    stored, quant = _encode(vecs, dtype)
+    b = io.BytesIO(); np.save(b, stored); b.seek(0)
+    s3.put_object(Bucket=BUCKET, Key=f"{base}/vectors.npy", Body=b.getvalue())
+    for name, blob in metastore.encode(metas).items():
+        s3.put_object(Bucket=BUCKET, Key=f"{base}/{name}", Body=blob)
+    for name, blob in bm25_index.SegmentPostings.build(bm25_index.texts_of(metas)).encode().items():
+        s3.put_object(Bucket=BUCKET, Key=f"{base}/{name}", Body=blob)
+    s3.put_object(Bucket=BUCKET, Key=f"{base}/{neardup.SIMHASH_FILE}",
+                  Body=neardup.encode(_segment_hashes(metas, hashes)))
+    return {"id": seg_id, "rows": int(len(metas)), **quant}
+
+def _s3_delete_segment(s3, corpus_id: str, seg_id: str) -> None:
+    base = _s3_segment_base(corpus_id, seg_id)
+    if seg_id == LEGACY_SEGMENT:
+        keys = [f"{base}/vectors.npy", f"{base}/meta.pkl"]
+    else:
+        pages = s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=f"{base}/")
+        keys = [o["Key"] for page in pages for o in page.get("Contents", [])]
+    for i in range(0, len(keys), 1000):  # DeleteObjects limit
+        s3.delete_objects(Bucket=BUCKET, Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True})
+
+def _s3_swap_manifest(s3, corpus_id: str, update) -> Optional[dict]:
+    """
+    Compare-and-swap the manifest with S3 conditional writes: the put only succeeds if
+    nobody else published since we read it; otherwise re-read and re-apply `update`.
+    """
+    from botocore.exceptions import ClientError
+    k_man = _s3_keys(corpus_id)[2]
+    for attempt in range(MANIFEST_RETRIES):
+        current, etag = _s3_read_manifest(s3, corpus_id)
+        new = update(current)
+        if new is None:
+            return None
+        cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            s3.put_object(Bucket=BUCKET, Key=k_man, Body=json.dumps(new).encode("utf-8"), **cond)
+            return new
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+            time.sleep(min(0.05 * (2 ** attempt), 1.0))
+    raise RuntimeError(f"Could not publish manifest for corpus {corpus_id!r}: too much contention")
+
+def load_manifest_s3(corpus_id: str) -> dict:
+    manifest, _ = _s3_read_manifest(_s3(), corpus_id)
+    if manifest is None:
+        raise FileNotFoundError(f"No manifest for corpus {corpus_id!r} in s3://{BUCKET}/{PREFIX}")
+    return manifest
+
+def _s3_reader(s3, corpus_id: str, seg_id: str):
+    base = _s3_segment_base(corpus_id, seg_id)
+    return lambda name: s3.get_object(Bucket=BUCKET, Key=f"{base}/{name}")["Body"].read()
+
+def load_metas_s3(corpus_id: str, seg_id: str) -> Sequence[dict]:
+    s3 = _s3()
+    read = _s3_reader(s3, corpus_id, seg_id)
+    if seg_id != LEGACY_SEGMENT:
+        try:
+            return metastore.decode(read)
+        except s3.exceptions.NoSuchKey:
+            pass  # segment written before columnar metadata
+    return pickle.loads(read("meta.pkl"))  # legacy data only
+
+def load_segment_s3(corpus_id: str, seg_id: str) -> Tuple[np.ndarray, Sequence[dict]]:
+    vecs = np.load(io.BytesIO(_s3_reader(_s3(), corpus_id, seg_id)("vectors.npy")))  # as stored
+    return vecs, load_metas_s3(corpus_id, seg_id)
+
+def load_postings_s3(corpus_id: str, seg_id: str) -> Optional[bm25_index.SegmentPostings]:
+    if seg_id == LEGACY_SEGMENT:
+        return None
     s3 = _s3()
-    k_vec, k_meta, k_man = _s3_keys(corpus_id)
-    b = io.BytesIO(); np.save(b, vecs); b.seek(0)
-    s3.put_object(Bucket=BUCKET, Key=k_vec, Body=b.getvalue())
-    s3.put_object(Bucket=BUCKET, Key=k_meta, Body=pickle.dumps(metas))
-    s3.put_object(Bucket=BUCKET, Key=k_man, Body=json.dumps(manifest).encode("utf-8"))
+    base = _s3_segment_base(corpus_id, seg_id)
+    try:
+        return bm25_index.SegmentPostings.decode(
+            lambda name: s3.get_object(Bucket=BUCKET, Key=f"{base}/{name}")["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return None  # segment written before BM25 indexing
 
-def load_s3(corpus_id: str) -> Tuple[np.ndarray, List[dict], dict]:
+def load_simhashes_s3(corpus_id: str, seg_id: str) -> Optional[np.ndarray]:
+    if seg_id == LEGACY_SEGMENT:
+        return None
     s3 = _s3()
-    k_vec, k_meta, k_man = _s3_keys(corpus_id)
-    vec_obj = s3.get_object(Bucket=BUCKET, Key=k_vec)["Body"].read()
-    meta_obj = s3.get_object(Bucket=BUCKET, Key=k_meta)["Body"].read()
-    man_obj  = s3.get_object(Bucket=BUCKET, Key=k_man)["Body"].read()
-    vecs = np.load(io.BytesIO(vec_obj)).astype("float32")
-    metas = pickle.loads(meta_obj)
-    manifest = json.loads(man_obj.decode("utf-8"))
-    return vecs, metas, manifest
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=f"{_s3_segment_base(corpus_id, seg_id)}/{neardup.SIMHASH_FILE}")
+    except s3.exceptions.NoSuchKey:
+        return None  # segment written before near-dup hashing
+    return neardup.decode(obj["Body"].read())
+
+def append_s3(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict,
+              hashes: Optional[np.ndarray] = None) -> dict:
+    s3 = _s3()
+    entry = _s3_write_segment(s3, corpus_id, vecs, metas, manifest.get("vector_dtype"), hashes)
+    update = lambda cur: _with_segment(cur, entry, manifest)
+    return _publish(corpus_id, entry, lambda: _s3_swap_manifest(s3, corpus_id, update))
+
+def save_s3(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict,
+            hashes: Optional[np.ndarray] = None):
+    s3 = _s3()
+    entry = _s3_write_segment(s3, corpus_id, vecs, metas, manifest.get("vector_dtype"), hashes)
+    update = lambda cur: _replaced_by(cur, entry, manifest)
+    return _publish(corpus_id, entry, lambda: _s3_swap_manifest(s3, corpus_id, update))
+
+def save_index_s3(corpus_id: str, index, entry: dict) -> Optional[dict]:
+    import faiss
+    s3 = _s3()
+    key = f"{PREFIX}/{corpus_id}/indexes/{entry['name']}"
+    s3.put_object(Bucket=BUCKET, Key=key, Body=faiss.serialize_index(index).tobytes())
+    published = _s3_swap_manifest(s3, corpus_id, lambda cur: _with_index(cur, entry))
+    if published is None:  # stale: nothing lists it
+        s3.delete_object(Bucket=BUCKET, Key=key)
+    return published
+
+def load_index_s3(corpus_id: str, entry: dict):
+    import faiss
+    key = f"{PREFIX}/{corpus_id}/indexes/{entry['name']}"
+    blob = _s3().get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    return faiss.deserialize_index(np.frombuffer(blob, dtype="uint8"))
+
+def load_s3(corpus_id: str) -> Tuple[np.ndarray, Sequence[dict], dict]:
+    manifest = load_manifest_s3(corpus_id)
+    parts = [(s, load_segment_s3(corpus_id, s["id"])) for s in segments(manifest)]
+    return _concat([(decode_vectors(v, s), m) for s, (v, m) in parts], manifest)
+
+
+# ---------- Backend-agnostic API ----------
+
+def _encode(vecs: np.ndarray, dtype: Optional[str]) -> Tuple[np.ndarray, dict]:
+    """(array to store, extra segment-entry fields: dtype and int8 scale unless float32)."""
+    dtype = quantize.check_dtype(dtype)
+    stored, scale = quantize.encode(vecs, dtype)
+    if dtype == "float32":
+        return stored, {}
+    return stored, {"dtype": dtype, **({"scale": scale} if scale is not None else {})}
+
+def _split_hashes(metas: Sequence[dict]) -> Tuple[List[dict], Optional[np.ndarray]]:
+    """
+    Metas without the ingest pipeline's per-chunk SimHash (meta[neardup.SIMHASH_KEY]), and
+    those hashes as the segment's simhash.npy rows (None unless every row has one).
+    """
+    if not any(neardup.SIMHASH_KEY in m for m in metas):
+        return list(metas), None
+    hashes = None
+    if all(neardup.SIMHASH_KEY in m for m in metas):
+        hashes = np.fromiter((m[neardup.SIMHASH_KEY] for m in metas), dtype=np.uint64, count=len(metas))
+    return [{k: v for k, v in m.items() if k != neardup.SIMHASH_KEY} for m in metas], hashes
+
+def _segment_hashes(metas: Sequence[dict], hashes: Optional[np.ndarray]) -> np.ndarray:
+    if hashes is not None and len(hashes) == len(metas):
+        return hashes
+    return neardup.simhashes(bm25_index.texts_of(metas))
+
+def decode_vectors(vecs: np.ndarray, entry: dict) -> np.ndarray:
+    """float32 rows of a segment loaded with load_segment(), given its manifest entry."""
+    return quantize.decode(vecs, entry.get("scale"))
+
+def _concat(parts: List[Tuple[np.ndarray, Sequence[dict]]], manifest: dict) -> Tuple[np.ndarray, MetaList, dict]:
+    if not parts:
+        return np.empty((0, int(manifest.get("dim", 0))), dtype="float32"), MetaList(), manifest
+    vecs = parts[0][0] if len(parts) == 1 else np.concatenate([v for v, _ in parts], axis=0)
+    return vecs, MetaList(m for _, m in parts), manifest
+
+# Only ever raises the stored version, so concurrent publishers can't move it backwards.
+_SET_VERSION = """
+local cur = tonumber(redis.call("GET", KEYS[1]) or "-1")
+if tonumber(ARGV[1]) > cur then
+    redis.call("SET", KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+def _record_version(corpus_id: str, manifest: Optional[dict]) -> Optional[dict]:
+    """
+    Mirror a published manifest's version into Redis (corpus_version:{id}) so readers that
+    only need the version (the API's answer cache) don't read the manifest. Best-effort.
+    """
+    r = get_redis()
+    if r is None or not manifest or manifest.get("version") is None:
+        return manifest
+    try:
+        r.eval(_SET_VERSION, 1, key_corpus_version(corpus_id), int(manifest["version"]))
+    except Exception:
+        pass
+    return manifest
+
+def append(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict) -> dict:
+    """
+    Publish (vecs, metas) as a new immutable segment and atomically add it to the corpus
+    manifest. Cost is proportional to the batch, not the corpus. Returns the new manifest.
+    """
+    if not len(metas):
+        try:
+            return load_manifest(corpus_id)
+        except FileNotFoundError:
+            return dict(manifest, doc_count=0, version=0, segments=[])
+    metas, hashes = _split_hashes(metas)
+    published = (append_s3(corpus_id, vecs, metas, manifest, hashes) if BACKEND == "s3"
+                 else append_fs(corpus_id, vecs, metas, manifest, hashes))
+    return _record_version(corpus_id, published)
 
 def save(corpus_id: str, vecs: np.ndarray, metas: List[dict], manifest: dict):
-    return save_s3(corpus_id, vecs, metas, manifest) if BACKEND == "s3" else save_fs(corpus_id, vecs, metas, manifest)
+    """Replace the corpus with a single segment (full rewrite)."""
+    metas, hashes = _split_hashes(metas)
+    published = (save_s3(corpus_id, vecs, metas, manifest, hashes) if BACKEND == "s3"
+                 else save_fs(corpus_id, vecs, metas, manifest, hashes))
+    return _record_version(corpus_id, published)
+
+def compact(corpus_id: str, overrides: Optional[dict] = None) -> Optional[dict]:
+    """
+    Merge the corpus' current segments into one and apply `overrides` (e.g. a new "index"
+    spec) to the manifest. Segments appended while compacting are kept, not lost.
+    Returns the new manifest, or None if a concurrent compaction won the race.
+    """
+    manifest = load_manifest(corpus_id)
+    entries = segments(manifest)
+    segs = [s["id"] for s in entries]
+    if not segs:
+        return manifest
+    parts = [load_segment(corpus_id, sid) for sid in segs]
+    vecs, metas, _ = _concat([(decode_vectors(v, s), m) for s, (v, m) in zip(entries, parts)], manifest)
+    dtype = (overrides or {}).get("vector_dtype", manifest.get("vector_dtype"))  # one scale for the merged rows
+    hashes = np.concatenate([load_simhashes(corpus_id, sid) for sid in segs])  # persisted, not recomputed
+    update = lambda cur: _compacted(cur, entry, segs, overrides or {})
+    if BACKEND == "s3":
+        s3 = _s3()
+        entry = _s3_write_segment(s3, corpus_id, vecs, list(metas), dtype, hashes)
+        published = _publish(corpus_id, entry, lambda: _s3_swap_manifest(s3, corpus_id, update))
+    else:
+        entry = _fs_write_segment(corpus_id, vecs, list(metas), dtype, hashes)
+        published = _publish(corpus_id, entry, lambda: _fs_swap_manifest(corpus_id, update))
+    if published is None:  # lost to a concurrent compaction: nothing lists our segment
+        _delete_segment(corpus_id, entry["id"])
+        return None
+    sweep_retired(corpus_id, published)
+    return _record_version(corpus_id, published)
+
+def _publish(corpus_id: str, entry: dict, swap) -> Optional[dict]:
+    """
+    Run `swap()`, the manifest swap listing the just-written segment `entry`. If it raises
+    (dim mismatch, contention, I/O error), the segment is deleted unless the manifest lists
+    it after all (an S3 put can succeed and still report an error); nothing else would.
+    """
+    try:
+        return swap()
+    except BaseException:
+        try:
+            listed = entry["id"] in {s["id"] for s in segments(load_manifest(corpus_id))}
+        except FileNotFoundError:
+            listed = False
+        except Exception:
+            listed = True  # can't tell: keep it
+        if not listed:
+            with contextlib.suppress(Exception):
+                _delete_segment(corpus_id, entry["id"])
+        raise
+
+def _delete_segment(corpus_id: str, seg_id: str) -> None:
+    if BACKEND == "s3":
+        _s3_delete_segment(_s3(), corpus_id, seg_id)
+    else:
+        _fs_delete_segment(corpus_id, seg_id)
+
+def _delete_retired(corpus_id: str, retired: dict) -> None:
+    if retired.get("kind") != "index":
+        _delete_segment(corpus_id, retired["id"])
+    elif BACKEND == "s3":
+        _s3().delete_object(Bucket=BUCKET, Key=f"{PREFIX}/{corpus_id}/indexes/{retired['id']}")
+    else:
+        _fs_delete_index(corpus_id, retired["id"])
+
+def sweep_retired(corpus_id: str, manifest: Optional[dict] = None) -> List[str]:
+    """
+    Delete retired segments and index files whose grace period is over and drop them from
+    the manifest. Best-effort (a failed delete is retried by the next sweep); returns the
+    ids removed.
+    """
+    manifest = manifest or load_manifest(corpus_id)
+    now = time.time()
+    expired = [r for r in manifest.get("retired", []) if now - float(r["at"]) >= RETIRE_GRACE_SEC]
+    due = [r["id"] for r in expired]
+    if not due:
+        return []
+    try:
+        for r in expired:
+            _delete_retired(corpus_id, r)
+        update = lambda cur: _without_retired(cur, due)
+        if BACKEND == "s3":
+            _s3_swap_manifest(_s3(), corpus_id, update)
+        else:
+            _fs_swap_manifest(corpus_id, update)
+    except Exception:
+        return []
+    return due
+
+def load_manifest(corpus_id: str) -> dict:
+    return load_manifest_s3(corpus_id) if BACKEND == "s3" else load_manifest_fs(corpus_id)
+
+def load_segment(corpus_id: str, seg_id: str, mmap: Optional[bool] = None) -> Tuple[np.ndarray, Sequence[dict]]:
+    """(vectors as stored, metas); decode_vectors() turns float16/int8 vectors into float32."""
+    return load_segment_s3(corpus_id, seg_id) if BACKEND == "s3" else load_segment_fs(corpus_id, seg_id, mmap)
+
+def load_metas(corpus_id: str, seg_id: str, mmap: Optional[bool] = None) -> Sequence[dict]:
+    """A segment's metas only (no vectors.npy read)."""
+    return load_metas_s3(corpus_id, seg_id) if BACKEND == "s3" else load_metas_fs(corpus_id, seg_id, mmap)
+
+def load_postings(corpus_id: str, seg_id: str) -> Optional[bm25_index.SegmentPostings]:
+    """A segment's persisted BM25 postings, or None if it predates them (caller rebuilds from text)."""
+    return load_postings_s3(corpus_id, seg_id) if BACKEND == "s3" else load_postings_fs(corpus_id, seg_id)
+
+def load_simhashes(corpus_id: str, seg_id: str) -> np.ndarray:
+    """A segment's per-row near-dup hashes; computed from its text for segments that predate them."""
+    hashes = load_simhashes_s3(corpus_id, seg_id) if BACKEND == "s3" else load_simhashes_fs(corpus_id, seg_id)
+    if hashes is None:
+        hashes = neardup.simhashes(bm25_index.texts_of(load_metas(corpus_id, seg_id)))
+    return hashes
+
+def save_index(corpus_id: str, index, seg_ids: List[str], spec: Optional[dict]) -> Optional[dict]:
+    """
+    Persist a trained FAISS index built over `seg_ids` (in manifest order) under `spec`, and
+    record it in manifest["index_file"]. Returns the new manifest, or None if the corpus
+    was compacted / re-specced in the meantime (the index is then stale and not published).
+    The index file it replaces, if any, is retired (see sweep_retired()).
+    """
+    entry = {"name": f"{_new_segment_id()}.faiss", "spec": spec, "segments": list(seg_ids),
+             "rows": int(index.ntotal)}
+    published = (save_index_s3(corpus_id, index, entry) if BACKEND == "s3"
+                 else save_index_fs(corpus_id, index, entry))
+    if published is not None:
+        sweep_retired(corpus_id, published)
+    return published
+
+def has_index(manifest: dict) -> bool:
+    """Whether manifest["index_file"] still applies to this manifest (see load_index())."""
+    return _index_valid(manifest, manifest.get("index_file"))
+
+def load_index(corpus_id: str, manifest: dict, mmap: Optional[bool] = None):
+    """
+    The persisted index for this manifest (memory-mapped read-only on FS), or None if there
+    is none or it no longer matches the corpus. It covers the first entry["rows"] rows.
+    """
+    if not has_index(manifest):
+        return None
+    entry = manifest["index_file"]
+    return load_index_s3(corpus_id, entry) if BACKEND == "s3" else load_index_fs(corpus_id, entry, mmap)
 
-def load(corpus_id: str) -> Tuple[np.ndarray, List[dict], dict]:
-    return load_s3(corpus_id) if BACKEND == "s3" else load_fs(corpus_id)
+def load(corpus_id: str, mmap: Optional[bool] = None) -> Tuple[np.ndarray, Sequence[dict], dict]:
+    return load_s3(corpus_id) if BACKEND == "s3" else load_fs(corpus_id, mmap)
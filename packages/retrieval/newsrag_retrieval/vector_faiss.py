@@ -1,67 +1,255 @@
 # packages/retrieval/newsrag_retrieval/vector_faiss.py
 from __future__ import annotations
-from typing import List, Sequence, Tuple, Optional
+from typing import List, Optional, Sequence, Tuple, Union
 import numpy as np
 import faiss
 
+from . import ann, quantize
+from .metastore import MetaList
+
+
+class VectorBuffer:
+    """
+    Append-only float32 row buffer with capacity doubling, so appends are amortized
+    O(batch) instead of re-copying the whole matrix each time (np.vstack).
+    view() is zero-copy and read-only; a view taken earlier stays valid after later
+    appends (it keeps the old allocation alive) and simply doesn't see the new rows.
+    """
+    __slots__ = ("dim", "_data", "_n")
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self, dim: int, capacity: int = 0):
+        self.dim = dim
+        self._data = np.empty((capacity, dim), dtype="float32")
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def capacity(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def append(self, rows: np.ndarray) -> None:
+        n = rows.shape[0]
+        need = self._n + n
+        if need > self.capacity:
+            grown = np.empty((max(need, 2 * self.capacity, self.MIN_CAPACITY), self.dim), dtype="float32")
+            grown[:self._n] = self._data[:self._n]
+            self._data = grown
+        self._data[self._n:need] = rows
+        self._n = need
+
+    def view(self) -> np.ndarray:
+        v = self._data[:self._n]
+        v.flags.writeable = False
+        return v
+
+    def trimmed(self) -> np.ndarray:
+        """The rows as a read-only array without spare capacity (copied only if there is some)."""
+        v = self._data[:self._n] if self._n == self.capacity else self._data[:self._n].copy()
+        v.flags.writeable = False
+        return v
+
 
 class FaissStore:
     """
-    Flat IP index with cosine-compatible behavior (expects pre-normalized vectors).
-    We also keep a NumPy matrix mirror so we can persist/rebuild without relying on
-    FAISS's internal serialization.
+    Exact inner-product search with cosine-compatible behavior (expects pre-normalized vectors).
+
+    Vectors live in read-only blocks that are searched in place with faiss.knn, so there is
+    no second copy inside a FAISS index:
+      - attach() adopts an external block (e.g. an np.load(..., mmap_mode="r") segment)
+        without copying; worker processes on one node then share the page cache.
+      - add() appends into an owned VectorBuffer.
+      - attach() of a float16 / int8 block (compact corpora, see quantize.py) adopts it as a
+        CompactBlock, also without copying; search decodes it chunk by chunk for faiss.knn.
+
+    With an ANN index spec (see ann.py), build_index() trains an IVF/HNSW index over the
+    current rows (or use_index() adopts a persisted one). The index is never mutated
+    afterwards, so it may be memory-mapped read-only: rows added later form an exact-search
+    tail whose hits are merged with the ANN hits until the next compaction retrains.
     """
-    def __init__(self, dim: int):
+    def __init__(self, dim: int, index_spec: Optional[dict] = None):
         self.dim = dim
-        self.index = faiss.IndexFlatIP(dim)
-        self._matrix: Optional[np.ndarray] = None  # rows = vectors
-        self._metas: List[dict] = []
+        self._blocks: List[Union[np.ndarray, quantize.CompactBlock]] = []  # sealed blocks, in row order
+        self._buffer = VectorBuffer(dim)     # growable tail for add()
+        self._metas = MetaList()             # row-aligned; columnar segment metadata stays lazily decoded
+        self.index_spec = ann.resolve_spec(index_spec or {"type": "flat"})
+        self.index: Optional[faiss.Index] = None  # None → exact search over the blocks
+        self._index_rows = 0                       # rows [0, _index_rows) are covered by self.index
+        self.bm25 = None  # optional BM25Index over the same rows (kept in step by the corpus loader)
 
     @property
-    def metas(self) -> List[dict]:
+    def metas(self) -> MetaList:
         return self._metas
 
-    def add(self, vectors: Sequence[Sequence[float]] | np.ndarray, metas: List[dict]) -> None:
-        vecs = np.asarray(vectors, dtype="float32")
+    def _check(self, vecs: np.ndarray) -> None:
         if vecs.ndim != 2 or vecs.shape[1] != self.dim:
             raise ValueError(f"Bad shape {vecs.shape}; expected (N, {self.dim})")
 
-        # Maintain matrix mirror for persistence
-        if self._matrix is None:
-            self._matrix = vecs.copy()
-        else:
-            self._matrix = np.vstack((self._matrix, vecs))
+    def _parts(self) -> List[Union[np.ndarray, quantize.CompactBlock]]:
+        return self._blocks + ([self._buffer.view()] if len(self._buffer) else [])
+
+    @staticmethod
+    def _rows(part: Union[np.ndarray, quantize.CompactBlock]) -> int:
+        return part.shape[0]
 
-        self.index.add(vecs)
+    def _matrix(self, start: int = 0) -> np.ndarray:
+        """
+        Rows [start, N) as one (N - start, dim) array; zero-copy when they sit in one float32
+        block (quantized blocks are decoded).
+        """
+        parts, offset = [], 0
+        for part in self._parts():
+            n = self._rows(part)
+            if offset + n > start:
+                skip = max(0, start - offset)
+                parts.append(part.decode(skip) if isinstance(part, quantize.CompactBlock) else part[skip:])
+            offset += n
+        if not parts:
+            return np.empty((0, self.dim), dtype="float32")
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=0)
+
+    def add(self, vectors: Sequence[Sequence[float]] | np.ndarray, metas: Sequence[dict]) -> None:
+        vecs = np.asarray(vectors, dtype="float32")
+        self._check(vecs)
+        self._buffer.append(vecs)
+        self._metas.extend(metas)
+
+    def attach(self, vecs: np.ndarray, metas: Sequence[dict], scale: Optional[float] = None) -> None:
+        """
+        Append a float32 block by reference (no copy); it must not be mutated afterwards.
+        float16 / int8 blocks (int8 with its scale) are kept as stored, by reference too.
+        """
+        if quantize.is_compact(vecs):
+            self._check(vecs)
+            block = quantize.CompactBlock(vecs, scale)
+        else:
+            if vecs.dtype != np.float32 or not vecs.flags.c_contiguous:
+                vecs = np.ascontiguousarray(vecs, dtype="float32")
+            self._check(vecs)
+            block = vecs
+        if not len(vecs):
+            return
+        if len(self._buffer):
+            # Seal the current tail so row order stays blocks-then-tail; a view would keep
+            # the whole (up to 2x over-allocated) buffer alive.
+            self._blocks.append(self._buffer.trimmed())
+            self._buffer = VectorBuffer(self.dim)
+        self._blocks.append(block)
         self._metas.extend(metas)
 
-    def search(self, query_vecs: Sequence[Sequence[float]] | np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    def copy(self) -> "FaissStore":
+        """
+        A store sharing this one's sealed blocks, metadata blocks, postings and ANN index
+        (none of which are mutated once sealed); attach()/add() on either leaves the other
+        unchanged. The owned tail buffer, if any, is copied.
+        """
+        out = FaissStore(self.dim)
+        out.index_spec, out.index, out._index_rows = self.index_spec, self.index, self._index_rows
+        out._blocks = list(self._blocks)
+        if len(self._buffer):
+            out._buffer.append(self._buffer.view())
+        out._metas = self._metas.copy()
+        out.bm25 = self.bm25.copy() if self.bm25 is not None else None
+        return out
+
+    def build_index(self, spec: Optional[dict] = None) -> bool:
+        """
+        (Re)train the ANN index described by `spec` (default: self.index_spec) over all rows.
+        Returns False and keeps exact search if the spec is flat or there are too few rows.
+        """
+        if spec is not None:
+            self.index_spec = ann.resolve_spec(spec)
+        if not ann.can_build(self.index_spec, self.ntotal()):
+            self.index, self._index_rows = None, 0
+            return False
+        self.index = ann.build_index(np.ascontiguousarray(self._matrix()), self.index_spec)
+        self._index_rows = self.index.ntotal
+        return True
+
+    def use_index(self, index: "faiss.Index") -> None:
+        """Adopt a prebuilt (e.g. persisted, possibly mmap'd) index covering the first index.ntotal rows."""
+        if index.d != self.dim or index.ntotal > self.ntotal():
+            raise ValueError(f"Index ({index.ntotal} x {index.d}) does not fit store ({self.ntotal()} x {self.dim})")
+        self.index, self._index_rows = index, index.ntotal
+
+    @property
+    def index_rows(self) -> int:
+        return self._index_rows if self.index is not None else 0
+
+    def _exact_search(self, q: np.ndarray, k: int, start: int = 0) -> List[Tuple[np.ndarray, np.ndarray]]:
+        results, offset = [], 0
+        for part in self._parts():
+            n = self._rows(part)
+            if offset + n > start:
+                skip = max(0, start - offset)
+                if isinstance(part, quantize.CompactBlock):
+                    for a, rows in part.chunks(skip):
+                        scores, idx = faiss.knn(q, rows, k, metric=faiss.METRIC_INNER_PRODUCT)
+                        results.append((scores, np.where(idx >= 0, idx + offset + a, -1)))
+                else:
+                    scores, idx = faiss.knn(q, part[skip:], k, metric=faiss.METRIC_INNER_PRODUCT)
+                    results.append((scores, np.where(idx >= 0, idx + offset + skip, -1)))
+            offset += n
+        return results
+
+    def search(self, query_vecs: Sequence[Sequence[float]] | np.ndarray, k: int,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k by inner product; nprobe/ef_search tune IVF/HNSW recall vs latency per call."""
         q = np.asarray(query_vecs, dtype="float32")
         if q.ndim != 2 or q.shape[1] != self.dim:
             raise ValueError(f"Bad query shape {q.shape}; expected (Q, {self.dim})")
-        scores, idx = self.index.search(q, k)
-        return scores, idx  # scores: (Q,k), idx: (Q,k)
+        results = []
+        if self.index is not None:
+            params = ann.search_params(self.index_spec, nprobe, ef_search)
+            results.append(self.index.search(q, k, params=params))
+        results += self._exact_search(q, k, start=self.index_rows)
+        if not results:
+            return (np.full((q.shape[0], k), -np.finfo("float32").max, dtype="float32"),
+                    np.full((q.shape[0], k), -1, dtype="int64"))
+        if len(results) == 1:
+            return results[0]  # scores: (Q,k), idx: (Q,k)
+        scores, idx = np.hstack([r[0] for r in results]), np.hstack([r[1] for r in results])
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(idx, top, axis=1)
 
     # ---------- NEW: persistence helpers ----------
     def to_numpy(self) -> Tuple[np.ndarray, List[dict]]:
         """
         Return (matrix, metas) for persistence.
-        Matrix is float32 (N, dim) with rows normalized for cosine/IP.
+        Matrix is float32 (N, dim) with rows normalized for cosine/IP; a zero-copy read-only
+        view when the store holds a single block.
         """
-        if self._matrix is None:
-            return np.empty((0, self.dim), dtype="float32"), []
-        return self._matrix.astype("float32", copy=False), list(self._metas)
+        return self._matrix(), list(self._metas)
 
     @classmethod
-    def from_numpy(cls, vecs: np.ndarray, metas: List[dict], dim: int) -> "FaissStore":
+    def from_numpy(cls, vecs: np.ndarray, metas: Sequence[dict], dim: int,
+                   index_spec: Optional[dict] = None) -> "FaissStore":
         """
-        Rebuild a store from a matrix + metas.
+        Rebuild a store from a matrix + metas (the matrix is adopted, not copied).
         """
-        store = cls(dim)
+        store = cls(dim, index_spec)
         if vecs.size:
-            store.add(vecs, metas)
+            store.attach(vecs, metas)
+        store.build_index()
         return store
 
     # (Optional convenience)
     def ntotal(self) -> int:
-        return self.index.ntotal
+        return len(self._metas)
+
+    def nbytes(self) -> int:
+        """Approximate private resident size; memory-mapped blocks live in the shared page cache."""
+        arrays = (b.codes if isinstance(b, quantize.CompactBlock) else b for b in self._blocks)
+        private = sum(a.nbytes for a in arrays if not isinstance(a, np.memmap))
+        if self.index is not None:
+            private += ann.estimate_nbytes(self.index_spec, self.index.ntotal, self.dim)
+        if self.bm25 is not None:
+            private += self.bm25.nbytes
+        return private + self._buffer.nbytes + self._metas.nbytes
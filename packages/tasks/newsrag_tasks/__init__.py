@@ -1 +1 @@
-__all__ = ["celery_app", "tasks"]
+__all__ = ["celery_app", "tasks", "answer_cache"]
@@ -0,0 +1,81 @@
+# packages/tasks/newsrag_tasks/answer_cache.py
+"""
+Cache of finished answers (retrieval + synthesis + verification), the most expensive path
+we serve.
+
+An answer is keyed on the corpus manifest version, the normalized question, the retrieval
+parameters (retriever, k, max_per_url, alpha) and the LLM / embedding models:
+    answer:{corpus_id}:{version}:{sha1(question|retriever|k|max_per_url|alpha|models)}
+Publishing a segment (or compacting) bumps the version, so answers against an older corpus
+are simply never looked up again and expire after ANSWER_CACHE_TTL_SEC. The task fills the
+cache. The API checks it before enqueueing a job, taking the version from the Redis key that
+storage updates on every publish (corpus_version:{id}), so it never reads the manifest itself;
+any failure there is a miss and the job is enqueued as usual. Answers that carry an LLM
+error are not cached.
+"""
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, Optional
+
+from newsrag_cache import get_json, get_redis, key_answer, key_corpus_version, set_json, sha1
+from newsrag_core.config import LLM_MODEL
+from newsrag_retrieval.embeddings import EMBED_MODEL
+
+ANSWER_CACHE_ENABLE = os.getenv("ANSWER_CACHE_ENABLE", "1") != "0"
+ANSWER_CACHE_TTL_SEC = int(os.getenv("ANSWER_CACHE_TTL_SEC", "86400"))  # 1d
+# Concurrent identical questions wait on one computation (single_flight): its lease, and how
+# long the others wait for it, must cover retrieval + synthesis + verification, or they
+# recompute the answer the lease was meant to share
+ANSWER_LEASE_SEC = float(os.getenv("ANSWER_LEASE_SEC", "180"))
+
+_SPACE = re.compile(r"\s+")
+
+stats = {"hits": 0, "misses": 0, "stores": 0}
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question."""
+    return _SPACE.sub(" ", question).strip().rstrip("?!. ").casefold()
+
+
+def answer_key(corpus_id: str, version: Optional[int], question: str, retriever: str, k: int,
+               max_per_url: int, alpha: float) -> Optional[str]:
+    """Cache key of an answer; None when caching is off or the corpus has no version."""
+    if not ANSWER_CACHE_ENABLE or version is None:
+        return None
+    parts = [normalize_question(question), retriever, str(int(k)), str(int(max_per_url)),
+             repr(float(alpha)), LLM_MODEL, EMBED_MODEL]
+    return key_answer(corpus_id, int(version), sha1("\x1f".join(parts)))
+
+
+def get_answer(key: Optional[str], count: bool = True) -> Optional[Dict[str, Any]]:
+    if key is None:
+        return None
+    value = get_json(get_redis(), key)
+    if count:
+        stats["hits" if value is not None else "misses"] += 1
+    return value
+
+
+def put_answer(key: Optional[str], answer: Dict[str, Any]) -> None:
+    if key is None or "error" in answer:
+        return
+    set_json(get_redis(), key, answer, ttl_sec=ANSWER_CACHE_TTL_SEC)
+    stats["stores"] += 1
+
+
+def lookup(corpus_id: str, question: str, retriever: str, k: int, max_per_url: int,
+           alpha: float) -> Optional[Dict[str, Any]]:
+    """The cached answer against the corpus' current version, if any; None on any error."""
+    if not ANSWER_CACHE_ENABLE:
+        return None
+    try:
+        r = get_redis()
+        version = r.get(key_corpus_version(corpus_id)) if r is not None else None
+        if version is None:
+            return None
+        return get_answer(answer_key(corpus_id, int(version), question, retriever, k, max_per_url, alpha))
+    except Exception:
+        return None
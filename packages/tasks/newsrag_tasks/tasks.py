@@ -1,8 +1,13 @@
 # packages/tasks/newsrag_tasks/tasks.py
 from __future__ import annotations
 
-from typing import List, Tuple, Dict, Any
-import numpy as np
+import json
+import os
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional
 
 # Celery app
 from .celery_app import app
@@ -12,8 +17,18 @@ from newsrag_feeds import fetch_topics_once
 
 # Retrieval plumbing
 from newsrag_retrieval.vector_faiss import FaissStore
-from newsrag_retrieval.embeddings import embed_texts, embedding_dim, EMBED_MODEL
-from newsrag_retrieval.storage import save as storage_save, load as storage_load
+from newsrag_retrieval.embeddings import embed_queries, embed_stats, embedding_dim, EMBED_DIMENSIONS, EMBED_MODEL
+from newsrag_retrieval.storage import append as storage_append, compact as storage_compact, has_index, load_manifest
+from newsrag_retrieval.quantize import VECTOR_DTYPE, check_dtype
+from newsrag_retrieval.corpus_cache import (get_store, invalidate as invalidate_store, cache_stats as corpus_cache_stats,
+                                            train_index)
+from newsrag_cache import (get_redis, key_compact, key_corpus_aliases, key_corpus_pages, l1_stats, redis_status,
+                           single_flight)
+from newsrag_retrieval.ann import resolve_spec
+from newsrag_retrieval.neardup import DEDUP_ENABLE, corpus_index, resolve as resolve_dups
+
+# Finished answers per corpus version (also read by the API before enqueueing)
+from . import answer_cache
 
 # Ingestion (fetch + extract + chunk)
 from newsrag_retrieval.ingest import ingest_urls as ingest_urls_sync
@@ -27,37 +42,173 @@ except Exception:  # pragma: no cover
 
 # Optional hybrid retrieval; we’ll fall back to vector-only if not present
 try:
-    from newsrag_retrieval.hybrid import hybrid_retrieve
+    from newsrag_retrieval.hybrid import fuse_hits, OVERFETCH as HYBRID_OVERFETCH
 except Exception:  # pragma: no cover
-    hybrid_retrieve = None  # type: ignore
+    fuse_hits = None  # type: ignore
+
+
+# Merge a corpus' segments once an ingest leaves more than this many behind
+COMPACT_MAX_SEGMENTS = int(os.getenv("COMPACT_MAX_SEGMENTS", "64"))
+# At most one compaction per corpus is queued/running; the lease expires after this long
+# in case the compaction task never ran or crashed before releasing it
+COMPACT_LEASE_SEC = int(os.getenv("COMPACT_LEASE_SEC", "900"))
+# Parallel LLM synthesis calls per batch query task
+SYNTH_CONCURRENCY = int(os.getenv("SYNTH_CONCURRENCY", "4"))
 
 
 # -------------------------
 # Helpers
 # -------------------------
 
-def _build_store_from_vectors(vecs: np.ndarray, metas: List[Dict[str, Any]]) -> FaissStore:
-    dim = vecs.shape[1] if vecs.size else embedding_dim()
-    store = FaissStore(dim)
-    if vecs.size:
-        store.add(vecs, metas)
-    return store
-
-
-def _vector_retrieve(store: FaissStore, query: str, k: int = 6) -> List[Dict[str, Any]]:
-    """Simple vector-only retrieval; returns list of meta dicts with ._score added."""
-    q_vec = np.asarray(embed_texts([query])[0], dtype="float32")[None, :]
-    scores, idx = store.search(q_vec, k)
-    ixs = idx[0]
-    scr = scores[0]
-    out: List[Dict[str, Any]] = []
-    for rank, (i, s) in enumerate(zip(ixs.tolist(), scr.tolist())):
-        if i < 0:
-            continue
-        m = dict(store.metas[i])  # copy
-        m["_score"] = float(s)
-        m["_rank"] = rank
-        out.append(m)
+def _indexed_hashes(corpus_id: str, urls: List[str]) -> Dict[str, str]:
+    """{url: content hash} for the pages of this batch already indexed into the corpus (best-effort)."""
+    r = get_redis()
+    if r is None or not urls:
+        return {}
+    try:
+        return {u: h for u, h in zip(urls, r.hmget(key_corpus_pages(corpus_id), urls)) if h}
+    except Exception:
+        return {}
+
+
+def _record_hashes(corpus_id: str, hashes: Dict[str, str]) -> None:
+    r = get_redis()
+    if r is None or not hashes:
+        return
+    try:
+        r.hset(key_corpus_pages(corpus_id), mapping=hashes)
+    except Exception:
+        pass
+
+
+_local_compactions: Dict[str, float] = {}  # corpus_id -> lease expiry, when Redis is unavailable
+_local_compactions_lock = threading.Lock()
+
+
+def _claim_compaction(corpus_id: str) -> bool:
+    """Take the per-corpus compaction lease (SET NX EX); False if a compaction is already pending."""
+    r = get_redis()
+    if r is not None:
+        try:
+            return bool(r.set(key_compact(corpus_id), "1", nx=True, ex=COMPACT_LEASE_SEC))
+        except Exception:
+            pass
+    now = time.monotonic()
+    with _local_compactions_lock:
+        if _local_compactions.get(corpus_id, 0.0) > now:
+            return False
+        _local_compactions[corpus_id] = now + COMPACT_LEASE_SEC
+        return True
+
+
+def _release_compaction(corpus_id: str) -> None:
+    with _local_compactions_lock:
+        _local_compactions.pop(corpus_id, None)
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.delete(key_compact(corpus_id))
+    except Exception:
+        pass
+
+
+def _record_aliases(corpus_id: str, dups: List[Tuple[str, Any]]) -> int:
+    """Record near-duplicate URLs against the surviving chunks already in the corpus (best-effort)."""
+    r = get_redis()
+    if r is None or not dups:
+        return 0
+    try:
+        fields: Dict[str, List[str]] = {}
+        for (url, chunk), (alt, _) in zip(resolve_dups(corpus_id, [ref for _, ref in dups]), dups):
+            if alt != url:
+                fields.setdefault(f"{url}#{chunk}", []).append(alt)
+        if not fields:
+            return 0
+        key = key_corpus_aliases(corpus_id)
+        for f, old in zip(fields, r.hmget(key, list(fields))):
+            fields[f] = list(dict.fromkeys((json.loads(old) if old else []) + fields[f]))
+        r.hset(key, mapping={f: json.dumps(v) for f, v in fields.items()})
+        return len(fields)
+    except Exception:
+        return 0
+
+
+def _attach_aliases(corpus_id: str, sources: List[Dict[str, Any]]) -> None:
+    """Merge alternate URLs recorded in Redis into answer sources' "alt_urls" (best-effort)."""
+    r = get_redis()
+    if r is None or not sources:
+        return
+    try:
+        found = r.hmget(key_corpus_aliases(corpus_id), [f"{s['url']}#{s['chunk']}" for s in sources])
+    except Exception:
+        return
+    for src, alts in zip(sources, found):
+        if alts:
+            src["alt_urls"] = list(dict.fromkeys(src.get("alt_urls", []) + json.loads(alts)))
+
+
+def _corpus_options(corpus_id: str, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Embedding width and vector storage of a corpus. Both are fixed when the corpus is created
+    (from `options`, else EMBED_DIMENSIONS / VECTOR_DTYPE); later batches follow the manifest.
+    """
+    try:
+        manifest = load_manifest(corpus_id)
+    except FileNotFoundError:
+        options = options or {}
+        dims = options.get("dimensions") or EMBED_DIMENSIONS
+        if dims:
+            embedding_dim(dims)  # reject widths the model can't produce before fetching anything
+        return {"dimensions": dims, "vector_dtype": check_dtype(options.get("vector_dtype") or VECTOR_DTYPE)}
+    return {"dimensions": int(manifest["dim"]), "vector_dtype": manifest.get("vector_dtype", "float32")}
+
+
+def _retrieve_many(store: FaissStore, questions: List[str], retriever: str, k: int,
+                   max_per_url: int, alpha: float) -> List[List[Tuple[dict, float]]]:
+    """
+    Retrieve for several questions at once: one embeddings call and one (Q, dim) search,
+    then per-question hybrid fusion (or plain vector top-k). Returns (meta, score) lists.
+    """
+    qvecs = embed_queries(questions, dimensions=store.dim)
+    use_hybrid = retriever == "hybrid" and fuse_hits is not None
+    scores, idx = store.search(qvecs, max(k * HYBRID_OVERFETCH, k) if use_hybrid else k)
+    out: List[List[Tuple[dict, float]]] = []
+    for question, row_scores, row_idx in zip(questions, scores, idx):
+        if use_hybrid:
+            out.append(fuse_hits(store, question, row_scores, row_idx, k, alpha, max_per_url))
+        else:
+            out.append([(store.metas[i], float(s)) for i, s in zip(row_idx.tolist(), row_scores.tolist()) if i >= 0])
+    return out
+
+
+def _format_context(hits: List[Tuple[dict, float]], max_chars_per_snippet: int = 900) -> str:
+    parts = []
+    for i, (m, _) in enumerate(hits, 1):
+        snippet = textwrap.shorten((m.get("text") or "").replace("\n", " "), width=max_chars_per_snippet, placeholder="…")
+        parts.append(f"[{i}] ({m.get('url')}#chunk{m.get('chunk')})\n{snippet}")
+    return "\n\n".join(parts)
+
+
+def _answer_from_hits(question: str, hits: List[Tuple[dict, float]]) -> Dict[str, Any]:
+    """LLM synthesis (+ optional verification) over already-retrieved hits."""
+    answer = synthesize(question, _format_context(hits))
+    bullets = answer.get("bullets") or []
+    contexts = [m.get("text", "") for m, _ in hits if m.get("text")]
+
+    # Optional verification pass
+    if verify_bullets is not None:
+        bullets = verify_bullets(question, bullets, contexts)
+
+    out = {
+        "tldr": answer.get("tldr"),
+        "bullets": bullets,
+        "sources": [{"url": m.get("url"), "title": m.get("title"), "chunk": m.get("chunk"),
+                     "score": s, "rank": rank, "alt_urls": list(m.get("alt_urls") or [])}
+                    for rank, (m, s) in enumerate(hits)],
+    }
+    if "error" in answer:
+        out["error"] = answer["error"]
     return out
 
 
@@ -66,25 +217,82 @@ def _vector_retrieve(store: FaissStore, query: str, k: int = 6) -> List[Dict[str
 # -------------------------
 
 @app.task(bind=True, name="ingest_urls_task")
-def ingest_urls_task(self, corpus_id: str, urls: List[str]) -> Dict[str, Any]:
+def ingest_urls_task(self, corpus_id: str, urls: List[str],
+                     options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Fetch, extract & chunk URLs → embed → build FAISS → persist via storage backend (FS or S3).
-    Persists three artifacts per corpus: vectors.npy, meta.pkl, manifest.json.
+    Fetch, extract, chunk & embed URLs → publish the batch as a new immutable segment of the corpus.
+    Earlier segments are never rewritten, so cost scales with the batch, and concurrent
+    ingest workers can append to the same corpus (the manifest swap is atomic).
+    options (used when this batch creates the corpus): {"dimensions": truncated embedding
+    width, "vector_dtype": "float32" | "float16" | "int8"}.
     """
-    # 1) Ingest → texts + metas (each meta at least contains 'url', maybe 'title', 'chunk_id', etc.)
-    texts, metas = ingest_urls_sync(urls)
+    opts = _corpus_options(corpus_id, options)
+    # 1) Ingest → vectors + metas (each meta at least contains 'url', 'chunk', 'text'); vectors are L2-normalized
+    # Pages already indexed with the same content (304 / same hash) are skipped entirely.
+    indexed = _indexed_hashes(corpus_id, urls)
+    known = dict(indexed)
+    # Near-copies of chunks already in the corpus (syndicated stories) are not embedded again;
+    # their URLs are recorded as aliases of the surviving chunks.
+    stages: Dict[str, Any] = {}  # per-stage throughput of the fetch → extract/chunk → embed pipeline
+    dedup = corpus_index(corpus_id).batch() if DEDUP_ENABLE else None
+    dups: List[Tuple[str, Any]] = []
+    vecs, metas, _ = ingest_urls_sync(urls, indexed=indexed, stats=stages, dedup=dedup, aliases=dups,
+                                      dimensions=opts["dimensions"])
+    changed = {u: h for u, h in indexed.items() if known.get(u) != h}
+    if not metas:
+        _record_aliases(corpus_id, dups)
+        _record_hashes(corpus_id, changed)  # pages whose chunks were all near-copies count as indexed
+        return {"corpus_id": corpus_id, "chunks_indexed": 0, "pages_indexed": len(changed),
+                "duplicates": len(dups), "stages": stages}
 
-    # 2) Embed (already L2-normalized by our embed_texts implementation)
-    vecs = np.asarray(embed_texts(texts), dtype="float32")
+    # 2) Append a segment via the storage backend (FS or S3)
+    # (the "index" spec and embed_dimensions only apply when this batch creates the corpus)
+    manifest = storage_append(corpus_id, vecs, metas, {"embed_model": EMBED_MODEL, "dim": int(vecs.shape[1]),
+                                                       "embed_dimensions": opts["dimensions"],
+                                                       "vector_dtype": opts["vector_dtype"],
+                                                       "index": resolve_spec()})
+    _record_hashes(corpus_id, changed)  # only once the segment is published
+    _record_aliases(corpus_id, dups)
+    if len(manifest["segments"]) > COMPACT_MAX_SEGMENTS:
+        if _claim_compaction(corpus_id):
+            try:
+                compact_corpus_task.delay(corpus_id)  # merges, then trains the index
+            except Exception:
+                _release_compaction(corpus_id)
+                raise
+    elif not has_index(manifest) and _claim_compaction(corpus_id):
+        # e.g. the corpus just grew past its spec's min_rows (a no-op for flat corpora);
+        # under the compaction lease, so it never races a compaction's training
+        try:
+            manifest = train_index(corpus_id, manifest) or manifest
+        finally:
+            _release_compaction(corpus_id)
+    return {"corpus_id": corpus_id, "chunks_indexed": len(metas), "pages_indexed": len(changed),
+            "duplicates": len(dups),
+            "dim": manifest["dim"],
+            "doc_count": manifest["doc_count"], "version": manifest["version"], "stages": stages}
 
-    # 3) Build store in-memory (for immediate use) and persist artifacts via storage backend
-    store = _build_store_from_vectors(vecs, metas)
-    matrix, metas_out = store.to_numpy()
-    manifest = {"embed_model": EMBED_MODEL, "dim": int(matrix.shape[1] if matrix.size else embedding_dim()),
-                "doc_count": len(metas_out)}
 
-    storage_save(corpus_id, matrix, metas_out, manifest)
-    return {"corpus_id": corpus_id, "chunks_indexed": len(metas_out), "dim": manifest["dim"]}
+@app.task(bind=True, name="compact_corpus_task")
+def compact_corpus_task(self, corpus_id: str, index: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Merge a corpus' segments into one, optionally switching its ANN index spec
+    (e.g. {"type": "hnsw"} or {"type": "ivf_flat", "nlist": 4096}; see newsrag_retrieval.ann),
+    then train the index and persist it; the workers' corpus caches load it on their next
+    revalidation (queries never train).
+    """
+    try:
+        manifest = storage_compact(corpus_id, {"index": resolve_spec(index)} if index else None)
+        if manifest is not None:
+            manifest = train_index(corpus_id, manifest) or manifest
+    finally:
+        _release_compaction(corpus_id)  # later ingests may queue the next one
+    if manifest is None:  # a concurrent compaction already merged these segments
+        return {"corpus_id": corpus_id, "compacted": False}
+    invalidate_store(corpus_id)
+    return {"corpus_id": corpus_id, "compacted": True, "doc_count": manifest["doc_count"],
+            "version": manifest["version"], "index": manifest.get("index"),
+            "index_rows": int((manifest.get("index_file") or {}).get("rows", 0))}
 
 
 @app.task(bind=True, name="answer_question_task")
@@ -96,53 +304,78 @@ def answer_question_task(self,
                          max_per_url: int = 2,
                          alpha: float = 0.6) -> Dict[str, Any]:
     """
-    Load persisted store (FS/S3) → retrieve (hybrid or vector) → LLM synth → optional verification.
-    Returns TL;DR, bullets, and sources.
+    Get the resident store (loaded once per worker, refreshed as segments land) → retrieve (hybrid or vector) → LLM synth → optional verification.
+    Returns TL;DR, bullets, and sources. Answers are cached per corpus version (answer_cache.py);
+    concurrent identical questions are answered once.
     """
-    # 1) Load vectors + metas from storage
-    vecs, metas, manifest = storage_load(corpus_id)
-    dim = int(manifest.get("dim", vecs.shape[1] if vecs.size else embedding_dim()))
-    store = FaissStore.from_numpy(vecs, metas, dim)
-
-    # 2) Retrieve
-    if retriever == "hybrid" and hybrid_retrieve is not None:
-        hits = hybrid_retrieve(
-            question=question,
-            store=store,
-            k=k,
-            max_per_url=max_per_url,
-            alpha=alpha
-        )
-        # hits should be a list[meta dict] with scores; if your hybrid returns a different shape, adapt here
+    # 1) Store from the per-worker corpus cache (revalidated against the manifest)
+    store, manifest = get_store(corpus_id)
+    key = answer_cache.answer_key(corpus_id, manifest.get("version"), question, retriever, k, max_per_url, alpha)
+
+    def compute() -> Dict[str, Any]:
+        # 2) Retrieve (hybrid or vector)
+        hits = _retrieve_many(store, [question], retriever, k, max_per_url, alpha)[0]
+
+        # 3) Synthesize (+ optional verification)
+        result = {
+            **_answer_from_hits(question, hits),
+            "retriever": ("hybrid" if retriever == "hybrid" and fuse_hits else "vector"),
+            "corpus_id": corpus_id,
+            "version": manifest.get("version"),
+        }
+        answer_cache.put_answer(key, result)
+        return result
+
+    answer = answer_cache.get_answer(key)
+    if answer is not None:
+        answer["cached"] = True
+    elif key is None:
+        answer = compute()
     else:
-        hits = _vector_retrieve(store, question, k=k)
-
-    # Build contexts for synthesis
-    # Expect each hit meta to include 'text' (the chunk); if your meta uses another key, adapt here.
-    contexts = [h.get("text", "") for h in hits if h.get("text")]
-    sources = [{
-        "url": h.get("url"),
-        "title": h.get("title"),
-        "score": h.get("_score"),
-        "rank": h.get("_rank")
-    } for h in hits]
-
-    # 3) Synthesize
-    tldr, bullets = synthesize(question, contexts)
-
-    # 4) Optional verification pass
-    if verify_bullets is not None:
-        bullets = verify_bullets(question, bullets, contexts)
+        answer = single_flight(key, compute, read=lambda: answer_cache.get_answer(key, count=False), r=get_redis(),
+                               lease_ttl_sec=answer_cache.ANSWER_LEASE_SEC, wait_sec=answer_cache.ANSWER_LEASE_SEC)
+    _attach_aliases(corpus_id, answer["sources"])  # may have grown without a new corpus version
+    return answer
+
+
+@app.task(bind=True, name="answer_questions_task")
+def answer_questions_task(self,
+                          corpus_id: str,
+                          questions: List[str],
+                          retriever: str = "hybrid",
+                          k: int = 6,
+                          max_per_url: int = 2,
+                          alpha: float = 0.6) -> Dict[str, Any]:
+    """
+    Answer N questions against one corpus: the store is fetched once, all questions are
+    embedded in one call and searched as one (Q, dim) batch, then synthesis fans out
+    over SYNTH_CONCURRENCY threads. Answers come back in question order.
+    """
+    store, manifest = get_store(corpus_id)
+    self.update_state(state="PROGRESS", meta={"step": "retrieve", "pct": 10})
+    hits = _retrieve_many(store, questions, retriever, k, max_per_url, alpha)
+
+    self.update_state(state="PROGRESS", meta={"step": "synthesize", "pct": 30})
+    with ThreadPoolExecutor(max_workers=max(1, min(SYNTH_CONCURRENCY, len(questions)))) as pool:
+        answers = list(pool.map(_answer_from_hits, questions, hits))
+    for a in answers:
+        _attach_aliases(corpus_id, a["sources"])
 
     return {
-        "tldr": tldr,
-        "bullets": bullets,
-        "sources": sources,
-        "retriever": ("hybrid" if retriever == "hybrid" and hybrid_retrieve else "vector"),
+        "answers": [{"question": q, **a} for q, a in zip(questions, answers)],
+        "retriever": ("hybrid" if retriever == "hybrid" and fuse_hits else "vector"),
         "corpus_id": corpus_id,
+        "version": manifest.get("version"),
     }
 
 
+@app.task(name="cache_stats_task")
+def cache_stats_task() -> Dict[str, Any]:
+    """Cache counters of the worker that runs it: resident corpora, L1 hit/miss, Redis breaker, embedding calls, answers."""
+    return {"corpus": corpus_cache_stats(), "l1": l1_stats(), "redis": redis_status(), "embed": embed_stats(),
+            "answers": dict(answer_cache.stats)}
+
+
 @app.task(bind=True, name="fetch_feeds_task")
 def fetch_feeds_task(self, corpus_id: str) -> Dict[str, Any]:
     """
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from newsrag_retrieval import ann
+from newsrag_retrieval.vector_faiss import FaissStore
+
+
+def _unit(n, dim, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("spec", [
+    {"type": "hnsw"},
+    {"type": "ivf_flat", "min_rows": 0, "nprobe": 64},
+    {"type": "ivf_pq", "min_rows": 0, "m": 8, "nbits": 6, "nprobe": 64},
+])
+def test_ann_index_finds_exact_neighbours(spec):
+    vecs = _unit(2000, 16)
+    store = FaissStore.from_numpy(vecs, [{"i": i} for i in range(2000)], 16, index_spec=spec)
+    assert store.index is not None
+    _, exact = FaissStore.from_numpy(vecs, [{}] * 2000, 16).search(vecs[:50], 5)
+    _, approx = store.search(vecs[:50], 5)
+    assert ann.recall_at_k(approx, exact) > 0.6
+
+    extra = _unit(10, 16, seed=1)
+    store.add(extra, [{"i": 2000 + i} for i in range(10)])
+    _, idx = store.search(extra, 1, nprobe=64, ef_search=128)
+    assert (idx[:, 0] >= 2000).mean() > 0.6
+
+
+def test_small_corpus_stays_exact():
+    store = FaissStore.from_numpy(_unit(100, 16), [{}] * 100, 16, index_spec={"type": "ivf_flat"})
+    assert store.index is None and store.index_spec["min_rows"] == 5000
+
+
+def test_unknown_index_type_is_rejected():
+    with pytest.raises(ValueError):
+        ann.resolve_spec({"type": "lsh"})
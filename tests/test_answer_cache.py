@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from newsrag_api.app import app
+from newsrag_api.routers import query as query_router
+from newsrag_retrieval import storage
+from newsrag_retrieval.vector_faiss import FaissStore
+from newsrag_tasks import answer_cache, tasks
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+
+@pytest.fixture
+def corpus(monkeypatch):
+    store = FaissStore.from_numpy(np.eye(2, dtype="float32"),
+                                  [{"url": "https://example.com/a", "chunk": 0, "text": "rates rise"},
+                                   {"url": "https://example.com/b", "chunk": 0, "text": "heat wave"}], 2)
+    state = {"manifest": {"version": 1}, "synth": 0, "error": False}
+    r = FakeRedis()
+
+    def synth(q, ctx):
+        state["synth"] += 1
+        out = {"tldr": q, "bullets": ["a", "b", "c"]}
+        return dict(out, error="rate limited") if state["error"] else out
+
+    monkeypatch.setattr(answer_cache, "get_redis", lambda: r)
+    monkeypatch.setattr(tasks, "get_redis", lambda: None)  # leases / aliases: local only
+    monkeypatch.setattr(tasks, "get_store", lambda corpus_id: (store, state["manifest"]))
+    monkeypatch.setattr(tasks, "embed_queries", lambda texts, dimensions=None: np.tile(np.float32([1, 0]), (len(texts), 1)))
+    monkeypatch.setattr(tasks, "synthesize", synth)
+    monkeypatch.setattr(tasks, "verify_bullets", None)
+    r.set("corpus_version:c", "1")
+    state["redis"] = r
+    return state
+
+
+def test_repeated_question_is_answered_from_cache_until_the_corpus_changes(corpus):
+    first = tasks.answer_question_task.run("c", "What about rates?", k=1)
+    again = tasks.answer_question_task.run("c", "  what about RATES ", k=1)
+    assert corpus["synth"] == 1 and again["cached"] and again["tldr"] == first["tldr"]
+    assert answer_cache.lookup("c", "what about rates", "hybrid", 1, 2, 0.6)["version"] == 1
+
+    tasks.answer_question_task.run("c", "What about rates?", k=2)  # different params
+    assert corpus["synth"] == 2
+
+    corpus["manifest"] = {"version": 2}  # new segment published
+    corpus["redis"].set("corpus_version:c", "2")
+    assert answer_cache.lookup("c", "What about rates?", "hybrid", 1, 2, 0.6) is None
+    tasks.answer_question_task.run("c", "What about rates?", k=1)
+    assert corpus["synth"] == 3
+
+
+def test_failed_answers_are_not_cached(corpus):
+    corpus["error"] = True
+    tasks.answer_question_task.run("c", "heat?", k=1)
+    tasks.answer_question_task.run("c", "heat?", k=1)
+    assert corpus["synth"] == 2
+
+
+def test_answer_lease_covers_llm_compute(corpus, monkeypatch):
+    calls = []
+    single_flight = tasks.single_flight
+
+    def spy(key, compute, **kw):
+        calls.append((kw["lease_ttl_sec"], kw["wait_sec"]))
+        return single_flight(key, compute, **kw)
+
+    monkeypatch.setattr(tasks, "single_flight", spy)
+    monkeypatch.setattr(answer_cache, "ANSWER_LEASE_SEC", 240.0)
+    tasks.answer_question_task.run("c", "heat?", k=1)
+    assert calls == [(240.0, 240.0)]
+
+
+def test_storage_publish_records_the_version_for_the_api(tmp_path, monkeypatch):
+    r = FakeRedis()
+    r.eval = lambda script, n, key, version: r.data.__setitem__(key, str(max(int(r.data.get(key, -1)), version)))
+    monkeypatch.setattr(storage, "BACKEND", "fs")
+    monkeypatch.setattr(storage, "RAGDB_ROOT", str(tmp_path))
+    monkeypatch.setattr(storage, "get_redis", lambda: r)
+    for _ in range(2):
+        manifest = storage.append("c", np.eye(2, dtype="float32"),
+                                  [{"url": "u", "chunk": i, "text": "t"} for i in range(2)], {"dim": 2})
+    assert r.get("corpus_version:c") == str(manifest["version"]) == "2"
+
+
+class BrokenRedis:
+    def get(self, key):
+        raise ConnectionError("redis down")
+
+
+@pytest.mark.parametrize("redis", [None, BrokenRedis()])
+def test_query_enqueues_when_the_cache_cannot_answer(monkeypatch, redis):
+    def broken_manifest(corpus_id):
+        raise RuntimeError("AccessDenied")
+
+    monkeypatch.setattr(storage, "load_manifest", broken_manifest)
+    monkeypatch.setattr(answer_cache, "get_redis", lambda: redis)
+    monkeypatch.setattr(query_router.answer_question_task, "delay", lambda *a: SimpleNamespace(id="job-1"))
+    resp = TestClient(app).post("/query", json={"corpus_id": "c", "question": "q"})
+    assert resp.status_code == 200 and resp.json()["job_id"] == "job-1" and not resp.json()["cached"]
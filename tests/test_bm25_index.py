@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from newsrag_retrieval import corpus_cache, storage
+from newsrag_retrieval.bm25_index import BM25Index, SegmentPostings
+
+TEXTS = [
+    "central bank raises interest rates",
+    "interest rates hold steady as inflation cools",
+    "football season opens with a record crowd",
+    "bank earnings beat forecasts",
+    "record heat wave across the region",
+]
+
+
+@pytest.fixture
+def ragdb(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "fs")
+    monkeypatch.setattr(storage, "RAGDB_ROOT", str(tmp_path))
+    corpus_cache.invalidate()
+    yield tmp_path
+    corpus_cache.invalidate()
+
+
+def test_segmented_index_matches_single_build():
+    whole = BM25Index.from_texts(TEXTS)
+    split = BM25Index()
+    split.add_segment(SegmentPostings.build(TEXTS[:2]))
+    split.add_segment(SegmentPostings.build(TEXTS[2:]))
+
+    query = ["interest", "rates", "bank"]
+    np.testing.assert_allclose(split.get_scores(query), whole.get_scores(query), rtol=1e-6)
+    ids, scores = whole.scores(query)
+    assert ids.tolist() == [0, 1, 3]
+    assert scores[0] == scores.max()
+    np.testing.assert_allclose(whole.get_scores(query, np.array([4, 3, 0])), whole.get_scores(query)[[4, 3, 0]])
+    assert whole.get_scores(["nomatch"]).sum() == 0
+
+
+def test_postings_roundtrip():
+    p = SegmentPostings.build(TEXTS)
+    blobs = p.encode()
+    q = SegmentPostings.decode(blobs.__getitem__)
+    for term in ("bank", "record", "missing"):
+        np.testing.assert_array_equal(p.postings(term)[0], q.postings(term)[0])
+        np.testing.assert_array_equal(p.postings(term)[1], q.postings(term)[1])
+
+
+def test_postings_are_persisted_per_segment_and_loaded(ragdb):
+    dim = 4
+    for lo, hi in ((0, 2), (2, 5)):
+        metas = [{"url": f"https://example.com/{i}", "chunk": 0, "text": TEXTS[i]} for i in range(lo, hi)]
+        vecs = np.eye(dim, dtype="float32")[np.arange(lo, hi) % dim]
+        manifest = storage.append("c", vecs, metas, {"embed_model": "m", "dim": dim})
+    for seg in manifest["segments"]:
+        assert os.path.exists(os.path.join(ragdb, "c", "segments", seg["id"], "bm25.npz"))
+
+    store, _ = corpus_cache.get_store("c")
+    assert len(store.bm25) == 5
+    np.testing.assert_allclose(store.bm25.get_scores(["record"]),
+                               BM25Index.from_texts(TEXTS).get_scores(["record"]), rtol=1e-6)
@@ -0,0 +1,204 @@
+import threading
+import time
+
+import numpy as np
+
+from newsrag_cache import client, local, decode_vector, encode_vector, mget_json, mget_vectors, mset_json, mset_vectors
+from newsrag_cache import LocalCache, single_flight, single_flight_many, tiered_mget_vectors, tiered_mset_vectors
+
+
+class FakeRedis:
+    """Just enough of redis.Redis (bytes mode) to count round trips."""
+
+    def __init__(self):
+        self.data, self.ttl, self.round_trips = {}, {}, 0
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(k) for k in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def get(self, k):
+        return self.data.get(k)
+
+
+class FakePipeline:
+    def __init__(self, r):
+        self.r, self.ops = r, []
+
+    def setex(self, k, ttl, v):
+        self.ops.append((k, v, ttl))
+
+    def set(self, k, v, nx=False, px=None):
+        self.ops.append(("setnx", k, v) if nx else (k, v, 0))
+
+    def eval(self, script, nkeys, k, token):
+        self.ops.append(("release", k, token))
+
+    def exists(self, k):
+        self.ops.append(("exists", k, None))
+
+    def execute(self):
+        self.r.round_trips += 1
+        out = []
+        for op in self.ops:
+            if op[0] == "setnx":
+                _, k, v = op
+                out.append(k not in self.r.data and self.r.data.setdefault(k, v.encode()) is not None)
+            elif op[0] == "release":
+                _, k, token = op
+                out.append(self.r.data.get(k) == token.encode() and self.r.data.pop(k) is not None)
+            elif op[0] == "exists":
+                out.append(int(op[1] in self.r.data))
+            else:
+                k, v, ttl = op
+                self.r.data[k] = v.encode() if isinstance(v, str) else v
+                self.r.ttl[k] = ttl
+                out.append(True)
+        return out
+
+
+def test_vector_codec_roundtrip():
+    v = np.random.default_rng(0).standard_normal(16).astype("float32")
+    np.testing.assert_array_equal(decode_vector(encode_vector(v)), v)
+    np.testing.assert_allclose(decode_vector(encode_vector(v, "float16")), v, rtol=1e-3, atol=1e-3)
+    assert len(encode_vector(v, "float16")) == 3 + 16 * 2
+    assert decode_vector(b"[0.1, 0.2]") is None and decode_vector(None) is None
+
+
+def test_bulk_ops_are_chunked_round_trips(monkeypatch):
+    monkeypatch.setattr(client, "PIPELINE_CHUNK", 500)
+    r = FakeRedis()
+    vecs = np.random.default_rng(1).random((2000, 8), dtype="float32")
+    keys = [f"embedb:m:{i}" for i in range(2000)]
+
+    mset_vectors(r, dict(zip(keys, vecs)), ttl_sec=60)
+    assert r.round_trips == 4 and set(r.ttl.values()) == {60}
+
+    got = mget_vectors(r, keys + ["missing"])
+    assert r.round_trips == 9
+    np.testing.assert_array_equal(np.vstack(got[:-1]), vecs)
+    assert got[-1] is None
+
+
+def test_mset_json_accepts_pairs():
+    r = FakeRedis()
+    mset_json(r, [("a", [1, 2]), ("b", {"x": 1})])
+    assert mget_json(r, ["a", "b", "c"]) == [[1, 2], {"x": 1}, None]
+    assert mget_json(None, ["a"]) == [None]
+
+
+def test_pooled_client_is_shared_and_breaker_trips(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1/0")  # nothing listens on port 1
+    client._reset_after_fork()
+    try:
+        r = client.get_redis()
+        assert r is not None and client.get_redis() is r and client.get_redis_bytes() is not r
+
+        for _ in range(client.BREAKER_FAILURES):
+            assert client.get_json(r, "k") is None
+        assert client.redis_status()["breaker_open"]
+        assert client.get_redis() is None
+
+        client._breaker._open_until = 0.0  # cooldown elapsed: one probe is let through
+        assert client.get_redis() is r
+    finally:
+        client._reset_after_fork()
+    assert client.redis_status()["pools"] == 0
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = client.CircuitBreaker(failures=2, cooldown_sec=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    def other_thread_allowed():
+        out = []
+        t = threading.Thread(target=lambda: out.append(breaker.allow()))
+        t.start()
+        t.join()
+        return out[0]
+
+    breaker._open_until = 0.0  # cooldown elapsed
+    assert breaker.allow() and not breaker.is_open  # this thread is the probe
+    assert not other_thread_allowed()
+    breaker.record_failure()  # failed probe: open again for a full cooldown
+    assert not breaker.allow() and breaker._open_until > 0
+
+    breaker._open_until = 0.0
+    assert other_thread_allowed() and not breaker.allow()  # the other thread probes this time
+    breaker.record_success()
+    assert breaker.allow() and other_thread_allowed() and not breaker.is_open
+
+
+def test_local_cache_lru_and_ttl():
+    c = LocalCache(max_bytes=10, ttl_sec=60)
+    c.set("a", "12345")
+    c.set("b", "12345")
+    assert c.get("a") == "12345"  # a is now most recent
+    c.set("c", "123")
+    assert c.get("b") is None and c.get("a") == "12345" and c.get("c") == "123"
+    c.set("d", "x", ttl_sec=-1)
+    assert c.get("d") is None
+    s = c.stats()
+    assert (s["hits"], s["misses"], s["evictions"], s["bytes"]) == (3, 2, 1, 8)
+
+
+def test_tiered_vectors_hit_l1_before_redis(monkeypatch):
+    monkeypatch.setattr(local, "embed_l1", LocalCache(1 << 20, 60, "embed"))
+    r = FakeRedis()
+    v = np.arange(4, dtype="float32")
+    tiered_mset_vectors(r, {"k1": v})
+    assert r.round_trips == 1
+
+    got = tiered_mget_vectors(r, ["k1"])
+    np.testing.assert_array_equal(got[0], v)
+    assert r.round_trips == 1  # served from L1
+
+    local.embed_l1.clear()
+    tiered_mget_vectors(r, ["k1"])
+    assert r.round_trips == 2  # L2 read, promoted into L1
+    tiered_mget_vectors(r, ["k1"])
+    assert r.round_trips == 2 and local.embed_l1.stats()["hits"] == 2
+
+
+def test_single_flight_coalesces_threads():
+    calls = []
+
+    def compute(keys):
+        calls.append(list(keys))
+        time.sleep(0.2)
+        return [k.upper() for k in keys]
+
+    out = [None] * 6
+    threads = [threading.Thread(target=lambda i=i: out.__setitem__(i, single_flight_many(["a", "b"], compute)))
+               for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [["a", "b"]]
+    assert out == [["A", "B"]] * 6
+
+
+def test_single_flight_waits_for_lease_holder_in_another_worker():
+    r = FakeRedis()
+    r.data["lease:k"] = b"other-worker"
+
+    def other_worker_finishes():
+        time.sleep(0.15)
+        r.data["k"] = b'"v"'
+        del r.data["lease:k"]
+
+    threading.Thread(target=other_worker_finishes).start()
+    computed = []
+    val = single_flight("k", lambda: computed.append(1) or "mine",
+                        read=lambda: client.get_json(r, "k"), r=r)
+    assert val == "v" and not computed
+
+    # lease released without a value (holder failed): compute locally, and take + release the lease
+    assert single_flight("k2", lambda: "mine", read=lambda: None, r=r) == "mine"
+    assert "lease:k2" not in r.data
@@ -0,0 +1,38 @@
+from newsrag_retrieval.chunking import _estimate, token_chunks
+
+TEXT = ("The council met on Tuesday. It approved the plan by seven votes to two! "
+        "Critics asked about the cost? Officials said funding was secured.\n\n"
+        + " ".join(f"Paragraph two has sentence {i}, which is a bit longer than the others." for i in range(30)))
+
+
+def _count(s):
+    return len(s.split())  # deterministic stand-in for a tokenizer
+
+
+def test_chunks_are_offset_slices_on_sentence_boundaries():
+    chunks = list(token_chunks(TEXT, max_tokens=40, overlap_tokens=10, count=_count))
+    assert len(chunks) > 3
+    for c in chunks:
+        assert TEXT[c.start:c.end] == c.text
+        assert c.tokens <= 40 and c.tokens == _count(c.text)
+        assert c.text[-1] in ".!?"  # never cut mid-sentence
+    assert chunks[0].text.endswith("funding was secured.")  # paragraph break closes a half-full chunk
+    assert chunks[-1].end == len(TEXT)
+    # consecutive chunks overlap by whole sentences or abut; no text is skipped
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.start < b.start and (b.start < a.end or not TEXT[a.end:b.start].strip())
+    assert any(b.start < a.end for a, b in zip(chunks, chunks[1:]))
+
+
+def test_long_sentences_split_at_words_and_is_lazy():
+    text = "word " * 500
+    chunks = list(token_chunks(text, max_tokens=64, overlap_tokens=8, count=_count))
+    assert all(c.tokens <= 64 and not c.text.startswith(" ") for c in chunks)
+    assert sum(c.tokens for c in chunks) == 500
+    gen = token_chunks("A. " * 100_000, max_tokens=10, count=_count)
+    assert next(gen).text.startswith("A. A.")  # streams without chunking the whole text first
+
+
+def test_empty_and_estimate():
+    assert list(token_chunks("")) == [] and list(token_chunks("  \n\n ")) == []
+    assert _estimate("abcd" * 10) == 10
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from newsrag_retrieval import storage
+from newsrag_retrieval.corpus_cache import CorpusCache, train_index
+from newsrag_retrieval.vector_faiss import FaissStore
+
+
+@pytest.fixture
+def ragdb(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "fs")
+    monkeypatch.setattr(storage, "RAGDB_ROOT", str(tmp_path))
+    return tmp_path
+
+
+def _append(corpus_id, n, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, 4)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    metas = [{"url": f"https://example.com/{seed}", "chunk": i, "text": "t"} for i in range(n)]
+    return storage.append(corpus_id, vecs, metas, {"embed_model": "m", "dim": 4})
+
+
+def test_store_stays_resident_and_picks_up_new_segments(ragdb):
+    cache = CorpusCache(revalidate_sec=0)
+    _append("c", 3)
+    store, _ = cache.get("c")
+    assert cache.get("c")[0] is store and store.ntotal() == 3
+
+    _append("c", 2, seed=1)
+    refreshed, manifest = cache.get("c")
+    assert refreshed.ntotal() == 5 and manifest["doc_count"] == 5
+    assert store.ntotal() == len(store.bm25) == 3  # readers holding the old store see it unchanged
+    assert refreshed._blocks[0] is store._blocks[0]  # resident segments are shared, not reloaded
+    assert cache.stats()["misses"] == 1 and cache.stats()["refreshes"] == 1
+
+
+def test_failed_refresh_drops_the_entry(ragdb, monkeypatch):
+    cache = CorpusCache(revalidate_sec=0)
+    _append("c", 3)
+    store, _ = cache.get("c")
+    _append("c", 2, seed=1)
+    _append("c", 4, seed=2)
+
+    attach, calls = CorpusCache._attach, []
+
+    def flaky_attach(self, corpus_id, target, seg):
+        calls.append(seg["id"])
+        if len(calls) == 2:
+            raise OSError("segment read failed")
+        attach(self, corpus_id, target, seg)
+
+    monkeypatch.setattr(CorpusCache, "_attach", flaky_attach)
+    with pytest.raises(OSError):
+        cache.get("c")
+    assert store.ntotal() == 3 and cache.stats()["corpora"] == 0
+
+    monkeypatch.setattr(CorpusCache, "_attach", attach)
+    reloaded, _ = cache.get("c")
+    assert reloaded.ntotal() == len(reloaded.bm25) == 9
+    _, idx = reloaded.search(storage.load("c", mmap=False)[0][[8]], 1)
+    assert idx[0, 0] == 8
+
+
+def test_compaction_triggers_full_reload(ragdb):
+    cache = CorpusCache(revalidate_sec=0)
+    _append("c", 3)
+    store, _ = cache.get("c")
+    vecs, metas, manifest = storage.load("c")
+    storage.save("c", vecs[:1], metas[:1], manifest)
+    reloaded, _ = cache.get("c")
+    assert reloaded is not store and reloaded.ntotal() == 1
+
+
+def test_segments_are_memory_mapped(ragdb):
+    _append("c", 3)
+    _append("c", 2, seed=1)
+    store, _ = CorpusCache().get("c")
+    assert all(isinstance(b, np.memmap) for b in store._blocks)
+    assert store.nbytes() == store.metas.nbytes + store.bm25.nbytes  # only metadata columns and postings are private
+
+    vecs, _, _ = storage.load("c", mmap=False)
+    _, idx = store.search(vecs[[1, 4]], 1)
+    assert idx[:, 0].tolist() == [1, 4]
+
+
+def test_lru_eviction_by_bytes(ragdb, monkeypatch):
+    monkeypatch.setattr(storage, "MMAP", False)
+    _append("a", 10)
+    _append("b", 10)
+    one_corpus = CorpusCache().get("a")[0].nbytes()
+    cache = CorpusCache(max_bytes=one_corpus, revalidate_sec=60)
+    cache.get("a")
+    cache.get("b")
+    assert cache.stats()["corpora"] == 1 and cache.stats()["evictions"] == 1
+
+
+def test_ann_index_is_trained_off_the_query_path(ragdb, monkeypatch):
+    vecs = np.random.default_rng(0).standard_normal((300, 4)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    metas = [{"url": "https://example.com/x", "chunk": i, "text": "t"} for i in range(300)]
+    storage.append("c", vecs, metas, {"embed_model": "m", "dim": 4, "index": {"type": "hnsw"}})
+
+    build_index = FaissStore.build_index
+
+    def no_training(self, spec=None):
+        raise AssertionError("queries must not train the index")
+
+    monkeypatch.setattr(FaissStore, "build_index", no_training)
+    cache = CorpusCache(revalidate_sec=0)
+    exact, _ = cache.get("c")
+    assert exact.index is None  # exact search until an index is published
+
+    monkeypatch.setattr(FaissStore, "build_index", build_index)
+    assert train_index("c")["index_file"]["rows"] == 300
+    monkeypatch.setattr(FaissStore, "build_index", no_training)
+    loaded, _ = cache.get("c")  # same segments, new index file: adopted on refresh
+    assert loaded.index_rows == 300 and exact.index is None
+
+    _append("c", 2, seed=7)  # lands in the exact-search tail
+    store, _ = cache.get("c")
+    tail, _, _ = storage.load("c")
+    _, idx = store.search(tail[300:], 1)
+    assert idx[:, 0].tolist() == [300, 301]
+
+    assert storage.compact("c") is not None
+    assert "index_file" not in storage.load_manifest("c")
@@ -0,0 +1,147 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from newsrag_cache import RateBudget
+from newsrag_retrieval import embeddings
+from newsrag_retrieval.microbatch import MicroBatcher
+
+
+class FakeEmbeddings:
+    """Embeds text i as [i, 1]; fails the first `fail` calls with a 429."""
+
+    def __init__(self, fail=0):
+        self.fail, self.calls, self.lock = fail, [], threading.Lock()
+        self.active = self.peak = 0
+
+    def create(self, model, input):
+        with self.lock:
+            self.calls.append(list(input))
+            if self.fail:
+                self.fail -= 1
+                resp = httpx.Response(429, request=httpx.Request("POST", "https://api.test/embeddings"))
+                raise openai.RateLimitError("slow down", response=resp, body=None)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(t.split()[1]), 1.0]) for t in input])
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setattr(embeddings, "ENABLE_CACHE", False)
+    monkeypatch.setattr(embeddings, "_backoff", lambda attempt, exc: 0.0)
+    monkeypatch.setattr(embeddings, "_budget", RateBudget("test", {}))
+    embeddings._reset_after_fork()
+    f = FakeEmbeddings()
+    monkeypatch.setattr(embeddings, "_client", SimpleNamespace(embeddings=f))
+    return f
+
+
+def test_sub_batches_run_concurrently_and_keep_order(fake, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBED_BATCH_TOKENS", 20)  # "text i" + padding ~ 5 tokens each
+    texts = [f"text {i} " + "pad " * 3 for i in range(40)]
+    vecs = embeddings.embed_texts(texts)
+    assert isinstance(vecs, np.ndarray) and vecs.dtype == np.float32 and vecs.shape == (40, 2)
+    assert len(fake.calls) > 4 and all(len(c) <= 4 for c in fake.calls)
+    assert fake.peak > 1
+    firsts = [v[0] / v[1] for v in vecs]  # rows are normalized; the ratio recovers i
+    assert [round(x) for x in firsts] == list(range(40))
+
+
+def test_query_embeddings_come_back_as_one_matrix(fake, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBED_MICROBATCH", True)
+    q = embeddings.embed_queries(["text 3", "text 5"])
+    assert q.dtype == np.float32 and q.shape == (2, 2) and [round(a / b) for a, b in q] == [3, 5]
+    assert embeddings.embed_queries([]).shape == (0, embeddings.embedding_dim())
+
+
+def test_retries_on_429(fake):
+    fake.fail = 2
+    before = embeddings.stats["rate_limited"]
+    assert len(embeddings.embed_texts(["text 7"])) == 1
+    assert len(fake.calls) == 3 and embeddings.stats["rate_limited"] == before + 2
+
+
+def test_gives_up_after_max_retries(fake, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBED_MAX_RETRIES", 1)
+    fake.fail = 5
+    with pytest.raises(openai.RateLimitError):
+        embeddings.embed_texts(["text 1"])
+
+
+def test_rate_budget_waits_for_next_window():
+    budget = RateBudget("t", {"tokens": 10, "requests": 100}, window_sec=0.3)
+    time.sleep(0.3 - time.time() % 0.3)  # start at a window boundary
+    assert budget.acquire({"tokens": 6, "requests": 1}) == 0.0
+    assert budget.acquire({"tokens": 50, "requests": 1}) > 0  # over budget: waits for a fresh window
+    with pytest.raises(TimeoutError):
+        budget.acquire({"tokens": 6, "requests": 1}, max_wait_sec=0.0)
+
+
+def test_microbatcher_coalesces_requests_queued_behind_a_call(fake, monkeypatch):
+    in_flight, release = threading.Event(), threading.Event()
+
+    def slow_embed(texts):
+        in_flight.set()
+        release.wait(5)
+        return embeddings.embed_texts(texts)
+
+    batcher = MicroBatcher(slow_embed, window_ms=200, max_items=64)
+    first = batcher.submit(["text 0"])
+    assert in_flight.wait(5)  # sent at once, alone
+    futures = {i: batcher.submit([f"text {i}", "text 99"]) for i in range(1, 8)}
+    release.set()
+
+    results = {i: fut.result() for i, fut in futures.items()}
+    assert first.result()[0][0] == 0
+    assert len(fake.calls) == 2 and sorted(fake.calls[1]) == sorted([f"text {i}" for i in range(1, 8)] + ["text 99"])
+    for i, (mine, shared) in results.items():
+        assert round(mine[0] / mine[1]) == i and round(shared[0] / shared[1]) == 99
+    st = batcher.stats()
+    assert st["batches"] == 2 and st["requests"] == 8 and st["items"] == 9 and st["max_batch"] == 8
+
+
+def test_microbatcher_does_not_hold_a_lone_request(fake):
+    batcher = MicroBatcher(embeddings.embed_texts, window_ms=10_000, max_items=64)
+    t = time.perf_counter()
+    assert len(batcher(["text 1"])) == 1 and len(batcher(["text 2"])) == 1
+    assert time.perf_counter() - t < 5 and batcher.stats()["batches"] == 2
+
+
+def test_microbatcher_flushes_at_max_items_and_propagates_errors(fake):
+    batcher = MicroBatcher(embeddings.embed_texts, window_ms=10_000, max_items=2)
+    t = time.perf_counter()
+    assert len(batcher(["text 1", "text 2"])) == 2
+    assert time.perf_counter() - t < 5  # full batch: no need to wait out the window
+
+    fake.fail = 100
+    with pytest.raises(openai.RateLimitError):
+        batcher(["text 3", "text 4"])
+    assert batcher.stats()["batches"] == 1
+
+
+def test_embedding_dim_comes_from_the_registry(fake, monkeypatch):
+    assert embeddings.embedding_dim() == embeddings.EMBED_DIMS[embeddings.EMBED_MODEL]
+    assert embeddings.embedding_dim(256) == 256
+    assert fake.calls == []
+    with pytest.raises(ValueError):
+        embeddings.embedding_dim(10_000)
+
+
+def test_truncated_dimensions_are_requested_and_cached_separately(fake, monkeypatch):
+    requested = []
+    create = fake.create
+    monkeypatch.setattr(fake, "create", lambda model, input, **kw: requested.append(kw) or create(model, input))
+    embeddings.embed_texts(["text 1"], dimensions=256)
+    embeddings.embed_texts(["text 1"], dimensions=embeddings.EMBED_DIMS[embeddings.EMBED_MODEL])
+    assert requested == [{"dimensions": 256}, {}]
+    assert embeddings._cache_model(256) != embeddings._cache_model(None)
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from newsrag_core.extract import extract_text
+
+FIXTURES = Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "html"
+
+PAGE = """<html><head><title>T</title><script>var x = 1;</script><style>.a{}</style></head>
+<body><nav>Home News</nav><!-- ad slot --><article><p>Hello <b>big</b>world</p>
+<noscript>enable js</noscript><p>Second   line</p></article></body></html>"""
+
+
+@pytest.mark.parametrize("name", sorted(p.stem for p in FIXTURES.glob("*.html")))
+def test_lxml_matches_bs4_on_fixtures(name):
+    html = (FIXTURES / f"{name}.html").read_text(encoding="utf-8")
+    assert extract_text(html, engine="lxml") == extract_text(html, engine="bs4")
+
+
+def test_lxml_drops_scripts_comments_and_prefers_article():
+    assert extract_text(PAGE, engine="lxml") == "Hello big world\n\nSecond line"
+    assert extract_text("<html><head><title> Only  title </title></head><body></body></html>", engine="lxml") == "Only title"
+    assert extract_text("", engine="lxml") == "" and extract_text("   ", engine="lxml") == ""
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_block_elements_become_paragraphs(engine):
+    html = """<body><article><h1>Title</h1>
+      <div><p>One,
+         two.</p><p>Three <i>four</i>.</p></div><ul><li>a</li><li>b<br>c</li></ul>tail</article></body>"""
+    assert extract_text(html, engine=engine) == "Title\n\nOne, two.\n\nThree four .\n\na\n\nb\n\nc\n\ntail"
+
+
+def test_readability_removes_boilerplate():
+    html = (FIXTURES / "div_layout.html").read_text(encoding="utf-8")
+    text = extract_text(html, engine="readability")
+    assert "cold-water coral reefs" in text
+    assert "Most read" not in text and "Log in" not in text
+
+
+def test_input_is_capped():
+    html = "<html><body><p>" + "word " * 1000 + "</p><p>TAIL</p></body></html>"
+    assert "TAIL" in extract_text(html, engine="lxml", max_chars=0)
+    capped = extract_text(html, engine="lxml", max_chars=200)
+    assert "TAIL" not in capped and capped.startswith("word")
+    with pytest.raises(ValueError):
+        extract_text(html, engine="nope")
@@ -0,0 +1,112 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from newsrag_core import fetcher
+
+
+class _SlowPages(BaseHTTPRequestHandler):
+    def do_GET(self):
+        delay = float(self.path.rsplit("/", 1)[-1])
+        time.sleep(delay)
+        body = f"<html><body><article>page {self.path}</article></body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _SlowPages)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+
+
+def test_batch_time_tracks_slowest_url_and_streams(server, monkeypatch):
+    monkeypatch.setattr(fetcher, "FETCH_PER_HOST", 8)
+    fetcher._reset_after_fork()  # fresh semaphores with the patched limit
+    urls = [f"{server}/a/0.4", f"{server}/b/0.4", f"{server}/c/0.4", f"{server}/d/0.05"]
+
+    t0 = time.monotonic()
+    got = list(fetcher.fetch_articles(urls))
+    elapsed = time.monotonic() - t0
+
+    assert elapsed < 1.0  # ~0.4s, not the 1.25s sum
+    assert got[0][0] == urls[3]  # fastest page is yielded first
+    assert sorted(u for u, _ in got) == sorted(urls)
+    assert all(text.startswith("page /") for _, text in got)
+
+
+def test_deadline_drops_slow_urls(server):
+    fetcher._reset_after_fork()
+    got = list(fetcher.fetch_articles([f"{server}/slow/2", f"{server}/fast/0"], deadline_sec=0.5))
+    assert [u for u, _ in got] == [f"{server}/fast/0"]
+
+
+def test_idle_host_semaphores_are_dropped(server):
+    fetcher._reset_after_fork()
+    local = server.replace("127.0.0.1", "localhost")  # a second host
+    got = list(fetcher.fetch_articles([f"{server}/a/0", f"{local}/b/0", f"{server}/slow/2"], deadline_sec=0.5))
+    assert len(got) == 2
+    hosts = fetcher._get_fetcher()._hosts
+    deadline = time.monotonic() + 1
+    while hosts and time.monotonic() < deadline:  # the cancelled fetch unwinds on the loop thread
+        time.sleep(0.01)
+    assert hosts == {}
+
+
+class _ETagPages(BaseHTTPRequestHandler):
+    hits = {"200": 0, "304": 0}
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            _ETagPages.hits["304"] += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        _ETagPages.hits["200"] += 1
+        body = b"<html><body><article>stable article text</article></body></html>"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_conditional_refresh_skips_unchanged_pages(monkeypatch):
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _ETagPages)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_address[1]}/article"
+    fetcher._reset_after_fork()
+    monkeypatch.setattr(fetcher, "PAGE_TTL", 0)  # always revalidate
+    try:
+        first = next(fetcher.fetch_pages([url]))
+        assert first.text == "stable article text" and not first.unchanged
+
+        second = next(fetcher.fetch_pages([url]))
+        assert second.unchanged and second.text == first.text and second.content_hash == first.content_hash
+        assert _ETagPages.hits == {"200": 1, "304": 1}
+
+        from newsrag_retrieval import ingest, pipeline
+        embedded = []
+        monkeypatch.setattr(pipeline, "embed_texts", lambda texts, dimensions=None: embedded.extend(texts) or [[1.0]] * len(texts))
+        indexed = {}
+        assert len(ingest.ingest_urls([url], indexed=indexed)[1]) == 1
+        assert indexed == {url: first.content_hash}
+        assert ingest.ingest_urls([url], indexed=indexed)[1] == []  # 304: nothing re-chunked or embedded
+        assert len(embedded) == 1
+    finally:
+        srv.shutdown()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from newsrag_retrieval.hybrid import fuse, hybrid_retrieve
+from newsrag_retrieval.vector_faiss import FaissStore
+
+TEXTS = [
+    "central bank raises interest rates",
+    "interest rates hold steady as inflation cools",
+    "football season opens with a record crowd",
+    "bank earnings beat forecasts",
+    "record heat wave across the region",
+    "bank holiday weekend traffic",
+]
+
+
+def _store():
+    vecs = np.eye(len(TEXTS), dtype="float32")
+    metas = [{"url": f"https://example.com/{i // 2}", "chunk": i % 2, "text": t} for i, t in enumerate(TEXTS)]
+    return FaissStore.from_numpy(vecs, metas, len(TEXTS))
+
+
+def _qvec(weights):
+    q = np.asarray(weights, dtype="float32")
+    return q / np.linalg.norm(q)
+
+
+def test_minmax_fusion_matches_reference():
+    vec_ids, vec_scores = np.array([3, 0, 5, -1]), np.array([0.9, 0.5, 0.1, -1e30], dtype="float32")
+    bm_ids, bm_scores = np.array([0, 5]), np.array([2.0, 1.0], dtype="float32")
+    ids, fused = fuse(vec_ids, vec_scores, bm_ids, bm_scores, n_docs=6, alpha=0.5, fusion="minmax")
+
+    v = {3: 1.0, 0: 0.5, 5: 0.0}
+    b = {3: 0.0, 0: 1.0, 5: 0.5}
+    ref = sorted(((i, 0.5 * v[i] + 0.5 * b[i]) for i in v), key=lambda x: -x[1])
+    assert ids.tolist() == [i for i, _ in ref]
+    np.testing.assert_allclose(fused, [s for _, s in ref], rtol=1e-6)
+
+
+def test_rrf_adds_lexical_only_candidates():
+    ids, fused = fuse(np.array([1, 2]), np.array([0.9, 0.8], dtype="float32"),
+                      np.array([0, 1]), np.array([3.0, 1.0], dtype="float32"),
+                      n_docs=6, alpha=0.5, fusion="rrf")
+    assert ids[0] == 1 and set(ids.tolist()) == {0, 1, 2}
+    assert np.all(np.diff(fused) <= 0)
+    with pytest.raises(ValueError):
+        fuse(ids, fused, ids, fused, n_docs=6, fusion="nope")
+
+
+def test_hybrid_retrieve_on_store_with_url_cap():
+    store = _store()
+    hits = hybrid_retrieve("bank", store, k=3, alpha=0.5, qvec=_qvec([1, 1, 0, 1, 0, 1]), max_per_url=1)
+    urls = [m["url"] for m, _ in hits]
+    assert len(hits) == 3 and len(set(urls)) == 3
+    assert all("bank" in m["text"] for m, _ in hits)
+    assert [s for _, s in hits] == sorted((s for _, s in hits), reverse=True)
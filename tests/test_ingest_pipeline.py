@@ -0,0 +1,103 @@
+import multiprocessing as mp
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from newsrag_cache.local import page_l1
+from newsrag_core import fetcher
+from newsrag_retrieval import pipeline
+
+
+class _Articles(BaseHTTPRequestHandler):
+    def do_GET(self):
+        n = int(self.path.rsplit("/", 1)[-1])
+        words = " ".join(f"w{n}_{i}" for i in range(400 * (n + 1)))  # pages of different sizes
+        body = f"<html><body><nav>menu</nav><article><p>{words}</p></article></body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def urls(monkeypatch):
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setattr(fetcher, "PAGE_TTL", 0)
+    monkeypatch.setattr(pipeline, "embed_texts", lambda texts, dimensions=None: np.array([[float(len(t))] for t in texts], dtype="float32"))
+    fetcher._reset_after_fork()
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Articles)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield [f"http://127.0.0.1:{srv.server_address[1]}/page/{i}" for i in range(6)]
+    srv.shutdown()
+
+
+def _by_url(metas):
+    return sorted((m["url"], m["chunk"], m["text"]) for m in metas)
+
+
+def test_pool_and_inline_pipelines_agree(urls, monkeypatch):
+    monkeypatch.setattr(pipeline, "INGEST_PROCESSES", 2)
+    pipeline._reset_after_fork()
+    try:
+        stats = {}
+        vecs, metas, texts = pipeline.run_ingest(urls, stats=stats, embed_batch=4)
+        assert stats["pool"] == "process:2"
+    finally:
+        pipeline.shutdown_pool()
+
+    assert len(vecs) == len(metas) == len(texts) > len(urls)
+    assert vecs.dtype == np.float32 and vecs[:, 0].tolist() == [float(len(t)) for t in texts]  # aligned with metas
+    assert {m["url"] for m in metas} == set(urls)
+    assert stats["fetch"]["items"] == stats["process"]["items"] == len(urls)
+    assert stats["embed"]["items"] == len(metas) and stats["embed"]["items_per_sec"] > 0
+
+    page_l1.clear()  # force re-extraction on the inline path
+    inline_stats = {}
+    _, inline_metas, _ = pipeline.run_ingest(urls, stats=inline_stats, inline=True)
+    assert inline_stats["pool"] == "inline"
+    assert _by_url(inline_metas) == _by_url(metas)
+
+
+def test_unchanged_pages_skip_chunking(urls):
+    indexed = {}
+    _, metas, _ = pipeline.run_ingest(urls[:2], indexed=indexed, inline=True)
+    assert set(indexed) == set(urls[:2]) and metas
+    vecs, metas, texts = pipeline.run_ingest(urls[:2], indexed=indexed, inline=True)
+    assert vecs.shape[0] == 0 and metas == texts == []
+
+
+def test_extracted_paragraphs_bound_chunks():
+    sentence = "The council met again today to debate the transit plan in detail. "  # ~17 tokens
+    first, second = (sentence * 10).strip(), (sentence.replace("council", "board") * 10).strip()
+    html = f"<html><body><article><p>{first}</p><p>{second}</p></article></body></html>"
+    text, chunks, _, _ = pipeline._process(html, None)
+    assert text == f"{first}\n\n{second}"
+    assert chunks[0].text == first  # closed at the paragraph break instead of running on
+    assert "board" not in chunks[0].text and chunks[-1].text.endswith(second)
+
+
+def _ingest_in_child(urls, out):
+    try:
+        stats = {}
+        _, metas, _ = pipeline.run_ingest(urls, stats=stats)
+        out.put((stats["pool"], len(metas)))
+    finally:
+        pipeline.shutdown_pool()
+
+
+def test_pool_starts_inside_daemonic_worker(urls, monkeypatch):
+    # Celery's prefork pool runs tasks in daemonic children
+    monkeypatch.setattr(pipeline, "INGEST_PROCESSES", 2)
+    pipeline._reset_after_fork()
+    ctx = mp.get_context("fork")
+    out = ctx.Queue()
+    child = ctx.Process(target=_ingest_in_child, args=(urls, out), daemon=True)
+    child.start()
+    pool, n = out.get(timeout=60)
+    child.join(10)
+    assert pool == "process:2" and n > len(urls)
@@ -0,0 +1,53 @@
+from newsrag_retrieval import metastore
+from newsrag_retrieval.metastore import MetaList
+
+
+METAS = [
+    {"url": "https://a.example/1", "chunk": 0, "text": "first chunk", "title": "A"},
+    {"url": "https://a.example/1", "chunk": 1, "text": "zweiter Abschnitt – ünïcode"},
+    {"url": "https://b.example/2", "chunk": 0, "text": "", "lang": "en"},
+]
+
+
+def test_round_trip_through_files(tmp_path):
+    metastore.write_dir(str(tmp_path), METAS)
+    table = metastore.read_dir(str(tmp_path))
+    assert len(table) == 3
+    assert table[0] == METAS[0]
+    assert table[1] == dict(METAS[1], title="A")  # title is stored per url
+    assert table[2] == METAS[2]
+    assert table.url(2) == "https://b.example/2" and table.text(1) == METAS[1]["text"]
+
+
+def test_meta_list_spans_tables_and_plain_lists():
+    blobs = metastore.encode(METAS)
+    table = metastore.decode(blobs.__getitem__)
+    metas = MetaList([table, [{"url": "u", "chunk": 0, "text": "x"}], table])
+    assert len(metas) == 7
+    assert metas[3]["url"] == "u" and metas.text(3) == "x"
+    assert metas[-1] == table[2] and metas.url(4) == table.url(0)
+
+
+def test_overlapping_chunks_share_heap_bytes():
+    page = "Première phrase. Second sentence here. Third one – ünïcode. Fourth and last."
+    spans = [(0, 38), (17, 59), (39, 76)]  # each chunk repeats the previous one's last sentence
+    metas = [{"url": "u", "chunk": i, "text": page[a:b], "start": a, "end": b} for i, (a, b) in enumerate(spans)]
+    metas.append({"url": "v", "chunk": 0, "text": "no offsets"})
+    blobs = metastore.encode(metas)
+    assert len(blobs["text.bin"]) == len(page.encode("utf-8")) + len("no offsets")
+    table = metastore.decode(blobs.__getitem__)
+    assert [table[i] for i in range(4)] == metas
+
+
+def test_reads_format_1_segments():
+    import io
+    import json
+
+    import numpy as np
+    cols = io.BytesIO()
+    np.savez(cols, url_idx=np.array([0, 0], "int32"), chunk=np.array([0, 1], "int32"),
+             text_off=np.array([0, 3, 6], "int64"))
+    blobs = {"meta.json": json.dumps({"format": 1, "rows": 2, "urls": ["u"], "titles": [None], "extras": {}}),
+             "meta.npz": cols.getvalue(), "text.bin": b"abcdef"}
+    table = metastore.decode(blobs.__getitem__)
+    assert table[1] == {"url": "u", "chunk": 1, "text": "def"}
@@ -0,0 +1,114 @@
+import random
+
+import numpy as np
+import pytest
+
+from newsrag_retrieval import neardup, pipeline, storage
+from newsrag_retrieval.neardup import NearDupIndex, simhash
+
+random.seed(0)
+_VOCAB = [f"w{i}" for i in range(5000)]
+SENTENCES = [" ".join(random.choice(_VOCAB) for _ in range(20)) + "." for _ in range(40)]
+
+
+def _story(i, shift=0, n=12):
+    return " ".join(SENTENCES[i * 12 + shift:i * 12 + shift + n])
+
+
+@pytest.fixture
+def ragdb(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "fs")
+    monkeypatch.setattr(storage, "RAGDB_ROOT", str(tmp_path))
+    neardup._indexes.clear()
+    return tmp_path
+
+
+def test_simhash_separates_copies_from_other_text():
+    a = _story(0)
+    assert bin(simhash(a) ^ simhash(a.upper() + " Reporting by Wire.")).count("1") <= neardup.DEDUP_MAX_HAMMING
+    assert bin(simhash(a) ^ simhash(_story(0, shift=1))).count("1") <= neardup.DEDUP_MAX_HAMMING
+    assert bin(simhash(a) ^ simhash(_story(1))).count("1") > 16
+    assert simhash("too short to hash") == 0
+
+
+def test_index_finds_block_rows_and_batch_entries():
+    index = NearDupIndex()
+    index.add_block("seg-a", neardup.simhashes([_story(0), "short", _story(1)]))
+    assert index.find(simhash(_story(1, shift=1))) == ("seg-a", 2)
+    assert index.find(simhash(_story(2))) is None and index.find(0) is None
+
+    view = index.batch()
+    meta = {"url": "u"}
+    view.add(simhash(_story(2)), meta)
+    assert view.find(simhash(_story(2) + " Extra line.")) is meta
+    assert index.find(simhash(_story(2))) is None  # batch entries don't leak into the shared index
+    assert len(index) == 2 and len(view) == 3
+
+
+def test_segments_persist_hashes_and_corpus_index_grows(ragdb):
+    metas = [{"url": "a", "chunk": 0, "text": _story(0)}, {"url": "a", "chunk": 1, "text": "tiny"}]
+    storage.append("c", np.ones((2, 4), "float32"), metas, {"dim": 4})
+    seg = storage.load_manifest("c")["segments"][0]["id"]
+    assert (ragdb / "c" / "segments" / seg / neardup.SIMHASH_FILE).exists()
+    np.testing.assert_array_equal(storage.load_simhashes("c", seg), neardup.simhashes([_story(0), "tiny"]))
+
+    index = neardup.corpus_index("c")
+    assert index.find(simhash(_story(0, shift=1))) == (seg, 0)
+    storage.append("c", np.ones((1, 4), "float32"), [{"url": "b", "chunk": 0, "text": _story(1)}], {"dim": 4})
+    index = neardup.corpus_index("c")
+    ref = index.find(simhash(_story(1)))
+    assert ref is not None and neardup.resolve("c", [ref]) == [("b", 0)]
+
+
+def test_pipeline_drops_near_copies_and_records_alias(monkeypatch):
+    from newsrag_core.fetcher import Fetched, Page
+
+    # short enough to be one chunk each
+    pages = {"https://wire/1": _story(0, n=8), "https://outlet/1": "By Staff. " + _story(0, n=8),
+             "https://outlet/2": _story(1, n=8)}
+    monkeypatch.setattr(pipeline, "fetch_raw", lambda urls: (Fetched(u, None, None) for u in urls))
+    monkeypatch.setattr(pipeline, "finish_page", lambda item, text=None: Page(item.url, pages[item.url], item.url, False))
+    monkeypatch.setattr(pipeline, "embed_texts", lambda texts, dimensions=None: [[1.0]] * len(texts))
+
+    index = NearDupIndex()
+    index.add_block("seg-old", neardup.simhashes([_story(1, n=8)]))
+    aliases, stats = [], {}
+    _, metas, _ = pipeline.run_ingest(list(pages), stats=stats, inline=True, dedup=index.batch(), aliases=aliases)
+
+    assert [m["url"] for m in metas] == ["https://wire/1"]
+    assert metas[0]["alt_urls"] == ["https://outlet/1"]
+    assert metas[0][neardup.SIMHASH_KEY] == simhash(metas[0]["text"])  # handed on to the segment writer
+    assert aliases == [("https://outlet/2", ("seg-old", 0))]
+    assert stats["dedup"] == {"dropped": 2, "kept": 1}
+
+
+def test_ingest_hashes_are_persisted_without_rehashing(ragdb, monkeypatch):
+    metas = [{"url": "a", "chunk": i, "text": _story(i), neardup.SIMHASH_KEY: 1000 + i} for i in range(2)]
+
+    def no_rehash(texts):
+        raise AssertionError("hashes should come from the metas")
+
+    monkeypatch.setattr(neardup, "simhashes", no_rehash)
+    storage.append("c", np.ones((2, 4), "float32"), metas, {"dim": 4})
+    seg = storage.load_manifest("c")["segments"][0]["id"]
+    assert storage.load_simhashes("c", seg).tolist() == [1000, 1001]
+    assert neardup.SIMHASH_KEY not in storage.load_metas("c", seg)[0]  # not duplicated into meta extras
+
+    storage.append("c", np.ones((1, 4), "float32"), [dict(metas[0], chunk=2, simhash=1002)], {"dim": 4})
+    merged = storage.compact("c")["segments"][0]["id"]
+    assert storage.load_simhashes("c", merged).tolist() == [1000, 1001, 1002]
+
+
+def test_resolve_reads_metas_only_and_indexes_are_bounded(ragdb, monkeypatch):
+    for corpus in ("c", "d"):
+        storage.append(corpus, np.ones((1, 4), "float32"), [{"url": corpus, "chunk": 0, "text": _story(0)}], {"dim": 4})
+    monkeypatch.setattr(neardup, "DEDUP_MAX_CORPORA", 1)
+
+    def no_vectors(*a, **kw):
+        raise AssertionError("resolve() should not load vectors")
+
+    monkeypatch.setattr(storage, "load_segment", no_vectors)
+    ref = neardup.corpus_index("c").find(simhash(_story(0)))
+    assert neardup.resolve("c", [ref]) == [("c", 0)]
+    neardup.corpus_index("d")
+    assert list(neardup._indexes) == ["d"]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from newsrag_retrieval import quantize, storage
+from newsrag_retrieval.corpus_cache import CorpusCache
+from newsrag_retrieval.vector_faiss import FaissStore
+
+
+@pytest.fixture
+def ragdb(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "fs")
+    monkeypatch.setattr(storage, "RAGDB_ROOT", str(tmp_path))
+    monkeypatch.setattr(storage, "MMAP", False)
+    return tmp_path
+
+
+def _unit(n, dim=32, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _metas(n, seed=0):
+    return [{"url": f"https://example.com/{seed}", "chunk": i, "text": f"chunk {i}"} for i in range(n)]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_compact_block_decodes_in_chunks_what_was_stored(dtype, monkeypatch):
+    monkeypatch.setattr(quantize, "DECODE_CHUNK_MB", 32 * 4 * 64 / 2**20)  # 64 rows per chunk
+    vecs = _unit(200)
+    stored, scale = quantize.encode(vecs, dtype)
+    block = quantize.CompactBlock(stored, scale)
+    chunks = list(block.chunks(10))
+    assert [a for a, _ in chunks] == [10, 74, 138] and block.codes is stored
+    np.testing.assert_array_equal(np.vstack([rows for _, rows in chunks]), quantize.decode(stored, scale)[10:])
+    np.testing.assert_allclose(quantize.decode(stored, scale), vecs, atol=2 * (scale or 1e-3))
+
+    store = FaissStore(32)
+    store.attach(stored, _metas(200), scale=scale)
+    _, idx = store.search(vecs[[0, 63, 64, 199]], 1)
+    assert idx[:, 0].tolist() == [0, 63, 64, 199]
+
+
+def test_int8_segments_record_their_scale_and_load_as_float32(ragdb):
+    v1, v2 = _unit(10, seed=1), 0.5 * _unit(6, seed=2)
+    base = {"embed_model": "m", "dim": 32, "vector_dtype": "int8"}
+    storage.append("c", v1, _metas(10), base)
+    manifest = storage.append("c", v2, _metas(6, seed=2), base)
+
+    s1, s2 = manifest["segments"]
+    assert s1["dtype"] == s2["dtype"] == "int8" and s2["scale"] < s1["scale"]
+    raw, _ = storage.load_segment("c", s1["id"])
+    assert raw.dtype == np.int8
+    vecs, metas, _ = storage.load("c")
+    assert vecs.dtype == np.float32 and len(metas) == 16
+    np.testing.assert_allclose(vecs, np.vstack([v1, v2]), atol=s1["scale"])
+
+    merged = storage.compact("c")
+    (seg,) = merged["segments"]
+    assert seg["dtype"] == "int8" and seg["rows"] == 16
+    np.testing.assert_allclose(storage.load("c")[0], np.vstack([v1, v2]), atol=2 * s1["scale"])
+
+
+def test_resident_store_searches_codes_without_float32_copy(ragdb):
+    vecs = _unit(500, seed=3)
+    storage.append("c", vecs, _metas(500), {"embed_model": "m", "dim": 32, "vector_dtype": "int8"})
+    store, _ = CorpusCache().get("c")
+
+    assert all(isinstance(b, quantize.CompactBlock) for b in store._blocks)
+    assert store.nbytes() - store.metas.nbytes - store.bm25.nbytes == 500 * 32
+    _, idx = store.search(vecs[:50], 1)
+    assert idx[:, 0].tolist() == list(range(50))
+
+    exact = FaissStore.from_numpy(vecs, _metas(500), 32)
+    rebuilt = store.to_numpy()[0]
+    assert rebuilt.dtype == np.float32 and rebuilt.shape == (500, 32)
+    assert exact.search(rebuilt[:5], 1)[1][:, 0].tolist() == list(range(5))
+
+
+def test_float16_byte_accounting(ragdb, monkeypatch):
+    vecs = _unit(300, seed=4)
+    storage.append("c", vecs, _metas(300), {"embed_model": "m", "dim": 32, "vector_dtype": "float16"})
+    store, _ = CorpusCache().get("c")
+    assert store.nbytes() - store.metas.nbytes - store.bm25.nbytes == 300 * 32 * 2  # codes only
+
+    monkeypatch.setattr(storage, "MMAP", True)
+    shared, _ = CorpusCache().get("c")
+    assert isinstance(shared._blocks[0].codes, np.memmap)  # codes stay mapped, not copied
+    assert shared.nbytes() == shared.metas.nbytes + shared.bm25.nbytes
+    _, idx = shared.search(vecs[:20], 1)
+    assert idx[:, 0].tolist() == list(range(20))
@@ -0,0 +1,190 @@
+import json, os, pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from newsrag_retrieval import storage
+
+
+@pytest.fixture
+def ragdb(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", "fs")
+    monkeypatch.setattr(storage, "RAGDB_ROOT", str(tmp_path))
+    return tmp_path
+
+
+def _batch(n, dim=4, url="https://example.com/a"):
+    vecs = np.random.default_rng(n).random((n, dim), dtype="float32")
+    return vecs, [{"url": url, "chunk": i, "text": f"chunk {i}"} for i in range(n)]
+
+
+def test_append_grows_corpus_without_rewriting_segments(ragdb):
+    v1, m1 = _batch(3)
+    man1 = storage.append("c", v1, m1, {"embed_model": "m", "dim": 4})
+    seg1 = os.path.join(ragdb, "c", "segments", man1["segments"][0]["id"], "vectors.npy")
+    mtime = os.stat(seg1).st_mtime_ns
+
+    v2, m2 = _batch(2, url="https://example.com/b")
+    man2 = storage.append("c", v2, m2, {"embed_model": "m", "dim": 4})
+
+    assert man2["doc_count"] == 5 and man2["version"] == man1["version"] + 1
+    assert [s["seq"] for s in man2["segments"]] == [0, 1]
+    assert os.stat(seg1).st_mtime_ns == mtime
+
+    vecs, metas, manifest = storage.load("c")
+    np.testing.assert_allclose(vecs, np.vstack([v1, v2]))
+    assert [m["url"] for m in metas] == [m["url"] for m in m1 + m2]
+    assert manifest == man2
+
+
+def test_concurrent_appends_are_all_published(ragdb):
+    def ingest(i):
+        v, m = _batch(2, url=f"https://example.com/{i}")
+        storage.append("c", v, m, {"embed_model": "m", "dim": 4})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(ingest, range(16)))
+
+    manifest = storage.load_manifest("c")
+    assert manifest["doc_count"] == 32
+    assert sorted(s["seq"] for s in manifest["segments"]) == list(range(16))
+
+
+def test_save_replaces_segments(ragdb):
+    storage.append("c", *_batch(3), {"embed_model": "m", "dim": 4})
+    v, m = _batch(1)
+    manifest = storage.save("c", v, m, {"embed_model": "m", "dim": 4})
+    assert manifest["doc_count"] == 1 and len(manifest["segments"]) == 1
+    assert storage.load("c")[0].shape == (1, 4)
+
+
+def test_dim_mismatch_is_rejected(ragdb):
+    storage.append("c", *_batch(2), {"embed_model": "m", "dim": 4})
+    with pytest.raises(ValueError):
+        storage.append("c", *_batch(2, dim=8), {"embed_model": "m", "dim": 8})
+
+
+def test_legacy_corpus_loads_and_accepts_segments(ragdb):
+    d = os.path.join(ragdb, "old")
+    os.makedirs(d)
+    v, m = _batch(2)
+    np.save(os.path.join(d, "vectors.npy"), v)
+    with open(os.path.join(d, "meta.pkl"), "wb") as f:
+        pickle.dump(m, f)
+    with open(os.path.join(d, "manifest.json"), "w") as f:
+        json.dump({"embed_model": "m", "dim": 4, "doc_count": 2}, f)
+
+    assert storage.load("old")[0].shape == (2, 4)
+    manifest = storage.append("old", *_batch(3), {"embed_model": "m", "dim": 4})
+    assert manifest["doc_count"] == 5
+    assert storage.load("old")[0].shape == (5, 4)
+
+
+def test_compact_merges_segments_and_keeps_concurrent_appends(ragdb, monkeypatch):
+    for i in range(3):
+        storage.append("c", *_batch(2, url=f"https://example.com/{i}"), {"embed_model": "m", "dim": 4})
+    before, metas_before, _ = storage.load("c")
+
+    real_write = storage._fs_write_segment
+
+    def write_then_race(corpus_id, vecs, metas, dtype=None, hashes=None):
+        entry = real_write(corpus_id, vecs, metas, dtype, hashes)
+        monkeypatch.setattr(storage, "_fs_write_segment", real_write)
+        storage.append("c", *_batch(1, url="https://example.com/late"), {"embed_model": "m", "dim": 4})
+        return entry
+
+    monkeypatch.setattr(storage, "_fs_write_segment", write_then_race)
+    manifest = storage.compact("c", {"index": {"type": "hnsw"}})
+
+    assert len(manifest["segments"]) == 2 and manifest["doc_count"] == 7
+    assert manifest["index"] == {"type": "hnsw"}
+    vecs, metas, _ = storage.load("c")
+    np.testing.assert_allclose(vecs[:6], before)
+    assert metas[6]["url"] == "https://example.com/late"
+    assert [m["url"] for m in metas][:6] == [m["url"] for m in metas_before]
+
+
+def test_compaction_retires_replaced_segments_and_sweeps_them(ragdb, monkeypatch):
+    for n in (2, 3):
+        storage.append("c", *_batch(n), {"embed_model": "m", "dim": 4})
+    old = [s["id"] for s in storage.load_manifest("c")["segments"]]
+    seg_dir = lambda sid: storage._fs_segment_dir("c", sid)
+
+    manifest = storage.compact("c")
+    assert [r["id"] for r in manifest["retired"]] == old
+    assert all(os.path.isdir(seg_dir(sid)) for sid in old)  # still within the grace period
+
+    monkeypatch.setattr(storage, "RETIRE_GRACE_SEC", 0)
+    storage.append("c", *_batch(1), {"embed_model": "m", "dim": 4})
+    manifest = storage.compact("c")
+    live = [s["id"] for s in manifest["segments"]]
+    assert not any(os.path.exists(seg_dir(sid)) for sid in old)
+    assert storage.load_manifest("c")["retired"] == []
+    assert sorted(os.listdir(os.path.join(ragdb, "c", "segments"))) == live
+    assert storage.load("c")[0].shape == (6, 4)
+
+
+def test_losing_compaction_deletes_its_segment(ragdb, monkeypatch):
+    storage.append("c", *_batch(2), {"embed_model": "m", "dim": 4})
+    storage.append("c", *_batch(3), {"embed_model": "m", "dim": 4})
+    real_write = storage._fs_write_segment
+
+    def write_then_lose(corpus_id, vecs, metas, dtype=None, hashes=None):
+        entry = real_write(corpus_id, vecs, metas, dtype, hashes)
+        monkeypatch.setattr(storage, "_fs_write_segment", real_write)
+        storage.compact("c")  # a concurrent compaction publishes first
+        return entry
+
+    monkeypatch.setattr(storage, "_fs_write_segment", write_then_lose)
+    assert storage.compact("c") is None
+    live = [s["id"] for s in storage.load_manifest("c")["segments"]]
+    retired = [r["id"] for r in storage.load_manifest("c")["retired"]]
+    assert sorted(os.listdir(os.path.join(ragdb, "c", "segments"))) == sorted(live + retired)
+
+
+def test_compacting_a_legacy_corpus_keeps_the_corpus_dir(ragdb, monkeypatch):
+    monkeypatch.setattr(storage, "RETIRE_GRACE_SEC", 0)
+    d = os.path.join(ragdb, "old")
+    os.makedirs(d)
+    v, m = _batch(2)
+    np.save(os.path.join(d, "vectors.npy"), v)
+    with open(os.path.join(d, "meta.pkl"), "wb") as f:
+        pickle.dump(m, f)
+    with open(os.path.join(d, "manifest.json"), "w") as f:
+        json.dump({"embed_model": "m", "dim": 4, "doc_count": 2}, f)
+
+    storage.compact("old")
+    assert not os.path.exists(os.path.join(d, "vectors.npy")) and not os.path.exists(os.path.join(d, "meta.pkl"))
+    assert storage.load("old")[0].shape == (2, 4)
+
+
+def test_replaced_and_stale_index_files_are_removed(ragdb, monkeypatch):
+    from newsrag_retrieval import ann
+
+    storage.append("c", *_batch(50), {"embed_model": "m", "dim": 4, "index": {"type": "hnsw"}})
+    manifest = storage.load_manifest("c")
+    seg_ids = [s["id"] for s in manifest["segments"]]
+    index = ann.build_index(storage.load("c")[0], ann.resolve_spec({"type": "hnsw"}))
+    index_dir = os.path.join(ragdb, "c", "indexes")
+
+    first = storage.save_index("c", index, seg_ids, manifest["index"])["index_file"]["name"]
+    second = storage.save_index("c", index, seg_ids, manifest["index"])  # e.g. a concurrent trainer
+    assert {"id": first, "kind": "index"}.items() <= second["retired"][0].items()
+    assert sorted(os.listdir(index_dir)) == sorted([first, second["index_file"]["name"]])  # within the grace period
+
+    assert storage.save_index("c", index, ["gone"], manifest["index"]) is None  # stale: not published
+    assert len(os.listdir(index_dir)) == 2
+
+    monkeypatch.setattr(storage, "RETIRE_GRACE_SEC", 0)
+    storage.compact("c")  # drops the current index file too
+    assert os.listdir(index_dir) == [] and storage.load_manifest("c")["retired"] == []
+
+
+def test_failed_append_leaves_no_orphan_segment(ragdb):
+    storage.append("c", *_batch(2), {"embed_model": "m", "dim": 4})
+    live = [s["id"] for s in storage.load_manifest("c")["segments"]]
+    with pytest.raises(ValueError):
+        storage.append("c", *_batch(2, dim=8), {"embed_model": "m", "dim": 8})
+    assert os.listdir(os.path.join(ragdb, "c", "segments")) == live
+    assert storage.load("c")[0].shape == (2, 4)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from newsrag_tasks import tasks
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    queued = []
+    manifest = {"dim": 4, "doc_count": 1, "version": 1, "segments": [{"id": str(i)} for i in range(5)]}
+    monkeypatch.setattr(tasks, "COMPACT_MAX_SEGMENTS", 2)
+    monkeypatch.setattr(tasks, "DEDUP_ENABLE", False)
+    monkeypatch.setattr(tasks, "load_manifest", lambda corpus_id: manifest)
+    monkeypatch.setattr(tasks, "ingest_urls_sync", lambda urls, **kw: (
+        np.ones((1, 4), dtype="float32"), [{"url": urls[0], "chunk": 0, "text": "t"}], []))
+    monkeypatch.setattr(tasks, "storage_append", lambda corpus_id, vecs, metas, base: manifest)
+    monkeypatch.setattr(tasks, "storage_compact", lambda corpus_id, overrides=None: None)
+    monkeypatch.setattr(tasks.compact_corpus_task, "delay", lambda corpus_id: queued.append(corpus_id))
+    monkeypatch.setattr(tasks, "train_index", lambda corpus_id, manifest=None: None)
+    tasks._local_compactions.clear()
+    return queued
+
+
+@pytest.mark.parametrize("redis", [FakeRedis(), None])
+def test_ingests_over_the_segment_limit_queue_one_compaction(ingest, monkeypatch, redis):
+    monkeypatch.setattr(tasks, "get_redis", lambda: redis)
+    for i in range(4):
+        tasks.ingest_urls_task.run("c", [f"https://example.com/{i}"])
+    assert ingest == ["c"]
+
+    tasks.compact_corpus_task.run("c")  # releases the lease once it has run
+    tasks.ingest_urls_task.run("c", ["https://example.com/next"])
+    assert ingest == ["c", "c"]
+
+
+def test_ingest_and_compaction_train_the_index(ingest, monkeypatch):
+    monkeypatch.setattr(tasks, "get_redis", lambda: None)
+    trained = []
+
+    def train_index(corpus_id, manifest=None):
+        trained.append((corpus_id, corpus_id in tasks._local_compactions))  # under the compaction lease?
+        return dict(manifest or {}, index_file={"rows": 1})
+
+    monkeypatch.setattr(tasks, "train_index", train_index)
+    monkeypatch.setattr(tasks, "storage_compact", lambda corpus_id, overrides=None: {"doc_count": 1, "version": 2})
+    monkeypatch.setattr(tasks, "COMPACT_MAX_SEGMENTS", 64)
+    tasks.ingest_urls_task.run("c", ["https://example.com/0"])  # no index yet: trained on ingest
+    assert trained == [("c", True)] and tasks._claim_compaction("c")  # released afterwards
+
+    assert tasks.compact_corpus_task.run("c")["index_rows"] == 1  # lease taken by whoever queued it
+    assert trained == [("c", True), ("c", True)] and "c" not in tasks._local_compactions
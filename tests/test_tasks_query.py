@@ -0,0 +1,39 @@
+import numpy as np
+
+from newsrag_tasks import tasks
+from newsrag_retrieval.vector_faiss import FaissStore
+
+TEXTS = ["bank raises rates", "football record crowd", "heat wave record", "bank earnings beat"]
+
+
+def test_batch_answers_use_one_embed_call_and_one_search(monkeypatch):
+    dim = len(TEXTS)
+    store = FaissStore.from_numpy(np.eye(dim, dtype="float32"),
+                                  [{"url": f"https://example.com/{i}", "chunk": 0, "text": t} for i, t in enumerate(TEXTS)],
+                                  dim)
+    calls = {"embed": 0, "search": 0}
+
+    def fake_embed(texts, dimensions=None):
+        calls["embed"] += 1
+        return np.eye(dim, dtype="float32")[[0 if "bank" in t else 2 for t in texts]]
+
+    real_search = store.search
+
+    def counting_search(q, k, **kw):
+        calls["search"] += 1
+        assert q.shape == (2, dim)
+        return real_search(q, k, **kw)
+
+    monkeypatch.setattr(store, "search", counting_search)
+    monkeypatch.setattr(tasks, "embed_queries", fake_embed)
+    monkeypatch.setattr(tasks, "get_store", lambda corpus_id: (store, {"version": 3}))
+    monkeypatch.setattr(tasks, "synthesize", lambda q, ctx: {"tldr": q, "bullets": [ctx.split("\n")[0]]})
+    monkeypatch.setattr(tasks.answer_questions_task, "update_state", lambda **kw: None)
+
+    out = tasks.answer_questions_task.run("c", ["bank news?", "heat record?"], k=2, max_per_url=1)
+
+    assert calls == {"embed": 1, "search": 1}
+    assert [a["question"] for a in out["answers"]] == ["bank news?", "heat record?"]
+    assert out["answers"][0]["sources"][0]["url"] == "https://example.com/0"
+    assert out["answers"][1]["sources"][0]["url"] == "https://example.com/2"
+    assert out["answers"][0]["tldr"] == "bank news?" and out["version"] == 3
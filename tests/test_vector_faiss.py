@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from newsrag_retrieval.vector_faiss import FaissStore, VectorBuffer
+
+
+def _unit(n, dim, seed=0):
+    v = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def test_vector_buffer_grows_and_views_are_read_only():
+    buf = VectorBuffer(4)
+    rows = [np.full((3, 4), i, dtype="float32") for i in range(700)]
+    for r in rows:
+        buf.append(r)
+    assert len(buf) == 2100 and buf.capacity >= 2100
+    view = buf.view()
+    np.testing.assert_array_equal(view, np.vstack(rows))
+    with pytest.raises(ValueError):
+        view[0, 0] = 1.0
+
+
+def test_attach_seals_the_tail_without_spare_capacity():
+    vecs = _unit(30, 8, seed=2)
+    store = FaissStore(8)
+    store.add(vecs[:10], [{"i": i} for i in range(10)])
+    assert store._buffer.capacity > 10
+    store.attach(vecs[10:], [{"i": i} for i in range(10, 30)])
+
+    sealed = store._blocks[0]
+    assert sealed.shape == (10, 8) and sealed.base is None and not sealed.flags.writeable
+    assert store.nbytes() == 30 * 8 * 4 + store.metas.nbytes
+    np.testing.assert_array_equal(store.to_numpy()[0], vecs)
+
+
+def test_store_add_search_and_round_trip():
+    vecs = _unit(50, 8)
+    store = FaissStore(8)
+    store.add(vecs[:20], [{"i": i} for i in range(20)])
+    store.add(vecs[20:], [{"i": i} for i in range(20, 50)])
+
+    matrix, metas = store.to_numpy()
+    np.testing.assert_array_equal(matrix, vecs)
+    rebuilt = FaissStore.from_numpy(matrix, metas, 8)
+    _, idx = rebuilt.search(vecs[[3, 42]], 1)
+    assert idx[:, 0].tolist() == [3, 42]
+    assert rebuilt.metas[42] == {"i": 42}
+
+
+def test_search_merges_attached_blocks_and_added_rows():
+    vecs = _unit(30, 8, seed=1)
+    store = FaissStore(8)
+    store.attach(vecs[:10], [{"i": i} for i in range(10)])
+    store.add(vecs[10:20], [{"i": i} for i in range(10, 20)])
+    store.attach(vecs[20:], [{"i": i} for i in range(20, 30)])
+
+    scores, idx = store.search(vecs, 3)
+    assert idx[:, 0].tolist() == list(range(30))
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    np.testing.assert_array_equal(store.to_numpy()[0], vecs)